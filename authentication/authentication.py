@@ -0,0 +1,245 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+User = get_user_model()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed signature and claim checks, keyed by a hash of the raw token.
+
+    Entries are dropped at the token's ``exp``, so a cached token is never
+    accepted after it would have failed verification.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(max_entries=getattr(settings, 'JWT_VERIFIED_TOKEN_CACHE_SIZE', 10_000))
+
+    @staticmethod
+    def key(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token):
+        key = self.key(raw_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, raw_token, validated_token):
+        if self.max_entries <= 0:
+            return
+        key = self.key(raw_token)
+        with self._lock:
+            self._entries[key] = (validated_token, validated_token['exp'])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), max_entries=self.max_entries)
+
+
+class TokenBlacklist:
+    """
+    In-memory set of blacklisted token ids (``jti``), kept in step with BlacklistedToken.
+
+    Rows added since the last load are read at most every ``refresh_seconds``,
+    so checking a token costs a set lookup. Tokens revoked through this
+    process are added at once; other workers pick them up at their next
+    refresh. Ids of expired tokens are dropped, since those tokens fail
+    verification anyway.
+    """
+
+    overlap = timedelta(seconds=60)
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._revoked = {}  # jti -> expiry timestamp
+        self._loaded_at = None
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(refresh_seconds=getattr(settings, 'JWT_BLACKLIST_REFRESH_SECONDS', 30))
+
+    def is_revoked(self, jti):
+        if time.monotonic() >= self._next_refresh:
+            with self._lock:
+                # Another thread may have refreshed while this one waited
+                if time.monotonic() >= self._next_refresh:
+                    self._load()
+        return jti in self._revoked
+
+    def refresh(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        if self._loaded_at is not None:
+            # The overlap catches rows from transactions that committed after the previous load
+            rows = rows.filter(blacklisted_at__gte=self._loaded_at - self.overlap)
+        for jti, expires_at in rows.values_list('token__jti', 'token__expires_at'):
+            self._revoked[jti] = expires_at.timestamp()
+        self._loaded_at = now
+        current = now.timestamp()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > current}
+        self._next_refresh = time.monotonic() + self.refresh_seconds
+
+    def revoke(self, token):
+        """Blacklist a validated token (access or refresh) in the database and in this process"""
+        jti, exp = token[jwt_settings.JTI_CLAIM], token['exp']
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                'user_id': token.get(jwt_settings.USER_ID_CLAIM),
+                'token': str(token),
+                'expires_at': datetime_from_epoch(exp),
+            },
+        )
+        BlacklistedToken.objects.get_or_create(token=outstanding)
+        with self._lock:
+            self._revoked[jti] = exp
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._loaded_at = None
+            self._next_refresh = 0.0
+
+    def stats(self):
+        return {'revoked': len(self._revoked), 'refresh_seconds': self.refresh_seconds}
+
+
+class ActiveUserCache:
+    """
+    Per-process cache of each user's ``is_active`` flag.
+
+    A flag is re-read from the database once it is ``ttl`` seconds old, so
+    deactivating a user locks out their tokens within ``ttl`` seconds on
+    every worker.
+    """
+
+    def __init__(self, ttl=30, max_entries=10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(ttl=getattr(settings, 'JWT_ACTIVE_CHECK_TTL', 30))
+
+    def is_active(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._counters['hits'] += 1
+                return entry[0]
+            self._counters['misses'] += 1
+
+        # A deleted user counts as inactive
+        active = User.objects.filter(pk=user_id).values_list('is_active', flat=True).first() or False
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {key: value for key, value in self._entries.items() if value[1] > now}
+            self._entries[user_id] = (active, now + self.ttl)
+        return active
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, users=len(self._entries), ttl=self.ttl)
+
+
+verified_tokens = VerifiedTokenCache.from_settings()
+token_blacklist = TokenBlacklist.from_settings()
+active_users = ActiveUserCache.from_settings()
+
+
+class CachedTokenMixin:
+    """Skips decoding and verifying tokens seen before, and rejects blacklisted ones"""
+
+    def get_validated_token(self, raw_token):
+        validated_token = verified_tokens.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            verified_tokens.set(raw_token, validated_token)
+        if token_blacklist.is_revoked(validated_token.get(jwt_settings.JTI_CLAIM)):
+            raise InvalidToken(_('Token is blacklisted'))
+        return validated_token
+
+
+class CachedJWTAuthentication(CachedTokenMixin, JWTAuthentication):
+    """simplejwt's JWTAuthentication with the verified-token cache and blacklist check"""
+
+
+# For views that read fields or permissions of the User row, whichever default authentication is configured
+MODEL_USER_AUTHENTICATION = [CachedJWTAuthentication]
+
+
+class StatelessJWTAuthentication(CachedTokenMixin, JWTStatelessUserAuthentication):
+    """
+    Authenticates access tokens without loading the User row.
+
+    ``request.user`` is a simplejwt TokenUser built from the token's claims
+    (``id``, ``username``, ``email``, ``first_name``, ``last_name``), so views
+    must filter on ``user_id=request.user.id`` rather than pass the user to
+    the ORM. Views that need the model instance (profile, admin checks)
+    declare ``MODEL_USER_AUTHENTICATION``. Enabled with
+    ``JWT_STATELESS_AUTH=True``.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not active_users.is_active(user.id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -1,15 +1,25 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import StatelessJWTAuthentication, active_users, token_blacklist, verified_tokens
+from .serializers import CustomTokenObtainPairSerializer
 
 User = get_user_model()
 
 
 class AuthenticationAPITest(APITestCase):
     def setUp(self):
+        cache.clear()  # throttle counters
         self.user_data = {
             'username': 'testuser',
             'email': 'test@example.com',
@@ -216,3 +226,116 @@ class AuthenticationAPITest(APITestCase):
         url = reverse('admin_only_view')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK,
+                                       DEFAULT_THROTTLE_RATES={'token_obtain_pair': '2/min'}))
+class LoginThrottleTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='existinguser', email='existing@example.com', password='existingpass123')
+
+    def test_login_attempts_limited_per_ip(self):
+        url = reverse('token_obtain_pair')
+        responses = [
+            self.client.post(url, {'username': 'existinguser', 'password': password}, format='json')
+            for password in ['wrong-1', 'wrong-2', 'existingpass123']
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [
+            status.HTTP_401_UNAUTHORIZED, status.HTTP_401_UNAUTHORIZED, status.HTTP_429_TOO_MANY_REQUESTS
+        ])
+        self.assertIn('Retry-After', responses[-1])
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='existinguser', email='existing@example.com',
+                                             password='existingpass123', first_name='Existing')
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.request = RequestFactory().get('/api/weather/history/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        active_users.clear()
+
+    def test_user_built_from_claims_without_queries(self):
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(self.request)
+
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(user.username, 'existinguser')
+        self.assertEqual(user.email, 'existing@example.com')
+        self.assertEqual(user.first_name, 'Existing')
+        self.assertTrue(user.is_authenticated)
+
+    def test_deactivated_user_rejected_once_cached_flag_expires(self):
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(self.request)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        # Still cached
+        authentication.authenticate(self.request)
+
+        active_users.invalidate(self.user.pk)
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(self.request)
+
+
+class TokenRevocationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        verified_tokens.clear()
+        token_blacklist.clear()
+        active_users.clear()
+        self.user = User.objects.create_user(username='existinguser', email='existing@example.com',
+                                             password='existingpass123')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('logout'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(reverse('profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        refreshed = self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(refreshed.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_rejects_another_users_refresh_token(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='otherpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        response = self.client.post(reverse('logout'), {'refresh': str(RefreshToken.for_user(other))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_repeated_requests_skip_verification_and_queries(self):
+        request = RequestFactory().get('/api/weather/history/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(request)
+        with self.assertNumQueries(0), \
+                patch('rest_framework_simplejwt.tokens.AccessToken.__init__') as verify:
+            user, _ = authentication.authenticate(request)
+
+        verify.assert_not_called()
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(verified_tokens.stats()['hits'], 1)
+
+    def test_blacklist_from_other_workers_applies_after_refresh(self):
+        request = RequestFactory().get('/api/weather/history/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        authentication = StatelessJWTAuthentication()
+        authentication.authenticate(request)
+        # Revoked in the database only, as another worker's logout would
+        outstanding = OutstandingToken.objects.create(jti=self.access['jti'], token=str(self.access),
+                                                      expires_at=timezone.now() + timedelta(hours=1))
+        BlacklistedToken.objects.create(token=outstanding)
+        authentication.authenticate(request)
+
+        token_blacklist.refresh()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(request)
+
+    def test_cached_tokens_expire_with_the_token(self):
+        self.access.set_exp(lifetime=timedelta(seconds=-1))
+        verified_tokens.set(str(self.access), self.access)
+        self.assertIsNone(verified_tokens.get(str(self.access)))
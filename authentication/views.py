@@ -1,9 +1,13 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
+from .authentication import MODEL_USER_AUTHENTICATION, token_blacklist
 from .serializers import UserRegistrationSerializer, CustomTokenObtainPairSerializer, UserSerializer
 
 # Use custom User model
@@ -31,6 +35,7 @@ def register(request):
 
 
 @api_view(['GET'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
 @permission_classes([IsAuthenticated])
 def profile(request):
     """
@@ -41,6 +46,7 @@ def profile(request):
 
 
 @api_view(['PUT'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
 @permission_classes([IsAuthenticated])
 def update_profile(request):
     """
@@ -60,12 +66,24 @@ def update_profile(request):
 @permission_classes([IsAuthenticated])
 def logout(request):
     """
-    Logout user (in a real implementation, you might want to blacklist the token)
+    Logout user: blacklist the access token used for this request and, when
+    given, the refresh token
     """
+    refresh = request.data.get('refresh')
+    if refresh:
+        try:
+            refresh_token = RefreshToken(refresh)
+        except TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if refresh_token.get(jwt_settings.USER_ID_CLAIM) != request.user.id:
+            return Response({'error': 'Refresh token belongs to another user'}, status=status.HTTP_400_BAD_REQUEST)
+        token_blacklist.revoke(refresh_token)
+    token_blacklist.revoke(request.auth)
     return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
 @permission_classes([IsAuthenticated])
 def protected_view(request):
     """
@@ -80,6 +98,7 @@ def protected_view(request):
 
 
 @api_view(['GET'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
 @permission_classes([IsAuthenticated])
 def user_dashboard(request):
     """
@@ -97,6 +116,7 @@ def user_dashboard(request):
 
 
 @api_view(['GET'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
 @permission_classes([IsAuthenticated])
 def admin_only_view(request):
     """
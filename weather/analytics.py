@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from .models import UserSearchStats, UserSearchTally, WeatherSearch
+from .serializers import WeatherSearchSerializer
+
+TEMPERATURE_BUCKETS = {
+    'cold': Q(temperature__lt=10),
+    'cool': Q(temperature__gte=10, temperature__lt=20),
+    'warm': Q(temperature__gte=20, temperature__lt=30),
+    'hot': Q(temperature__gte=30),
+}
+
+
+def _options():
+    options = {'CACHE': 'default', 'TTL': 300}
+    options.update(getattr(settings, 'WEATHER_ANALYTICS', {}))
+    return options
+
+
+def analytics_cache_key(user_id):
+    return f'weather:analytics:{user_id}'
+
+
+def build_search_analytics(user_id):
+    """Compute the analytics payload for a user by aggregating their full search history"""
+    user_searches = WeatherSearch.objects.filter(user_id=user_id)
+
+    totals = user_searches.aggregate(
+        total_searches=Count('id'),
+        **{bucket: Count('id', filter=condition) for bucket, condition in TEMPERATURE_BUCKETS.items()}
+    )
+    popular_cities = user_searches.values('city').annotate(count=Count('city')).order_by('-count', 'city')[:5]
+    weather_conditions = user_searches.values('description').annotate(count=Count('description')) \
+                                     .order_by('-count', 'description')[:5]
+    last_search = user_searches.order_by('-searched_at', '-id').first()
+
+    return {
+        'total_searches': totals.pop('total_searches'),
+        'popular_cities': list(popular_cities),
+        'temperature_distribution': totals,
+        'weather_conditions': list(weather_conditions),
+        'last_search': WeatherSearchSerializer(last_search).data if last_search else None
+    }
+
+
+def read_search_analytics(user_id):
+    """Build the analytics payload for a user from the UserSearchStats rollup"""
+    stats = UserSearchStats.objects.select_related('last_search').filter(user_id=user_id).first()
+    if stats is None:
+        return {
+            'total_searches': 0,
+            'popular_cities': [],
+            'temperature_distribution': {bucket: 0 for bucket in TEMPERATURE_BUCKETS},
+            'weather_conditions': [],
+            'last_search': None
+        }
+
+    tallies = UserSearchTally.objects.filter(user_id=user_id).order_by('-count', 'value')
+    popular_cities = tallies.filter(kind=UserSearchTally.CITY).values_list('value', 'count')[:5]
+    weather_conditions = tallies.filter(kind=UserSearchTally.CONDITION).values_list('value', 'count')[:5]
+
+    return {
+        'total_searches': stats.total_searches,
+        'popular_cities': [{'city': city, 'count': count} for city, count in popular_cities],
+        'temperature_distribution': {bucket: getattr(stats, bucket) for bucket in TEMPERATURE_BUCKETS},
+        'weather_conditions': [{'description': description, 'count': count}
+                               for description, count in weather_conditions],
+        'last_search': WeatherSearchSerializer(stats.last_search).data if stats.last_search else None
+    }
+
+
+def get_search_analytics(user_id):
+    """Return the analytics payload for a user, cached until the user records a new search"""
+    options = _options()
+    cache = caches[options['CACHE']]
+    key = analytics_cache_key(user_id)
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = read_search_analytics(user_id)
+        cache.set(key, analytics, timeout=options['TTL'])
+    return analytics
+
+
+def invalidate_search_analytics(user_ids):
+    caches[_options()['CACHE']].delete_many([analytics_cache_key(user_id) for user_id in user_ids])
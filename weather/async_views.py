@@ -0,0 +1,253 @@
+"""
+Native async counterparts of the weather views, for deployments served via
+weather_portal.asgi (e.g. ``uvicorn weather_portal.asgi:application``).
+
+Upstream calls go through the async client, so a slow provider holds an
+event-loop slot instead of a worker thread.
+"""
+import asyncio
+import json
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from .cache import normalize_city, weather_cache
+from .coalesce import async_upstream_flight
+from .fanout import status_headers
+from .gazetteer import UnknownCity, resolve_city
+from .models import FavoriteCity, WeatherSearch
+from .pagination import SearchHistoryPagination
+from .recorder import search_recorder
+from .serializers import WeatherBatchRequestSerializer, WeatherSearchSerializer, WeatherSearchRequestSerializer
+from .quota import BATCH, upstream_priority
+from .resilience import UpstreamUnavailable
+from .upstream import PROVIDER_ERRORS, UpstreamError, async_upstream_client
+
+
+def _authenticate(request):
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        user_auth = authentication_class().authenticate(request)
+        if user_auth is not None:
+            return user_auth[0]
+    return None
+
+
+def _throttle_wait(request):
+    """Seconds to wait when a configured DRF throttle refuses ``request``, else None"""
+    waits = [throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+             if not throttle.allow_request(request, None)]
+    if not waits:
+        return None
+    return max(wait or 1 for wait in waits)
+
+
+def async_api_view(methods):
+    """Restrict an async view to ``methods``, authenticate it and apply throttles like the configured DRF classes"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                user = await sync_to_async(_authenticate)(request)
+            except exceptions.AuthenticationFailed as e:
+                return JsonResponse({'detail': str(e.detail)}, status=401)
+            if user is None or not user.is_authenticated:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user = user
+            wait = await sync_to_async(_throttle_wait)(request)
+            if wait is not None:
+                return JsonResponse({'detail': 'Request was throttled.'}, status=429,
+                                    headers={'Retry-After': str(math.ceil(wait))})
+            return await view(request, *args, **kwargs)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return None
+
+
+async def afetch_weather(city: str):
+    """Fetch weather, sharing one upstream request between concurrent coroutines for the same city"""
+    return await async_upstream_flight.do(
+        normalize_city(city), lambda: async_upstream_client.current_weather(city)
+    )
+
+
+async def alookup_weather(city: str):
+    try:
+        return await weather_cache.aget(city, afetch_weather)
+    except PROVIDER_ERRORS:
+        return _fallback_or_raise(city)
+
+
+async def _afill_weather(city: str):
+    try:
+        return await weather_cache.afill(city, afetch_weather)
+    except PROVIDER_ERRORS:
+        return _fallback_or_raise(city)
+
+
+def _fallback_or_raise(city):
+    """Serve the last cached observation, marked stale, from inside a PROVIDER_ERRORS handler"""
+    fallback = weather_cache.fallback(city)
+    if fallback is None:
+        raise
+    return fallback
+
+
+async def _gather_weather(cities, lookup=alookup_weather):
+    """
+    Run ``lookup`` for ``cities`` concurrently under the fan-out deadline; returns ``(city, status, data)`` in order.
+
+    Cities unknown to the gazetteer get status ``'unknown'`` without a lookup, as do cities the lookup reports
+    as not found.
+    """
+    deadline = getattr(settings, 'WEATHER_FANOUT', {}).get('DEADLINE', 5.0)
+    tasks = {}
+    for city in cities:
+        try:
+            tasks[city] = asyncio.ensure_future(lookup(resolve_city(city)))
+        except UnknownCity:
+            pass
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=deadline)
+
+    outcomes = []
+    for city in cities:
+        task = tasks.get(city)
+        if task is None:
+            outcomes.append((city, 'unknown', None))
+        elif not task.done():
+            task.cancel()
+            outcomes.append((city, 'timeout', None))
+        elif task.cancelled():
+            outcomes.append((city, 'timeout', None))
+        elif isinstance(task.exception(), UnknownCity):
+            outcomes.append((city, 'unknown', None))
+        elif task.exception() is not None:
+            outcomes.append((city, 'error', None))
+        else:
+            outcomes.append((city, 'ok', task.result()))
+    return outcomes
+
+
+async def _current_weather_response(request, city):
+    try:
+        weather_data = await alookup_weather(resolve_city(city))
+        await search_recorder.arecord([WeatherSearch.from_weather(request.user.id, weather_data)])
+        return JsonResponse(weather_data, status=200)
+    except UnknownCity as e:
+        return JsonResponse({'error': f'Unknown city: {e.city}', 'suggestions': e.suggestions}, status=404)
+    except UpstreamUnavailable as e:
+        response = JsonResponse({'error': f'Weather service unavailable: {str(e)}'}, status=503)
+        response['Retry-After'] = str(math.ceil(e.retry_after or 1))
+        return response
+    except (UpstreamError, ValueError) as e:
+        return JsonResponse({'error': f'Weather API error: {str(e)}'}, status=502)
+    except KeyError as e:
+        return JsonResponse({'error': f'Invalid weather data format: {str(e)}'}, status=502)
+
+
+@async_api_view(['GET'])
+async def async_get_weather(request):
+    city = request.GET.get('city')
+    if not city:
+        return JsonResponse({'error': 'City parameter is required'}, status=400)
+    return await _current_weather_response(request, city)
+
+
+@async_api_view(['POST'])
+async def async_advanced_search(request):
+    serializer = WeatherSearchRequestSerializer(data=_json_body(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    search_type = data.get('search_type', 'current')
+
+    if search_type == 'current':
+        if not data.get('city'):
+            return JsonResponse({'error': 'City is required for current weather search'}, status=400)
+        return await _current_weather_response(request, data['city'])
+
+    if search_type == 'history':
+        queryset = WeatherSearch.objects.filter(user_id=request.user.id)
+        if data.get('city'):
+            queryset = queryset.filter(city__icontains=data['city'])
+        if data.get('country'):
+            queryset = queryset.filter(country__icontains=data['country'])
+        if data.get('min_temperature') is not None:
+            queryset = queryset.filter(temperature__gte=data['min_temperature'])
+        if data.get('max_temperature') is not None:
+            queryset = queryset.filter(temperature__lte=data['max_temperature'])
+        if data.get('weather_condition'):
+            queryset = queryset.filter(description__icontains=data['weather_condition'])
+
+        paginator = SearchHistoryPagination(page_size=20)
+        try:
+            searches = await paginator.apaginate_queryset(queryset, request)
+        except exceptions.ValidationError as e:
+            return JsonResponse(e.detail, status=400)
+        return JsonResponse(WeatherSearchSerializer(searches, many=True).data, safe=False,
+                            headers=paginator.get_headers())
+
+    favorite_cities = [city async for city in FavoriteCity.objects.filter(search_filter__user_id=request.user.id)
+                                                                  .values_list('city', flat=True)[:5]]
+
+    if not favorite_cities:
+        return JsonResponse({'message': 'No favorite cities set'}, status=200)
+
+    results = []
+    statuses = []
+    for city, outcome, weather_data in await _gather_weather(favorite_cities):
+        statuses.append((city, outcome))
+        if outcome == 'ok':
+            weather_data['is_favorite'] = True
+            results.append(weather_data)
+
+    return JsonResponse(results, safe=False, headers=status_headers(statuses))
+
+
+@async_api_view(['POST'])
+async def async_batch_weather(request):
+    serializer = WeatherBatchRequestSerializer(data=_json_body(request))
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    cities = serializer.validated_data['cities']
+    results = {}
+    misses = []
+    for city in cities:
+        try:
+            cached = weather_cache.get_cached(resolve_city(city), afetch_weather)
+        except UnknownCity:
+            results[city] = {'city': city, 'status': 'unknown', 'cache': None, 'weather': None}
+            continue
+        if cached is None:
+            misses.append(city)
+        else:
+            results[city] = {'city': city, 'status': 'ok', 'cache': cached[1], 'weather': cached[0]}
+
+    with upstream_priority(BATCH):
+        outcomes = await _gather_weather(misses, _afill_weather)
+    for city, outcome, weather_data in outcomes:
+        cache = 'fallback' if weather_data and weather_data.get('stale') else 'miss'
+        results[city] = {'city': city, 'status': outcome, 'cache': cache, 'weather': weather_data}
+
+    await search_recorder.arecord([
+        WeatherSearch.from_weather(request.user.id, result['weather'])
+        for result in results.values() if result['status'] == 'ok'
+    ])
+    return JsonResponse({'results': [results[city] for city in cities]})
@@ -0,0 +1,118 @@
+"""
+Helpers shared by the benchmark management commands: seeding a large
+WeatherSearch history for throwaway users and timing queries against it.
+
+Commands that seed millions of rows (or drop indexes) run inside
+``scratch_database()`` unless given ``--in-place``. Commands that seed the
+configured database remove the seeded users (and their history) afterwards
+unless ``--keep`` is passed.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from .models import WeatherSearch
+from .recorder import search_recorder
+from .rollups import rollups_unchanged
+
+User = get_user_model()
+
+BENCH_USER_PREFIX = 'bench-user-'
+
+CITIES = [
+    'London', 'Paris', 'Tokyo', 'New York', 'Berlin', 'Madrid', 'Rome', 'Lisbon', 'Dublin', 'Oslo',
+    'Stockholm', 'Helsinki', 'Vienna', 'Prague', 'Warsaw', 'Budapest', 'Athens', 'Istanbul', 'Cairo',
+    'Nairobi', 'Lagos', 'Johannesburg', 'Mumbai', 'Delhi', 'Thimphu', 'Kathmandu', 'Dhaka', 'Bangkok',
+    'Singapore', 'Jakarta', 'Manila', 'Seoul', 'Beijing', 'Shanghai', 'Sydney', 'Melbourne', 'Auckland',
+    'Toronto', 'Vancouver', 'Chicago', 'Los Angeles', 'San Francisco', 'Mexico City', 'Bogota', 'Lima',
+    'Santiago', 'Buenos Aires', 'Sao Paulo', 'Rio de Janeiro', 'Reykjavik', 'Lyon', 'Leeds', 'Lagos de Moreno',
+]
+DESCRIPTIONS = ['Clear Sky', 'Few Clouds', 'Scattered Clouds', 'Broken Clouds', 'Light Rain', 'Rain', 'Snow', 'Mist']
+
+
+@contextmanager
+def scratch_database():
+    """
+    Run the block against a freshly migrated copy of the schema in a throwaway database, dropped afterwards.
+
+    Built the way the test runner builds its database, so an interrupted run
+    never leaves seeded rows or dropped indexes in the configured database.
+    On SQLite the scratch database is a file next to the configured one,
+    not the test runner's in-memory default, so timings include disk I/O.
+    """
+    test_settings = connection.settings_dict['TEST']
+    saved = dict(test_settings)
+    if connection.vendor == 'sqlite':
+        test_settings['NAME'] = str(Path(connection.settings_dict['NAME']).with_name('bench_scratch.sqlite3'))
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings.clear()
+        test_settings.update(saved)
+
+
+def seed_searches(rows, users=100, chunk_size=10_000, days=365, stdout=None):
+    """Create ``users`` benchmark users and ``rows`` WeatherSearch rows spread across them"""
+    bench_users = User.objects.bulk_create([
+        User(username=f'{BENCH_USER_PREFIX}{i}', email=f'{BENCH_USER_PREFIX}{i}@example.com')
+        for i in range(users)
+    ])
+    bench_users = list(User.objects.filter(username__startswith=BENCH_USER_PREFIX))
+    rng = random.Random(42)
+    now = timezone.now()
+    # Skewed city popularity so group-bys and suggestions look like real traffic
+    weights = [1 / (rank + 1) for rank in range(len(CITIES))]
+
+    created = 0
+    while created < rows:
+        batch = min(chunk_size, rows - created)
+        WeatherSearch.objects.bulk_create([
+            WeatherSearch(
+                user=rng.choice(bench_users),
+                city=rng.choices(CITIES, weights)[0],
+                country='XX',
+                temperature=round(rng.uniform(-15, 40), 1),
+                description=rng.choice(DESCRIPTIONS),
+                humidity=rng.randint(10, 100),
+                searched_at=now - timedelta(seconds=rng.randint(0, days * 86400)),
+            )
+            for _ in range(batch)
+        ], batch_size=1000)
+        created += batch
+        if stdout is not None:
+            stdout.write(f'  seeded {created}/{rows} rows')
+    return bench_users
+
+
+def remove_seeded_data(chunk_size=10_000):
+    search_recorder.flush()  # queued searches of the seeded users would fail their foreign key once they are gone
+    # In chunks: the SET_NULL from UserSearchStats.last_search makes one huge delete exceed SQLite's variable limit
+    searches = WeatherSearch.objects.filter(user__username__startswith=BENCH_USER_PREFIX)
+    # Seeded rows are bulk-created and were never added to the rollups
+    with rollups_unchanged():
+        while True:
+            ids = list(searches.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            WeatherSearch.objects.filter(id__in=ids).delete()
+    User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+
+
+def time_call(fn, repeat=20):
+    """Return ``(median_ms, p95_ms)`` over ``repeat`` calls of ``fn``"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
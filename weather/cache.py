@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def normalize_city(city: str) -> str:
+    """Normalize a city name into the key used by the weather cache"""
+    return ' '.join(city.split()).casefold()
+
+
+class CacheEntry:
+    __slots__ = ('data', 'fetched_at', 'warmed')
+
+    def __init__(self, data, fetched_at, warmed=None):
+        self.data = data
+        self.fetched_at = fetched_at
+        # For entries stored by the cache warmer and not read yet: (fresh_until, servable_until)
+        # of the entry they replaced, to tell whether the first read would otherwise have missed
+        self.warmed = warmed
+
+
+class WeatherCache:
+    """
+    LRU cache of upstream weather observations keyed on the normalized city.
+
+    Entries are fresh for ``ttl`` seconds. For a further ``stale_ttl`` seconds
+    an expired entry is still served immediately while a single background
+    refresh replaces it. When ``backend`` names a Django cache alias, entries
+    are also shared with other workers through that cache.
+    """
+
+    COUNTER_PREFIX = 'weather:cache-counters:'
+
+    def __init__(self, max_entries=1024, ttl=600, stale_ttl=1800, backend='', key_prefix='weather:obs:'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.backend = backend
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['hits', 'stale_hits', 'shared_hits', 'misses', 'refreshes', 'refresh_errors', 'evictions', 'fallbacks',
+             'warmed', 'prevented_misses', 'prevented_stale_hits'], 0
+        )
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_CACHE', {})
+        return cls(
+            max_entries=options.get('MAX_ENTRIES', 1024),
+            ttl=options.get('TTL', 600),
+            stale_ttl=options.get('STALE_TTL', 1800),
+            backend=options.get('BACKEND', ''),
+        )
+
+    def get(self, city: str, fetcher):
+        """Return weather for ``city``, calling ``fetcher(city)`` on a miss"""
+        cached = self.get_cached(city, fetcher)
+        if cached is not None:
+            return cached[0]
+        return self.fill(city, fetcher)
+
+    async def aget(self, city: str, fetcher):
+        """Async variant of get() for coroutine fetchers"""
+        cached = self.get_cached(city, fetcher)
+        if cached is not None:
+            return cached[0]
+        return await self.afill(city, fetcher)
+
+    def get_cached(self, city: str, fetcher):
+        """
+        Return ``(data, 'hit' | 'stale')`` for a servable entry, or None on a miss.
+
+        Stale entries trigger one background refresh through ``fetcher``: a
+        thread for plain callables, a task on the running loop for coroutines.
+        """
+        key = normalize_city(city)
+        cached = self._lookup(key)
+        if cached is None:
+            return None
+
+        entry, stale = cached
+        if stale and self._claim_refresh(key):
+            if asyncio.iscoroutinefunction(fetcher):
+                task = asyncio.get_running_loop().create_task(self._arefresh(key, city, fetcher))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                threading.Thread(target=self._refresh, args=(key, city, fetcher), daemon=True).start()
+        return dict(entry.data), 'stale' if stale else 'hit'
+
+    def fill(self, city: str, fetcher):
+        """Fetch ``city`` unconditionally and store the result"""
+        data = fetcher(city)
+        self.set(city, data)
+        return dict(data)
+
+    async def afill(self, city: str, fetcher):
+        data = await fetcher(city)
+        self.set(city, data)
+        return dict(data)
+
+    def peek(self, city: str):
+        """Return the cached entry for ``city`` without fetching or counting"""
+        return self._get_entry(normalize_city(city), count=False)
+
+    def fallback(self, city: str):
+        """
+        Last known observation for ``city`` however old, marked ``stale`` with
+        its ``age_seconds``; None when nothing is cached. Used when the
+        provider cannot answer.
+        """
+        entry = self._get_entry(normalize_city(city), count=False)
+        if entry is None:
+            return None
+        self._incr('fallbacks')
+        return dict(entry.data, stale=True, age_seconds=int(time.time() - entry.fetched_at))
+
+    def set(self, city: str, data, fetched_at=None, warmed=False):
+        """Store ``data`` for ``city``; ``warmed`` marks a refresh made ahead of demand by the cache warmer"""
+        key = normalize_city(city)
+        marker = None
+        if warmed:
+            previous = self._get_entry(key, count=False)
+            previous_at = previous.fetched_at if previous is not None else 0
+            marker = (previous_at + self.ttl, previous_at + self.ttl + self.stale_ttl)
+            self._incr('warmed')
+        entry = CacheEntry(dict(data), fetched_at or time.time(), marker)
+        self._store_local(key, entry)
+        if self.backend:
+            caches[self.backend].set(
+                self.key_prefix + key,
+                {'data': entry.data, 'fetched_at': entry.fetched_at, 'warmed': marker},
+                timeout=self.ttl + self.stale_ttl,
+            )
+
+    def expires_in(self, city: str):
+        """Seconds until the cached entry for ``city`` stops being fresh (negative once stale); None if absent"""
+        entry = self._get_entry(normalize_city(city), count=False)
+        if entry is None:
+            return None
+        return entry.fetched_at + self.ttl - time.time()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['size'] = len(self._entries)
+            snapshot['refreshing'] = len(self._refreshing)
+        snapshot['max_entries'] = self.max_entries
+        snapshot['ttl'] = self.ttl
+        snapshot['stale_ttl'] = self.stale_ttl
+        lookups = snapshot['hits'] + snapshot['stale_hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = round((snapshot['hits'] + snapshot['stale_hits']) / lookups, 4) if lookups else None
+        return snapshot
+
+    def _get_entry(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.backend:
+            return None
+        stored = caches[self.backend].get(self.key_prefix + key)
+        if stored is None:
+            return None
+        entry = CacheEntry(stored['data'], stored['fetched_at'], stored.get('warmed'))
+        self._store_local(key, entry)
+        if count:
+            self._incr('shared_hits')
+        return entry
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _lookup(self, key):
+        """Return ``(entry, is_stale)`` for a servable entry, or None on a miss; updates counters"""
+        entry = self._get_entry(key)
+        if entry is not None:
+            self._credit_warmer(entry)
+            age = time.time() - entry.fetched_at
+            if age < self.ttl:
+                self._incr('hits')
+                return entry, False
+            if age < self.ttl + self.stale_ttl:
+                self._incr('stale_hits')
+                return entry, True
+        self._incr('misses')
+        return None
+
+    def _credit_warmer(self, entry):
+        """Count what the first read of a warmed entry would have been without the warmer"""
+        with self._lock:
+            marker, entry.warmed = entry.warmed, None
+        if marker is None:
+            return
+        fresh_until, servable_until = marker
+        now = time.time()
+        if now >= servable_until:
+            counter = 'prevented_misses'
+        elif now >= fresh_until:
+            counter = 'prevented_stale_hits'
+        else:
+            return
+        self._incr(counter)
+        if self.backend:
+            # Shared total, so the warmer process can report what it saved the web workers
+            shared = caches[self.backend]
+            shared.add(self.COUNTER_PREFIX + counter, 0, timeout=None)
+            shared.incr(self.COUNTER_PREFIX + counter)
+
+    def shared_counter(self, name):
+        """Value of a counter summed across workers through the shared backend (None without one)"""
+        if not self.backend:
+            return None
+        return caches[self.backend].get(self.COUNTER_PREFIX + name, 0)
+
+    def _claim_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh(self, key, city, fetcher):
+        try:
+            self.set(city, fetcher(city))
+            self._incr('refreshes')
+        except Exception:
+            self._incr('refresh_errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _arefresh(self, key, city, fetcher):
+        try:
+            self.set(city, await fetcher(city))
+            self._incr('refreshes')
+        except Exception:
+            self._incr('refresh_errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+weather_cache = WeatherCache.from_settings()
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    Threads in this process that ask for a key while a call for it is in
+    flight wait for that call and receive its result or its exception. When
+    ``backend`` names a Django cache alias, a lock in that cache extends the
+    coalescing to other workers: followers poll for the leader's result
+    instead of calling upstream themselves.
+    """
+
+    def __init__(self, backend='', lock_timeout=15, poll_interval=0.05, key_prefix='weather:flight:'):
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'followers': 0, 'shared_followers': 0}
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_SINGLE_FLIGHT', {})
+        return cls(
+            backend=options.get('BACKEND', ''),
+            lock_timeout=options.get('LOCK_TIMEOUT', 15),
+        )
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+            else:
+                self._counters['followers'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['in_flight'] = len(self._calls)
+        return snapshot
+
+    def _run(self, key, fn):
+        if not self.backend:
+            return fn()
+
+        cache = caches[self.backend]
+        lock_key = f'{self.key_prefix}lock:{key}'
+        result_key = f'{self.key_prefix}result:{key}'
+        deadline = time.monotonic() + self.lock_timeout
+
+        while not cache.add(lock_key, 1, timeout=self.lock_timeout):
+            # Another worker is fetching this key; wait for its result or for the lock to go away
+            time.sleep(self.poll_interval)
+            result = cache.get(result_key)
+            if result is not None:
+                with self._lock:
+                    self._counters['shared_followers'] += 1
+                return result
+            if time.monotonic() >= deadline:
+                return fn()
+
+        try:
+            result = fn()
+            cache.set(result_key, result, timeout=self.lock_timeout)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+
+class AsyncSingleFlight:
+    """Coroutine counterpart of SingleFlight, coalescing calls made on the same event loop"""
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key: str, fn):
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            # The call runs in its own task, so cancelling the caller that started it (e.g. at a fan-out
+            # deadline) does not cancel it for the callers still waiting on it
+            task = calls[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: self._finished(calls, key, done))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finished(calls, key, task):
+        if calls.get(key) is task:
+            del calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when nobody is waiting any more
+
+    def stats(self):
+        return {'in_flight': sum(len(calls) for calls in list(self._calls.values()))}
+
+
+upstream_flight = SingleFlight.from_settings()
+async_upstream_flight = AsyncSingleFlight()
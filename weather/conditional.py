@@ -0,0 +1,54 @@
+"""
+Conditional GET support for the weather API views.
+
+Django's ``condition`` and ``cache_control`` decorators expect a plain
+HttpRequest and tag every response, so the API views use ``conditional``
+instead. It goes between ``@api_view`` and the view, where the request is
+already authenticated and throttled.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+
+
+def make_etag(*parts):
+    """Opaque ETag for the values a response depends on"""
+    return quote_etag(hashlib.md5(':'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest())
+
+
+def conditional(etag_func, on_not_modified=None, **cache_control):
+    """
+    Answer GET/HEAD requests with 304 when ``etag_func(request)`` matches If-None-Match, without running the view.
+
+    ``etag_func`` returns a value from ``make_etag`` or None when it cannot
+    tell cheaply (e.g. before the first lookup of a city). In that case it is
+    called again after the view so the response still carries an ETag.
+    ``on_not_modified(request)`` runs before a 304 is returned, for the side
+    effects of a view that is skipped. Successful responses get
+    ``cache_control`` (keyword arguments as for ``patch_cache_control``), and
+    every response varies on Authorization.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            etag = etag_func(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag) if etag else None
+            if response is not None and on_not_modified is not None and response.status_code == 304:
+                on_not_modified(request, *args, **kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if etag is None and 200 <= response.status_code < 300:
+                    etag = etag_func(request, *args, **kwargs)
+            if 200 <= response.status_code < 300 or response.status_code == 304:
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+                patch_cache_control(response, **cache_control)
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,51 @@
+"""
+Streaming export of a user's full search history as NDJSON or CSV.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` and written out as
+they arrive, so an export holds one chunk in memory however long the
+history is.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FIELDS = ['id', 'city', 'country', 'temperature', 'description', 'humidity', 'wind_speed', 'pressure',
+                 'searched_at']
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[field].isoformat() if field == 'searched_at' else row[field]
+                               for field in EXPORT_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
+
+
+def export_response(queryset, output, filename='weather-history', chunk_size=CHUNK_SIZE):
+    """StreamingHttpResponse with every row of ``queryset`` in ``output`` format (a key of EXPORT_FORMATS)"""
+    lines, content_type, extension = EXPORT_FORMATS[output]
+    rows = queryset.order_by('-searched_at', '-id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    response = StreamingHttpResponse(lines(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
@@ -0,0 +1,93 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
+
+from django.conf import settings
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'WEATHER_FANOUT', {}).get('MAX_WORKERS', 16),
+    thread_name_prefix='weather-fanout',
+)
+
+
+class FanOutResult:
+    __slots__ = ('key', 'status', 'value', 'error')
+
+    def __init__(self, key, status, value=None, error=None):
+        self.key = key
+        self.status = status
+        self.value = value
+        self.error = error
+
+
+class _Expired(Exception):
+    """A job reached a worker after its fan-out deadline"""
+
+
+def fan_out(keys, fn, deadline=None, max_in_flight=None):
+    """
+    Run ``fn(key)`` for every key on the shared bounded pool.
+
+    Waits at most ``deadline`` seconds overall and returns one FanOutResult
+    per key, in the order the keys were given, with status ``ok``,
+    ``error`` or ``timeout``.
+
+    A running job cannot be stopped, so one call keeps at most
+    ``max_in_flight`` jobs on the pool, submits no more once the deadline
+    has passed, and jobs that only reach a worker after it return
+    straight away. A slow upstream therefore holds a few workers for one
+    request rather than the whole pool.
+    """
+    options = getattr(settings, 'WEATHER_FANOUT', {})
+    if deadline is None:
+        deadline = options.get('DEADLINE', 5.0)
+    max_in_flight = max_in_flight or options.get('MAX_IN_FLIGHT', 4)
+    expires = time.monotonic() + deadline
+
+    def job(key):
+        if time.monotonic() >= expires:
+            raise _Expired(key)
+        return fn(key)
+
+    futures = []
+    running = set()
+    while True:
+        while len(futures) < len(keys) and len(running) < max_in_flight:
+            # Each job runs in a copy of the caller's context, so it keeps e.g. the upstream priority class
+            future = executor.submit(contextvars.copy_context().run, job, keys[len(futures)])
+            futures.append(future)
+            running.add(future)
+        remaining = expires - time.monotonic()
+        if not running or remaining <= 0:
+            break
+        _, running = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+
+    results = []
+    for index, key in enumerate(keys):
+        future = futures[index] if index < len(futures) else None
+        if future is None or not future.done():
+            if future is not None:
+                future.cancel()
+            results.append(FanOutResult(key, 'timeout'))
+        elif isinstance(future.exception(), _Expired):
+            results.append(FanOutResult(key, 'timeout'))
+        elif future.exception() is not None:
+            results.append(FanOutResult(key, 'error', error=future.exception()))
+        else:
+            results.append(FanOutResult(key, 'ok', value=future.result()))
+    return results
+
+
+def status_headers(statuses):
+    """
+    Response headers reporting per-key fan-out outcomes alongside a plain list body.
+
+    ``statuses`` is a list of ``(key, status)`` pairs. ``X-Partial-Results``
+    is ``true`` when any key is not ``ok``; ``X-City-Status`` lists
+    ``key=status`` pairs in order, with keys percent-encoded.
+    """
+    return {
+        'X-Partial-Results': 'true' if any(outcome != 'ok' for _, outcome in statuses) else 'false',
+        'X-City-Status': ', '.join(f'{quote(str(key), safe="")}={outcome}' for key, outcome in statuses),
+    }
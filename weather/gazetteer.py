@@ -0,0 +1,203 @@
+"""
+Offline city gazetteer used for autocomplete and to validate city names
+before they are sent upstream.
+
+The gazetteer file is produced by ``manage.py load_gazetteer`` from a
+GeoNames-style TSV: one gzipped line per place holding its name, country,
+population and any alternate spellings. At load time every spelling is
+accent-folded into a sorted key list (prefix lookups are a binary search)
+and a symmetric-delete table of single-character deletions, which finds
+candidates for bounded edit-distance matching without comparing the query
+against every known name.
+"""
+import gzip
+import heapq
+import os
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from .cache import normalize_city
+
+Place = namedtuple('Place', ['name', 'country', 'population'])
+
+
+class UnknownCity(LookupError):
+    """Raised when a city name matches nothing in the gazetteer"""
+
+    def __init__(self, city, suggestions=()):
+        super().__init__(city)
+        self.city = city
+        self.suggestions = list(suggestions)
+
+
+def fold_name(name: str) -> str:
+    """Accent-fold and normalize a place name: 'São  Paulo' -> 'sao paulo'"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return normalize_city(''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+def _deletes(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class Gazetteer:
+    def __init__(self, places):
+        self._places = defaultdict(list)
+        for place, spellings in places:
+            for key in {fold_name(spelling) for spelling in spellings if spelling}:
+                self._places[key].append(place)
+        for candidates in self._places.values():
+            candidates.sort(key=lambda place: -place.population)
+        self._keys = sorted(self._places)
+        self._neighbours = defaultdict(list)
+        for key in self._keys:
+            for variant in _deletes(key):
+                self._neighbours[variant].append(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as source:
+            return cls(cls._parse(source))
+
+    @staticmethod
+    def _parse(lines):
+        for line in lines:
+            name, country, population, alternates = line.rstrip('\n').split('\t')
+            yield Place(name, country, int(population)), [name] + alternates.split('|')
+
+    @staticmethod
+    def write(path, places):
+        """Write ``(Place, spellings)`` pairs in the format read by load()"""
+        with gzip.open(path, 'wt', encoding='utf-8') as target:
+            for place, spellings in places:
+                alternates = sorted({spelling for spelling in spellings if spelling and spelling != place.name})
+                target.write(f'{place.name}\t{place.country}\t{place.population}\t{"|".join(alternates)}\n')
+
+    def lookup(self, name):
+        """Most populous place whose name or alternate spelling folds to ``name``, or None"""
+        candidates = self._places.get(fold_name(name))
+        return candidates[0] if candidates else None
+
+    def suggest(self, prefix, limit=5):
+        """Names of the most populous places with a spelling starting with ``prefix``"""
+        prefix = fold_name(prefix)
+        if not prefix:
+            return []
+        best = {}
+        for key in self._keys[bisect_left(self._keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            place = self._places[key][0]
+            best[place.name] = max(best.get(place.name, 0), place.population)
+        return heapq.nlargest(limit, best, key=best.get)
+
+    def closest(self, name, max_distance=2, limit=5):
+        """Names of places within ``max_distance`` edits of ``name``, nearest then most populous first"""
+        return [place_name for _, place_name in self.ranked_matches(name, max_distance)][:limit]
+
+    def ranked_matches(self, name, max_distance=2):
+        """``(distance, name)`` for places within ``max_distance`` edits of ``name``, best first"""
+        key = fold_name(name)
+        # Short names have too many neighbours for a correction to mean anything
+        max_distance = min(max_distance, max(0, (len(key) - 2) // 2))
+        if max_distance == 0:
+            return []
+        candidates = set(self._neighbours.get(key, ()))
+        for variant in _deletes(key):
+            if variant in self._places:
+                candidates.add(variant)
+            candidates.update(self._neighbours.get(variant, ()))
+
+        ranked = []
+        for candidate in candidates:
+            distance = edit_distance(key, candidate, max_distance)
+            if distance <= max_distance:
+                place = self._places[candidate][0]
+                ranked.append((distance, -place.population, place.name))
+        matches = {}
+        for distance, _, place_name in sorted(ranked):
+            matches.setdefault(place_name, distance)
+        return [(distance, place_name) for place_name, distance in matches.items()]
+
+
+def _options():
+    options = {'PATH': '', 'MAX_DISTANCE': 2, 'VALIDATE': True}
+    options.update(getattr(settings, 'WEATHER_GAZETTEER', {}))
+    return options
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """The configured Gazetteer, loaded on first use; None when no gazetteer file is installed"""
+    path = _options()['PATH']
+    if not path or not os.path.exists(path):
+        return None
+    if path not in _loaded:
+        with _load_lock:
+            if path not in _loaded:
+                _loaded[path] = Gazetteer.load(path)
+    return _loaded[path]
+
+
+def reset_gazetteer():
+    _loaded.clear()
+
+
+def resolve_city(city):
+    """
+    Return the gazetteer's spelling of ``city``, correcting unambiguous typos.
+
+    Only the name is checked: an OpenWeather ``"City,CC"`` or
+    ``"City,State,CC"`` suffix is passed through as given. Raises
+    UnknownCity when validation is enabled and nothing is close enough;
+    returns ``city`` unchanged when no gazetteer is installed.
+    """
+    options = _options()
+    gazetteer = get_gazetteer()
+    if gazetteer is None or not options['VALIDATE']:
+        return city
+    name, comma, qualifiers = city.partition(',')
+    place = gazetteer.lookup(name)
+    if place is not None:
+        return place.name + comma + qualifiers
+    matches = gazetteer.ranked_matches(name, options['MAX_DISTANCE'])
+    # Take the nearest match when it is one edit away or the only one at its distance
+    if matches and (matches[0][0] == 1 or len(matches) == 1 or matches[1][0] > matches[0][0]):
+        return matches[0][1] + comma + qualifiers
+    raise UnknownCity(city, [place_name for _, place_name in matches[:5]])
+
+
+def gazetteer_suggestions(query, limit=5):
+    """Prefix matches from the gazetteer, falling back to typo corrections"""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return []
+    return gazetteer.suggest(query, limit) or gazetteer.closest(query, _options()['MAX_DISTANCE'], limit)
@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from weather.benchmarking import CITIES, remove_seeded_data, seed_searches
+from weather.cache import weather_cache
+from weather.models import SearchFilter
+from weather.rollups import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a dashboard session (analytics, history, filters and the weather for each favorite city, '
+        'reloaded repeatedly) with and without If-None-Match, and report bytes transferred and server time. '
+        'Cities are served from pre-filled cache entries, so no upstream calls are made. Run against a '
+        'scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Searches in the replaying user\'s history')
+        parser.add_argument('--reloads', type=int, default=50)
+        parser.add_argument('--cities', type=int, default=5, help='Favorite cities shown on the dashboard')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        user = seed_searches(options['rows'], users=1)[0]
+        rebuild_user_stats([user.pk])
+        cities = CITIES[:options['cities']]
+        SearchFilter.objects.create(user=user, weather_conditions=['Clear Sky']).set_favorite_cities(cities)
+        for city in cities:
+            weather_cache.set(city, {'city': city, 'country': 'XX', 'temperature': 12.5, 'description': 'Clear Sky',
+                                     'humidity': 60, 'wind_speed': 3.1, 'pressure': 1012})
+
+        session = [reverse('search_analytics'), reverse('weather_history'), reverse('search_filters')]
+        session += [f'{reverse("get_weather")}?city={city}' for city in cities]
+        no_throttles = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={})
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], REST_FRAMEWORK=no_throttles,
+                                   WEATHER_RECORDER={'WRITE_BEHIND': False}):
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'== {options["reloads"]} dashboard reloads of {len(session)} requests =='
+                ))
+                for label, revalidate in [('unconditional', False), ('If-None-Match', True)]:
+                    self.report(label, self.replay(user, session, options['reloads'], revalidate))
+        finally:
+            weather_cache.clear()
+            if not options['keep']:
+                remove_seeded_data()
+
+    def replay(self, user, session, reloads, revalidate):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        etags, totals = {}, {'requests': 0, 'not_modified': 0, 'bytes': 0, 'seconds': 0.0}
+        for _ in range(reloads):
+            for url in session:
+                headers = {'HTTP_IF_NONE_MATCH': etags[url]} if revalidate and url in etags else {}
+                started = time.perf_counter()
+                response = client.get(url, **headers)
+                totals['seconds'] += time.perf_counter() - started
+                totals['requests'] += 1
+                totals['bytes'] += len(response.content)
+                if response.status_code == 304:
+                    totals['not_modified'] += 1
+                elif response.has_header('ETag'):
+                    etags[url] = response['ETag']
+        return totals
+
+    def report(self, label, totals):
+        self.stdout.write(
+            f'{label:<14} {totals["requests"]} requests, {totals["not_modified"]} not modified, '
+            f'{totals["bytes"] / 1024:8.1f} KiB body, {totals["seconds"] * 1000:8.1f}ms server time '
+            f'({totals["seconds"] / totals["requests"] * 1000:.2f}ms/request)'
+        )
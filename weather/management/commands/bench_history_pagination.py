@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from weather.benchmarking import remove_seeded_data, scratch_database, seed_searches, time_call
+from weather.export import CHUNK_SIZE, EXPORT_FORMATS, export_response
+from weather.models import WeatherSearch
+from weather.pagination import SearchHistoryPagination, encode_cursor
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large WeatherSearch history and time deep history pages with OFFSET against keyset '
+        '(cursor) pagination, then the streaming export. Runs in a throwaway database unless --in-place is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=10, help='Fewer users means deeper histories')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--depths', type=int, nargs='+', default=[0, 1000, 10_000, 50_000, 90_000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--in-place', action='store_true',
+                            help='Seed the configured database instead of a throwaway one')
+        parser.add_argument('--keep', action='store_true', help='With --in-place, keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if options['in_place']:
+            self.run(options)
+        else:
+            with scratch_database():
+                self.run(options)
+
+    def run(self, options):
+        self.stdout.write(f'Seeding {options["rows"]} rows for {options["users"]} users...')
+        users = seed_searches(options['rows'], users=options['users'], stdout=self.stdout)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        try:
+            user = users[0]
+            history = WeatherSearch.objects.filter(user=user)
+            total = history.count()
+            page_size = options['page_size']
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'== page of {page_size} at depth, user with {total} searches =='
+            ))
+            factory = RequestFactory()
+            for depth in options['depths']:
+                if depth >= total:
+                    continue
+                offset_page = history.order_by('-searched_at', '-id')[depth:depth + page_size]
+                # The cursor a client would hold after paging down to ``depth``
+                params = {'page_size': page_size}
+                if depth:
+                    last = history.order_by('-searched_at', '-id')[depth - 1]
+                    params['cursor'] = encode_cursor(last.searched_at, last.pk)
+                request = Request(factory.get('/api/weather/history/', params))
+
+                offset_median, offset_p95 = time_call(lambda: list(offset_page.all()), options['repeat'])
+                keyset_median, keyset_p95 = time_call(
+                    lambda: SearchHistoryPagination(page_size).paginate_queryset(history, request), options['repeat']
+                )
+                self.stdout.write(
+                    f'depth={depth:<7} offset median={offset_median:8.2f}ms p95={offset_p95:8.2f}ms   '
+                    f'keyset median={keyset_median:8.2f}ms p95={keyset_p95:8.2f}ms'
+                )
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== export, chunk_size={CHUNK_SIZE} =='))
+            for output in EXPORT_FORMATS:
+                started = time.perf_counter()
+                size = sum(len(line) for line in export_response(history, output).streaming_content)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{output:<7} {total} rows, {size / 2 ** 20:.1f} MiB in {elapsed:.2f}s '
+                                  f'({total / elapsed:,.0f} rows/s)')
+        finally:
+            if options['in_place'] and not options['keep']:
+                remove_seeded_data()
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from authentication.authentication import (
+    CachedJWTAuthentication, StatelessJWTAuthentication, active_users, token_blacklist, verified_tokens
+)
+from authentication.serializers import CustomTokenObtainPairSerializer
+from weather.benchmarking import remove_seeded_data, seed_searches, time_call
+from weather.views import weather_history
+
+
+class Command(BaseCommand):
+    help = (
+        'Time authenticating a bearer token with simplejwt\'s JWTAuthentication, CachedJWTAuthentication '
+        '(verified-token cache and in-memory blacklist) and StatelessJWTAuthentication (token claims), then '
+        'measure requests/sec on GET /api/weather/history/ with each. Throttles are left out. '
+        'Run against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--rows', type=int, default=1000, help='Searches in the benchmark user\'s history')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        user = seed_searches(options['rows'], users=1)[0]
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        factory = APIRequestFactory(HTTP_HOST='localhost')
+        url = reverse('weather_history')
+
+        classes = [('JWTAuthentication', JWTAuthentication), ('CachedJWTAuthentication', CachedJWTAuthentication),
+                   ('StatelessJWTAuthentication', StatelessJWTAuthentication)]
+        verified_tokens.clear()
+        token_blacklist.refresh()
+        active_users.clear()
+        request = factory.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== authenticate(), {options["requests"]} calls =='))
+        for label, authentication in classes:
+            authentication().authenticate(request)
+            median, p95 = time_call(lambda: authentication().authenticate(request), options['requests'])
+            self.stdout.write(f'{label:<28} median={median * 1000:8.1f}us p95={p95 * 1000:8.1f}us')
+
+        view = weather_history.cls
+        configured = (view.authentication_classes, view.throttle_classes)
+        view.throttle_classes = []
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== GET {url}, {options["requests"]} requests =='))
+            for label, authentication in classes:
+                view.authentication_classes = [authentication]
+                weather_history(factory.get(url, HTTP_AUTHORIZATION=f'Bearer {token}'))
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    weather_history(factory.get(url, HTTP_AUTHORIZATION=f'Bearer {token}'))
+                started = time.perf_counter()
+                for _ in range(options['requests']):
+                    response = weather_history(factory.get(url, HTTP_AUTHORIZATION=f'Bearer {token}'))
+                    response.render()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{label:<28} {options["requests"] / elapsed:8.0f} req/s '
+                                  f'{elapsed / options["requests"] * 1000:6.2f}ms/request '
+                                  f'{len(queries)} queries/request')
+        finally:
+            view.authentication_classes, view.throttle_classes = configured
+            if not options['keep']:
+                remove_seeded_data()
@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from weather.benchmarking import remove_seeded_data, scratch_database, seed_searches, time_call
+from weather.models import UserSearchTally, WeatherSearch
+from weather.rollups import rebuild_city_popularity, rebuild_user_stats
+from weather.suggest import city_index, popular_cities
+
+PREFIXES = ['lo', 'ba', 'sa', 'me', 'new', 'th']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large WeatherSearch history, then time search suggestions using the old icontains queries, '
+        'the in-memory prefix index and the CityPopularity table. Runs in a throwaway database unless --in-place '
+        'is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--in-place', action='store_true',
+                            help='Seed the configured database instead of a throwaway one')
+        parser.add_argument('--keep', action='store_true', help='With --in-place, keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if options['in_place']:
+            self.run(options)
+        else:
+            with scratch_database():
+                self.run(options)
+
+    def run(self, options):
+        self.stdout.write(f'Seeding {options["rows"]} rows for {options["users"]} users...')
+        users = seed_searches(options['rows'], users=options['users'], stdout=self.stdout)
+        user = users[0]
+        rebuild_user_stats([user.pk])
+        rebuild_city_popularity()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        try:
+            started = time.perf_counter()
+            city_index.clear()
+            city_index.load()
+            self.stdout.write(f'Index load: {(time.perf_counter() - started) * 1000:.2f}ms '
+                              f'for {city_index.stats()["cities"]} cities')
+
+            def icontains(query):
+                user_half = WeatherSearch.objects.filter(user=user, city__icontains=query) \
+                                                 .values_list('city', flat=True).distinct()[:5]
+                popular = WeatherSearch.objects.filter(city__icontains=query).values('city') \
+                                               .annotate(count=Count('city')).order_by('-count')[:5]
+                return list(user_half) + [item['city'] for item in popular]
+
+            def user_tally(query):
+                return list(UserSearchTally.objects.filter(user=user, kind=UserSearchTally.CITY,
+                                                           value__icontains=query)
+                                                   .order_by('-count', 'value').values_list('value', flat=True)[:5])
+
+            def table(query):
+                with override_settings(WEATHER_SUGGESTIONS={'BACKEND': 'table'}):
+                    return popular_cities(query)
+
+            runs = [
+                ('icontains scans (before)', icontains, options['repeat'] // 10 or 1),
+                ('user half via tally', user_tally, options['repeat']),
+                ('global half, memory index', popular_cities, options['repeat']),
+                ('global half, table', table, options['repeat']),
+            ]
+            for label, fn, repeat in runs:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+                for prefix in PREFIXES:
+                    median, p95 = time_call(lambda: fn(prefix), repeat)
+                    self.stdout.write(f'{prefix!r:<6} median={median:9.3f}ms p95={p95:9.3f}ms  {fn(prefix)}')
+        finally:
+            if options['in_place'] and not options['keep']:
+                remove_seeded_data()
+                rebuild_city_popularity()
+            city_index.clear()
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.throttling import SimpleRateThrottle
+
+from weather.benchmarking import time_call
+from weather.views import search_suggestions
+from weather_portal.throttling import IPSlidingWindowRateThrottle, SlidingWindowRateThrottle
+
+User = get_user_model()
+
+
+class HistoryRateThrottle(SimpleRateThrottle):
+    """DRF's stock algorithm: a list of request timestamps per client"""
+
+    scope = 'bench'
+
+    def get_cache_key(self, request, view):
+        return 'throttle:bench-history'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the per-request cost of the sliding-window throttles against DRF\'s timestamp-history throttle, '
+        'and a suggestions request with and without throttling. Uses the API_THROTTLE_CACHE cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Throttle checks per measurement')
+        parser.add_argument('--rate', default='100000/min', help='Rate configured for the benchmark scopes')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        user = User(pk=10 ** 9, username='bench-throttle')
+        url = reverse('search_suggestions')
+        rates = {'search_suggestions': options['rate'], 'search_suggestions_ip': options['rate'],
+                 'bench': options['rate']}
+
+        def request():
+            req = factory.get(url, {'q': 'lo'})
+            req.user = user
+            req.resolver_match = resolve(url)
+            return req
+
+        with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates)):
+            HistoryRateThrottle.THROTTLE_RATES = rates
+            throttles = [
+                ('DRF timestamp history', HistoryRateThrottle),
+                ('sliding window, per user', SlidingWindowRateThrottle),
+                ('sliding window, per IP', IPSlidingWindowRateThrottle),
+            ]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'== throttle check, {options["requests"]} requests at {options["rate"]} =='
+            ))
+            for label, throttle_class in throttles:
+                req = request()
+                median, p95 = time_call(lambda: throttle_class().allow_request(req, None), options['requests'])
+                self.stdout.write(f'{label:<26} median={median * 1000:8.1f}us p95={p95 * 1000:8.1f}us')
+
+            def suggestions():
+                req = request()
+                force_authenticate(req, user=user)
+                return search_suggestions(req)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('== GET /api/weather/suggestions/ =='))
+            view = search_suggestions.cls
+            configured = view.throttle_classes
+            repeat = max(options['requests'] // 10, 1)
+            try:
+                for label, classes in [('without throttles', []), ('with throttles', configured)]:
+                    view.throttle_classes = classes
+                    median, p95 = time_call(suggestions, repeat)
+                    self.stdout.write(f'{label:<26} median={median * 1000:8.1f}us p95={p95 * 1000:8.1f}us')
+            finally:
+                view.throttle_classes = configured
@@ -0,0 +1,61 @@
+import statistics
+import time
+from contextlib import nullcontext
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from weather.testing import StubWeatherServer
+from weather.upstream import OpenWeatherClient, upstream_quota
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Compare per-call requests.get against the pooled upstream client using a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=1000)
+        parser.add_argument('--delay', type=float, default=0.0, help='Stub server latency in seconds')
+        parser.add_argument('--keep-quota', action='store_true',
+                            help='Enforce WEATHER_QUOTA (lifted by default: calls only reach the local stub)')
+
+    def handle(self, *args, **options):
+        lookups = options['lookups']
+
+        quota = nullcontext() if options['keep_quota'] else upstream_quota.lifted()
+        with quota, StubWeatherServer(delay=options['delay']) as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='bench'):
+
+            def unpooled(city):
+                response = requests.get(
+                    f'{stub.url}/weather',
+                    params={'q': city, 'appid': 'bench', 'units': 'metric'},
+                    timeout=10,
+                )
+                response.raise_for_status()
+                return response.json()
+
+            client = OpenWeatherClient()
+            self._report('requests.get (before)', self._run(unpooled, lookups))
+            self._report('pooled session (after)', self._run(client.current_weather, lookups))
+
+    def _run(self, call, lookups):
+        samples = []
+        for i in range(lookups):
+            started = time.perf_counter()
+            call(f'City {i % 50}')
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    def _report(self, label, samples):
+        self.stdout.write(
+            f'{label:<26} n={len(samples)} '
+            f'p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms '
+            f'mean={statistics.mean(samples):.2f}ms'
+        )
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from weather.benchmarking import remove_seeded_data, scratch_database, seed_searches, time_call
+from weather.models import WeatherSearch
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large WeatherSearch history, then print query plans and timings for each endpoint '
+        'query without and with the WeatherSearch access-path indexes. Runs in a throwaway database it creates '
+        'and drops, unless --in-place is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--in-place', action='store_true',
+                            help='Seed the configured database and drop and re-create its indexes there; only for '
+                                 'a database you can throw away')
+        parser.add_argument('--keep', action='store_true', help='With --in-place, keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        if options['in_place']:
+            self.run(options)
+        else:
+            with scratch_database():
+                self.run(options)
+
+    def run(self, options):
+        self.stdout.write(f'Seeding {options["rows"]} rows for {options["users"]} users...')
+        users = seed_searches(options['rows'], users=options['users'], stdout=self.stdout)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        try:
+            queries = self.endpoint_queries(users[0])
+            self.stdout.write(self.style.MIGRATE_HEADING('== Without WeatherSearch indexes =='))
+            self.set_indexes(present=False)
+            try:
+                self.report(queries, options['repeat'])
+            finally:
+                self.set_indexes(present=True)
+            self.stdout.write(self.style.MIGRATE_HEADING('== With WeatherSearch indexes =='))
+            self.report(queries, options['repeat'])
+        finally:
+            if options['in_place'] and not options['keep']:
+                remove_seeded_data()
+
+    def endpoint_queries(self, user):
+        history = WeatherSearch.objects.filter(user=user).order_by('-searched_at', '-id')
+        return {
+            'weather_history': history[:10],
+            'advanced_search history': history.filter(city__icontains='lon')[:20],
+            'analytics popular_cities': WeatherSearch.objects.filter(user=user).values('city')
+                                                           .annotate(count=Count('city')).order_by('-count')[:5],
+            'analytics last_search': history[:1],
+            'suggestions (user)': WeatherSearch.objects.filter(user=user, city__icontains='lo')
+                                                       .values_list('city', flat=True).distinct()[:5],
+            'suggestions (popular)': WeatherSearch.objects.filter(city__icontains='lo').values('city')
+                                                          .annotate(count=Count('city')).order_by('-count')[:5],
+        }
+
+    def set_indexes(self, present):
+        with connection.schema_editor() as editor:
+            for index in WeatherSearch._meta.indexes:
+                if present:
+                    editor.add_index(WeatherSearch, index)
+                else:
+                    editor.remove_index(WeatherSearch, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def report(self, queries, repeat):
+        for name, queryset in queries.items():
+            median, p95 = time_call(lambda: list(queryset.all()), repeat)
+            self.stdout.write(f'{name:<26} median={median:8.2f}ms p95={p95:8.2f}ms')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
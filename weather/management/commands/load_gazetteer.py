@@ -0,0 +1,63 @@
+import gzip
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.gazetteer import Gazetteer, Place, reset_gazetteer
+
+# Columns of a GeoNames "cities" dump (cities500.txt, cities15000.txt, ...)
+NAME, ASCIINAME, ALTERNATENAMES, FEATURE_CLASS, COUNTRY_CODE, POPULATION = 1, 2, 3, 6, 8, 14
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the offline city gazetteer used for suggestions and city validation from a GeoNames-style '
+        'TSV (e.g. cities15000.txt, optionally gzipped).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='GeoNames cities TSV (.txt or .gz)')
+        parser.add_argument('--output', help="Gazetteer file to write (default: WEATHER_GAZETTEER['PATH'])")
+        parser.add_argument('--min-population', type=int, default=0)
+        parser.add_argument('--alternate-names', action='store_true',
+                            help='Also index the alternatenames column (much larger index)')
+
+    def handle(self, *args, **options):
+        output = options['output'] or getattr(settings, 'WEATHER_GAZETTEER', {}).get('PATH')
+        if not output:
+            raise CommandError("Pass --output or set WEATHER_GAZETTEER['PATH']")
+
+        started = time.perf_counter()
+        opener = gzip.open if options['source'].endswith('.gz') else open
+        try:
+            with opener(options['source'], 'rt', encoding='utf-8') as source:
+                places = list(self.read_places(source, options['min_population'], options['alternate_names']))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["source"]}: {e}')
+
+        places.sort(key=lambda item: -item[0].population)
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        Gazetteer.write(output, places)
+        reset_gazetteer()
+        gazetteer = Gazetteer.load(output)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(places)} places ({len(gazetteer)} spellings) to {output} '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def read_places(self, lines, min_population, alternate_names):
+        for line in lines:
+            if not line.strip() or line.startswith('#'):
+                continue
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) <= POPULATION or columns[FEATURE_CLASS] != 'P':
+                continue
+            population = int(columns[POPULATION] or 0)
+            if population < min_population:
+                continue
+            spellings = [columns[NAME], columns[ASCIINAME]]
+            if alternate_names and columns[ALTERNATENAMES]:
+                spellings.extend(columns[ALTERNATENAMES].split(','))
+            yield Place(columns[NAME], columns[COUNTRY_CODE], population), spellings
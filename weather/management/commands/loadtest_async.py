@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from weather.cache import weather_cache
+from weather.recorder import search_recorder
+from weather.testing import StubWeatherServer
+from weather.upstream import upstream_guard, upstream_quota
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent lookups at the sync and async weather views against a slow local stub '
+        'and report how many upstream requests one worker keeps in flight'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--delay', type=float, default=0.5, help='Stub upstream latency in seconds')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads for the sync path')
+        parser.add_argument('--keep-quota', action='store_true',
+                            help='Enforce WEATHER_QUOTA (lifted by default: calls only reach the local stub)')
+        parser.add_argument('--keep-limit', action='store_true',
+                            help='Enforce WEATHER_CONCURRENCY_LIMIT (lifted to --requests by default, so the run '
+                                 'measures concurrency rather than rejections)')
+        parser.add_argument('--initial-limit', type=int,
+                            help='Start the adaptive concurrency limit here instead')
+        parser.add_argument('--keep-throttle', action='store_true',
+                            help='Enforce DEFAULT_THROTTLE_RATES (off by default: every request comes from one user)')
+
+    def handle(self, *args, **options):
+        name = f'loadtest-{uuid.uuid4().hex[:8]}'
+        user = User.objects.create_user(username=name, email=f'{name}@example.com')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        quota = nullcontext() if options['keep_quota'] else upstream_quota.lifted()
+        if options['initial_limit']:
+            limit = upstream_guard.limiter.lifted(options['initial_limit'])
+        elif options['keep_limit']:
+            limit = nullcontext()
+        else:
+            limit = upstream_guard.limiter.lifted(options['requests'])
+        try:
+            rest_framework = settings.REST_FRAMEWORK
+            if not options['keep_throttle']:
+                rest_framework = dict(rest_framework, DEFAULT_THROTTLE_RATES={})
+            with quota, limit, override_settings(ALLOWED_HOSTS=['*'], OPENWEATHER_API_KEY='loadtest',
+                                                 REST_FRAMEWORK=rest_framework):
+                with StubWeatherServer(delay=options['delay']) as stub, \
+                        override_settings(OPENWEATHER_API_URL=stub.url):
+                    weather_cache.clear()
+                    elapsed, statuses = self._run_sync(headers, options['requests'], options['threads'])
+                    self._report(f'sync  ({options["threads"]} threads)', options['requests'], elapsed, stub,
+                                 statuses)
+
+                with StubWeatherServer(delay=options['delay']) as stub, \
+                        override_settings(OPENWEATHER_API_URL=stub.url):
+                    weather_cache.clear()
+                    elapsed, statuses = asyncio.run(self._run_async(headers, options['requests']))
+                    self._report('async (1 event loop)', options['requests'], elapsed, stub, statuses)
+        finally:
+            # Searches recorded write-behind must reach the table before their user is deleted
+            search_recorder.flush()
+            user.delete()
+
+    def _run_sync(self, headers, requests, threads):
+        url = reverse('get_weather')
+        local = threading.local()
+
+        def call(i):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            response = local.client.get(url, {'city': f'Sync City {i}'}, headers=headers)
+            connections.close_all()
+            return response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = Counter(pool.map(call, range(requests)))
+        return time.perf_counter() - started, statuses
+
+    async def _run_async(self, headers, requests):
+        url = reverse('async_get_weather')
+        client = AsyncClient()
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.get(url, {'city': f'Async City {i}'}, headers=headers)
+            for i in range(requests)
+        ])
+        return time.perf_counter() - started, Counter(response.status_code for response in responses)
+
+    def _report(self, label, requests, elapsed, stub, statuses):
+        succeeded = sum(count for code, count in statuses.items() if 200 <= code < 300)
+        self.stdout.write(
+            f'{label:<22} requests={requests} elapsed={elapsed:.2f}s '
+            # Successful responses only: a shed lookup (503) returns fast and would inflate the rate
+            f'throughput={succeeded / elapsed:.1f} ok req/s '
+            f'peak upstream in-flight={stub.max_in_flight} upstream calls={stub.request_count} '
+            # 503s are lookups shed by the adaptive concurrency limit (WEATHER_CONCURRENCY_LIMIT)
+            f'statuses={dict(sorted(statuses.items()))}'
+        )
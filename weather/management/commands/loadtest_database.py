@@ -0,0 +1,100 @@
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test.utils import override_settings
+
+from weather.benchmarking import CITIES, DESCRIPTIONS, remove_seeded_data, seed_searches
+from weather.models import WeatherSearch
+from weather.recorder import search_recorder
+from weather_portal.database import sqlite_pragma_values
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent history reads and recorded-search writes against the configured database and report '
+        'throughput, latency and lock errors. Select the profile to measure with DB_PROFILE. Run against a '
+        'scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--batch', type=int, default=20, help='Searches per write, like a recorder flush')
+        parser.add_argument('--rows', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows afterwards')
+
+    def handle(self, *args, **options):
+        profile = getattr(settings, 'DB_PROFILE', 'sqlite')
+        settings_dict = connection.settings_dict
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'== DB_PROFILE={profile} ({connection.vendor}, CONN_MAX_AGE={settings_dict.get("CONN_MAX_AGE", 0)}) =='
+        ))
+        if connection.vendor == 'sqlite':
+            self.stdout.write(f'PRAGMAs: {sqlite_pragma_values(connection)}')
+
+        self.stdout.write(f'Seeding {options["rows"]} rows for {options["users"]} users...')
+        user_ids = [user.pk for user in seed_searches(options['rows'], users=options['users'])]
+        connections.close_all()
+        try:
+            with override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False}):
+                results = self.run(user_ids, options)
+            for kind, unit in [('read', 'pages'), ('write', 'rows')]:
+                result = results[kind]
+                latencies = sorted(result['latencies']) or [0]
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                self.stdout.write(
+                    f'{kind + "s":<7} {result["done"] / options["seconds"]:9.1f} {unit}/s '
+                    f'median={statistics.median(latencies):7.2f}ms p95={p95:7.2f}ms errors={result["errors"]}'
+                )
+        finally:
+            if not options['keep']:
+                remove_seeded_data()
+
+    def run(self, user_ids, options):
+        results = {kind: {'done': 0, 'errors': 0, 'latencies': []} for kind in ('read', 'write')}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def worker(kind, seed):
+            rng = random.Random(seed)
+            local = {'done': 0, 'errors': 0, 'latencies': []}
+            while time.perf_counter() < deadline:
+                user_id = rng.choice(user_ids)
+                started = time.perf_counter()
+                try:
+                    if kind == 'read':
+                        list(WeatherSearch.objects.filter(user_id=user_id).order_by('-searched_at', '-id')[:10])
+                        local['done'] += 1
+                    else:
+                        search_recorder.record([
+                            WeatherSearch(user_id=user_id, city=rng.choice(CITIES), country='XX',
+                                          temperature=round(rng.uniform(-15, 40), 1),
+                                          description=rng.choice(DESCRIPTIONS), humidity=rng.randint(10, 100))
+                            for _ in range(options['batch'])
+                        ])
+                        local['done'] += options['batch']
+                    local['latencies'].append((time.perf_counter() - started) * 1000)
+                except OperationalError:
+                    local['errors'] += 1
+                # End of a request: closes the connection unless CONN_MAX_AGE keeps it
+                close_old_connections()
+            connections.close_all()
+            with lock:
+                for key in ('done', 'errors'):
+                    results[kind][key] += local[key]
+                results[kind]['latencies'].extend(local['latencies'])
+
+        threads = [threading.Thread(target=worker, args=('read', i)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', 1000 + i)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.retention import open_archive, prunable_searches, prune_searches, retention_cutoff, retention_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold WeatherSearch rows older than the retention period into daily per-user, per-city summaries and '
+        'delete them in bounded batches, optionally archiving them to gzipped NDJSON first. Safe to run while '
+        'the site is serving traffic.'
+    )
+
+    def add_arguments(self, parser):
+        options = retention_options()
+        parser.add_argument('--days', type=int, default=options['DAYS'], help='Keep searches from the last N days')
+        parser.add_argument('--batch-size', type=int, default=options['BATCH_SIZE'],
+                            help='Rows rolled up and deleted per transaction')
+        parser.add_argument('--archive-dir', default=options['ARCHIVE_DIR'],
+                            help='Write pruned rows to a .ndjson.gz file in this directory (default: no archive)')
+        parser.add_argument('--pause-ms', type=int, default=0,
+                            help='Sleep between batches to leave the database to live traffic')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be pruned')
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = retention_cutoff(options['days'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        if options['dry_run']:
+            count = prunable_searches(cutoff).count()
+            self.stdout.write(f'{count} searches recorded before {cutoff:%Y-%m-%d %H:%M} would be pruned')
+            return
+
+        archive = open_archive(options['archive_dir']) if options['archive_dir'] else None
+        pruned = created = 0
+        started = time.monotonic()
+        try:
+            for rows, summaries in prune_searches(cutoff, options['batch_size'], archive):
+                pruned += rows
+                created += summaries
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  pruned {pruned} rows')
+                if options['pause_ms']:
+                    time.sleep(options['pause_ms'] / 1000)
+        finally:
+            if archive is not None:
+                archive.close()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {pruned} searches recorded before {cutoff:%Y-%m-%d %H:%M} into {created} new daily summaries '
+            f'in {elapsed:.1f}s ({pruned / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+        if archive is not None:
+            self.stdout.write(f'Archived to {archive.name}')
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from weather.analytics import invalidate_search_analytics
+from weather.rollups import rebuild_city_popularity, rebuild_user_stats
+from weather.suggest import city_index
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the per-user search analytics rollups (in chunks of users) and the global city popularity '
+        'counts behind search suggestions from the raw WeatherSearch history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of users rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        chunk_size = options['chunk_size']
+        rebuilt = 0
+        last_pk = None
+        while True:
+            chunk = user_ids.filter(pk__gt=last_pk) if last_pk is not None else user_ids
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+            rebuilt += rebuild_user_stats(chunk)
+            invalidate_search_analytics(chunk)
+            last_pk = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search stats for {rebuilt} users'))
+
+        cities = rebuild_city_popularity()
+        city_index.clear()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt popularity counts for {cities} cities'))
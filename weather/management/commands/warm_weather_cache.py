@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.cache import weather_cache
+from weather.warmer import cache_warmer, warmer_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh favorite and popular cities into the weather cache ahead of TTL expiry, '
+        'paced to stay within the upstream call quota. Runs every --interval seconds unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        options = warmer_options()
+        parser.add_argument('--once', action='store_true', help='Run a single warming pass and exit')
+        parser.add_argument('--interval', type=int, default=options['INTERVAL'], help='Seconds between passes')
+        parser.add_argument('--top-k', type=int, default=options['TOP_K'],
+                            help='Number of most searched cities to keep warm')
+        parser.add_argument('--days', type=int, default=options['DAYS'], help='Demand window in days')
+        parser.add_argument('--max-calls-per-minute', type=int, default=options['MAX_CALLS_PER_MINUTE'],
+                            help='Upstream calls the warmer may spend per minute')
+        parser.add_argument('--refresh-ahead', type=int, default=options['REFRESH_AHEAD'],
+                            help='Refresh entries expiring within this many seconds')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'WEATHER_CACHE', {}).get('BACKEND'):
+            self.stderr.write(self.style.WARNING(
+                "WEATHER_CACHE['BACKEND'] is not set: entries warmed by this process are not visible to web workers"
+            ))
+        per_minute = options['max_calls_per_minute']
+        if per_minute < 1:
+            raise CommandError('--max-calls-per-minute must be at least 1')
+        max_calls = max(1, per_minute * options['interval'] // 60)
+        while True:
+            started = time.monotonic()
+            summary = cache_warmer.run_once(
+                top_k=options['top_k'],
+                days=options['days'],
+                refresh_ahead=options['refresh_ahead'],
+                max_calls=max_calls,
+                pace=60 / per_minute,
+            )
+            self.stdout.write(
+                f"{summary['targets']} targets, {summary['due']} due: warmed {summary['warmed']} "
+                f"with {summary['calls']} calls, {summary['failed']} failed, {summary['deferred']} deferred"
+            )
+            prevented = [weather_cache.shared_counter(name) for name in ['prevented_misses', 'prevented_stale_hits']]
+            if prevented[0] is not None:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Request-path misses prevented so far: {prevented[0]} (stale hits avoided: {prevented[1]})'
+                ))
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
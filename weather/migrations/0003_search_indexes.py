@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_searched_at_default'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='weathersearch',
+            options={'ordering': ['-searched_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='weathersearch',
+            index=models.Index(fields=['user', '-searched_at', '-id'], name='weather_search_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='weathersearch',
+            index=models.Index(fields=['user', 'city'], name='weather_search_user_city'),
+        ),
+        migrations.AddIndex(
+            model_name='weathersearch',
+            index=models.Index(fields=['city'], name='weather_search_city'),
+        ),
+    ]
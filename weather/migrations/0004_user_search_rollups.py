@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    WeatherSearch = apps.get_model('weather', 'WeatherSearch')
+    UserSearchStats = apps.get_model('weather', 'UserSearchStats')
+    UserSearchTally = apps.get_model('weather', 'UserSearchTally')
+    buckets = {
+        'cold': models.Q(temperature__lt=10),
+        'cool': models.Q(temperature__gte=10, temperature__lt=20),
+        'warm': models.Q(temperature__gte=20, temperature__lt=30),
+        'hot': models.Q(temperature__gte=30),
+    }
+
+    totals = WeatherSearch.objects.values('user_id').annotate(
+        total_searches=models.Count('id'),
+        **{bucket: models.Count('id', filter=condition) for bucket, condition in buckets.items()}
+    ).order_by()
+    stats = []
+    for row in totals:
+        row['last_search_id'] = WeatherSearch.objects.filter(user_id=row['user_id']) \
+                                                     .order_by('-searched_at', '-id') \
+                                                     .values_list('id', flat=True).first()
+        stats.append(UserSearchStats(**row))
+    UserSearchStats.objects.bulk_create(stats, batch_size=1000)
+
+    for kind, field in [('city', 'city'), ('condition', 'description')]:
+        UserSearchTally.objects.bulk_create([
+            UserSearchTally(user_id=row['user_id'], kind=kind, value=row[field], count=row['count'])
+            for row in WeatherSearch.objects.values('user_id', field).annotate(count=models.Count('id')).order_by()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('weather', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_searches', models.PositiveIntegerField(default=0)),
+                ('cold', models.PositiveIntegerField(default=0)),
+                ('cool', models.PositiveIntegerField(default=0)),
+                ('warm', models.PositiveIntegerField(default=0)),
+                ('hot', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_search', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='weather.weathersearch')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserSearchTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('city', 'City'), ('condition', 'Weather condition')], max_length=10)),
+                ('value', models.CharField(max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'kind', '-count'], name='weather_tally_top')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchtally',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'value'), name='weather_tally_unique_value'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
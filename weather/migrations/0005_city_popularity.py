@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:10
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def backfill_city_popularity(apps, schema_editor):
+    WeatherSearch = apps.get_model('weather', 'WeatherSearch')
+    CityPopularity = apps.get_model('weather', 'CityPopularity')
+    counts = Counter()
+    names = {}
+    rows = WeatherSearch.objects.values('city').annotate(count=models.Count('id')).order_by('-count')
+    for row in rows:
+        key = ' '.join(row['city'].split()).casefold()
+        counts[key] += row['count']
+        names.setdefault(key, row['city'])
+    CityPopularity.objects.bulk_create([
+        CityPopularity(normalized=key, city=names[key], count=count) for key, count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_user_search_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityPopularity',
+            fields=[
+                ('normalized', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('city', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_city_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:40
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+
+
+def _load_list(raw):
+    try:
+        value = json.loads(raw) if raw else []
+    except json.JSONDecodeError:
+        return []
+    return [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
+
+
+def split_json_columns(apps, schema_editor):
+    """Move the JSON strings into weather_conditions_data and FavoriteCity rows, BATCH_SIZE filters at a time"""
+    SearchFilter = apps.get_model('weather', 'SearchFilter')
+    FavoriteCity = apps.get_model('weather', 'FavoriteCity')
+    last_pk = 0
+    while True:
+        batch = list(SearchFilter.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            break
+        favorites = []
+        for search_filter in batch:
+            search_filter.weather_conditions_data = _load_list(search_filter.weather_conditions)
+            seen = set()
+            for city in _load_list(search_filter.favorite_cities):
+                city = ' '.join(city.split())[:100]
+                key = city.casefold()
+                if city and key not in seen:
+                    seen.add(key)
+                    favorites.append(FavoriteCity(search_filter=search_filter, city=city, normalized=key,
+                                                  position=len(seen) - 1))
+        SearchFilter.objects.bulk_update(batch, ['weather_conditions_data'])
+        FavoriteCity.objects.bulk_create(favorites)
+        last_pk = batch[-1].pk
+
+
+def join_json_columns(apps, schema_editor):
+    SearchFilter = apps.get_model('weather', 'SearchFilter')
+    last_pk = 0
+    while True:
+        batch = list(SearchFilter.objects.filter(pk__gt=last_pk).order_by('pk')
+                                         .prefetch_related('favorites')[:BATCH_SIZE])
+        if not batch:
+            break
+        for search_filter in batch:
+            search_filter.weather_conditions = json.dumps(search_filter.weather_conditions_data or [])
+            search_filter.favorite_cities = json.dumps([
+                favorite.city for favorite in sorted(search_filter.favorites.all(), key=lambda f: f.position)
+            ])
+        SearchFilter.objects.bulk_update(batch, ['weather_conditions', 'favorite_cities'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0005_city_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoriteCity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('normalized', models.CharField(db_index=True, max_length=100)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('search_filter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                    related_name='favorites', to='weather.searchfilter')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='favoritecity',
+            constraint=models.UniqueConstraint(fields=('search_filter', 'normalized'),
+                                               name='weather_favorite_unique_city'),
+        ),
+        migrations.AddField(
+            model_name='searchfilter',
+            name='weather_conditions_data',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(split_json_columns, join_json_columns),
+        migrations.RemoveField(
+            model_name='searchfilter',
+            name='favorite_cities',
+        ),
+        migrations.RemoveField(
+            model_name='searchfilter',
+            name='weather_conditions',
+        ),
+        migrations.RenameField(
+            model_name='searchfilter',
+            old_name='weather_conditions_data',
+            new_name='weather_conditions',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('weather', '0006_favorite_city'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySearchSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('city', models.CharField(max_length=100)),
+                ('searches', models.PositiveIntegerField(default=0)),
+                ('cold', models.PositiveIntegerField(default=0)),
+                ('cool', models.PositiveIntegerField(default=0)),
+                ('warm', models.PositiveIntegerField(default=0)),
+                ('hot', models.PositiveIntegerField(default=0)),
+                ('min_temperature', models.FloatField()),
+                ('max_temperature', models.FloatField()),
+                ('conditions', models.JSONField(blank=True, default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysearchsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'day', 'city'), name='weather_summary_unique_day_city'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings  
+from django.utils import timezone
+
+from .cache import normalize_city
 
 
 class WeatherSearch(models.Model):
@@ -11,22 +14,40 @@ class WeatherSearch(models.Model):
     humidity = models.IntegerField()
     wind_speed = models.FloatField(default=0)
     pressure = models.FloatField(default=0)
-    searched_at = models.DateTimeField(auto_now_add=True)
+    searched_at = models.DateTimeField(default=timezone.now, editable=False)  # set when recorded, not when flushed
 
     class Meta:
-        ordering = ['-searched_at']
+        ordering = ['-searched_at', '-id']
+        indexes = [
+            models.Index(fields=['user', '-searched_at', '-id'], name='weather_search_user_recent'),
+            models.Index(fields=['user', 'city'], name='weather_search_user_city'),
+            models.Index(fields=['city'], name='weather_search_city'),
+        ]
 
     def __str__(self):
         return f"{self.city} - {self.temperature}°C"
 
+    @classmethod
+    def from_weather(cls, user_id, weather_data):
+        """Build an unsaved search row from a weather lookup result"""
+        return cls(
+            user_id=user_id,
+            city=weather_data['city'],
+            country=weather_data['country'],
+            temperature=weather_data['temperature'],
+            description=weather_data['description'],
+            humidity=weather_data['humidity'],
+            wind_speed=weather_data['wind_speed'],
+            pressure=weather_data['pressure']
+        )
+
 
 class SearchFilter(models.Model):
     """Model to store user's search preferences and filters"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     min_temperature = models.FloatField(null=True, blank=True)
     max_temperature = models.FloatField(null=True, blank=True)
-    weather_conditions = models.CharField(max_length=500, blank=True)  # JSON string of conditions
-    favorite_cities = models.CharField(max_length=1000, blank=True)  # JSON string of cities
+    weather_conditions = models.JSONField(default=list, blank=True)  # list of condition names
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -35,3 +56,112 @@ class SearchFilter(models.Model):
 
     def __str__(self):
         return f"Search filters for {self.user.username}"
+
+    @property
+    def favorite_cities(self):
+        """Favorite city names in the user's order (uses ``prefetch_related('favorites')`` when present)"""
+        return [favorite.city for favorite in self.favorites.all()]
+
+    def set_favorite_cities(self, cities):
+        """Replace the favorites with ``cities``, keeping their order and dropping repeats"""
+        favorites = {}
+        for city in cities:
+            city = ' '.join(city.split())
+            if city:
+                favorites.setdefault(normalize_city(city), city)
+        with transaction.atomic():
+            self.favorites.all().delete()
+            FavoriteCity.objects.bulk_create([
+                FavoriteCity(search_filter=self, city=city, normalized=key, position=position)
+                for position, (key, city) in enumerate(favorites.items())
+            ])
+        getattr(self, '_prefetched_objects_cache', {}).pop('favorites', None)
+
+
+class FavoriteCity(models.Model):
+    """One of a user's favorite cities; ``normalized`` finds everyone who favorites a city"""
+    search_filter = models.ForeignKey(SearchFilter, on_delete=models.CASCADE, related_name='favorites')
+    city = models.CharField(max_length=100)
+    normalized = models.CharField(max_length=100, db_index=True)
+    position = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['search_filter', 'normalized'], name='weather_favorite_unique_city'),
+        ]
+
+    def __str__(self):
+        return self.city
+
+
+class UserSearchStats(models.Model):
+    """Per-user search totals, maintained incrementally as searches are recorded"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='search_stats')
+    total_searches = models.PositiveIntegerField(default=0)
+    cold = models.PositiveIntegerField(default=0)
+    cool = models.PositiveIntegerField(default=0)
+    warm = models.PositiveIntegerField(default=0)
+    hot = models.PositiveIntegerField(default=0)
+    last_search = models.ForeignKey(WeatherSearch, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search stats for {self.user_id}"
+
+
+class UserSearchTally(models.Model):
+    """Per-user count of searches for one city or one weather condition"""
+    CITY = 'city'
+    CONDITION = 'condition'
+    KIND_CHOICES = [(CITY, 'City'), (CONDITION, 'Weather condition')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=200)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'value'], name='weather_tally_unique_value'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind', '-count'], name='weather_tally_top'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.value}: {self.count}"
+
+
+class CityPopularity(models.Model):
+    """Global search count per normalized city name, used to load search suggestions"""
+    normalized = models.CharField(max_length=100, primary_key=True)
+    city = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.city}: {self.count}"
+
+
+class DailySearchSummary(models.Model):
+    """One user's searches for one city on one day, kept once the raw WeatherSearch rows are pruned"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    day = models.DateField()
+    city = models.CharField(max_length=100)
+    searches = models.PositiveIntegerField(default=0)
+    cold = models.PositiveIntegerField(default=0)
+    cool = models.PositiveIntegerField(default=0)
+    warm = models.PositiveIntegerField(default=0)
+    hot = models.PositiveIntegerField(default=0)
+    min_temperature = models.FloatField()
+    max_temperature = models.FloatField()
+    conditions = models.JSONField(default=dict, blank=True)  # description -> number of searches
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'city'], name='weather_summary_unique_day_city'),
+        ]
+
+    def __str__(self):
+        return f"{self.city} on {self.day}: {self.searches}"
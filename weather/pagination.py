@@ -0,0 +1,89 @@
+"""
+Keyset pagination for search history, newest first.
+
+A page ends at some ``(searched_at, id)`` pair and the next page starts
+strictly after it, so every page is a range scan of the
+``weather_search_user_recent`` index however deep it is, and rows recorded
+while a client is paging neither repeat nor disappear. Responses keep the
+plain list body and advertise the next page in a ``Link: <...>; rel="next"``
+header.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(searched_at, pk):
+    return base64.urlsafe_b64encode(f'{searched_at.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(searched_at, id)`` of the last row on the previous page; raises ValidationError for a bad cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        searched_at, pk = raw.split('|')
+        return datetime.fromisoformat(searched_at), int(pk)
+    except ValueError:
+        raise ValidationError({'cursor': 'Invalid cursor'})
+
+
+class SearchHistoryPagination(BasePagination):
+    """Pages a WeatherSearch queryset by ``(searched_at, id)``, read from the ``cursor`` query parameter"""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, page_size=10, max_page_size=100):
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.next_cursor = None
+        self.request = None
+
+    def get_page_size(self, params):
+        try:
+            size = int(params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def page_queryset(self, queryset, request):
+        """``queryset`` narrowed to the requested page plus one row, which tells whether there is a next page"""
+        self.request = request
+        params = getattr(request, 'query_params', request.GET)
+        queryset = queryset.order_by('-searched_at', '-id')
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            searched_at, pk = decode_cursor(cursor)
+            # The redundant searched_at__lte bounds the index range scan; the OR alone only filters rows
+            queryset = queryset.filter(Q(searched_at__lt=searched_at) | Q(id__lt=pk), searched_at__lte=searched_at)
+        self.page_size = self.get_page_size(params)
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_cursor = encode_cursor(rows[-1].searched_at, rows[-1].pk)
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.finish_page([row async for row in self.page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_headers(self):
+        next_link = self.get_next_link()
+        return {'Link': f'<{next_link}>; rel="next"'} if next_link else {}
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
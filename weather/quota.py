@@ -0,0 +1,247 @@
+"""
+Budget of upstream calls matching the OpenWeatherMap plan.
+
+Every upstream request takes a token from ``upstream_quota`` (see
+``weather.upstream``) before it is sent. The budget has a per-minute and a
+per-day limit. Each caller runs under a priority class, set with
+``upstream_priority()``: batch jobs and the cache warmer may only spend
+tokens while a reserved share of each limit is left, which keeps that
+share for interactive lookups. A call that finds the budget exhausted raises
+QuotaExceeded without reaching the provider, and the views then serve cached
+data where they have any.
+
+``QuotaBudget`` keeps token buckets in process memory. ``SharedQuotaBudget``
+counts calls per minute and per day in a shared Django cache, so the
+limits hold across workers.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .resilience import UpstreamUnavailable
+
+INTERACTIVE, BATCH, WARMER = 'interactive', 'batch', 'warmer'
+PRIORITIES = (INTERACTIVE, BATCH, WARMER)
+
+_priority = ContextVar('upstream_priority', default=INTERACTIVE)
+
+
+class QuotaExceeded(UpstreamUnavailable):
+    """No upstream call budget is left for this priority class (locally, or the provider answered 429)"""
+
+
+@contextmanager
+def upstream_priority(priority):
+    """Run the upstream calls made inside the block (and by tasks or fan-out jobs it starts) as ``priority``"""
+    if priority not in PRIORITIES:
+        raise ValueError(f'Unknown upstream priority: {priority}')
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class TokenBucket:
+    """``capacity`` tokens, refilled continuously at ``capacity`` per ``period`` seconds"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, tokens, floor):
+        """Seconds until ``tokens`` can be taken while leaving ``floor`` tokens behind (0 when they can now)"""
+        missing = floor + tokens - self.tokens
+        return missing / self.rate if missing > 0 else 0
+
+
+class QuotaBudget:
+    """
+    In-process per-minute and per-day token buckets (a limit of 0 disables that bucket).
+
+    ``reserves`` maps each priority class to the share of every bucket it may
+    not touch: with the defaults, warmer calls stop while half of the minute's
+    budget is left and batch calls while a fifth is left, whereas interactive
+    calls may use all of it.
+    """
+
+    DEFAULT_RESERVES = {INTERACTIVE: 0, BATCH: 0.2, WARMER: 0.5}
+
+    def __init__(self, per_minute=60, per_day=0, reserves=None):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.reserves = dict(self.DEFAULT_RESERVES, **(reserves or {}))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+            if self.per_minute:
+                self._buckets['minute'] = TokenBucket(self.per_minute, 60)
+            if self.per_day:
+                self._buckets['day'] = TokenBucket(self.per_day, 86400)
+            self._paused_until = 0
+            self._counters = {'granted': dict.fromkeys(PRIORITIES, 0), 'rejected': dict.fromkeys(PRIORITIES, 0)}
+
+    def acquire(self, priority=None):
+        """Take one call from every bucket, or raise QuotaExceeded with a ``retry_after`` hint"""
+        priority = priority or current_priority()
+        with self._lock:
+            paused = self._paused_until - time.monotonic()
+            if paused > 0:
+                self._counters['rejected'][priority] += 1
+                raise QuotaExceeded('Weather provider rate limit reached', retry_after=paused)
+            waits = {}
+            for name, bucket in self._buckets.items():
+                bucket.refill()
+                waits[name] = bucket.shortfall(1, bucket.capacity * self.reserves[priority])
+            exhausted = [name for name, wait in waits.items() if wait > 0]
+            if exhausted:
+                self._counters['rejected'][priority] += 1
+                raise QuotaExceeded(f'Upstream {exhausted[0]} quota exhausted for {priority} calls',
+                                    retry_after=max(waits.values()))
+            for bucket in self._buckets.values():
+                bucket.tokens -= 1
+            self._counters['granted'][priority] += 1
+
+    @contextmanager
+    def lifted(self):
+        """Let every call through inside the block, e.g. for benchmarks against a local stub"""
+        limits = self.per_minute, self.per_day
+        self.per_minute = self.per_day = 0
+        self.reset()
+        try:
+            yield self
+        finally:
+            self.per_minute, self.per_day = limits
+            self.reset()
+
+    def refund(self):
+        """Give back a call that was acquired but never sent"""
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    def pause(self, seconds):
+        """Refuse every call for ``seconds``, after the provider itself answered 429"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + (seconds or 1))
+
+    def stats(self):
+        with self._lock:
+            snapshot = {name: dict(counts) for name, counts in self._counters.items()}
+            for name, bucket in self._buckets.items():
+                bucket.refill()
+                snapshot[f'{name}_remaining'] = int(bucket.tokens)
+            snapshot['per_minute'] = self.per_minute
+            snapshot['per_day'] = self.per_day
+        return snapshot
+
+
+class SharedQuotaBudget(QuotaBudget):
+    """
+    QuotaBudget whose counts live in the Django cache named ``backend``.
+
+    Calls are counted in fixed per-minute and per-day windows with atomic
+    ``incr``; a call that would cross a priority's share of a window is
+    taken back and rejected until the window rolls over. Rejection counters
+    stay per process.
+    """
+
+    WINDOWS = {'minute': 60, 'day': 86400}
+
+    def __init__(self, per_minute=60, per_day=0, reserves=None, backend='default', key_prefix='weather:quota:'):
+        self.backend = backend
+        self.key_prefix = key_prefix
+        super().__init__(per_minute, per_day, reserves)
+
+    def reset(self):
+        with self._lock:
+            self._counters = {'granted': dict.fromkeys(PRIORITIES, 0), 'rejected': dict.fromkeys(PRIORITIES, 0)}
+
+    @property
+    def limits(self):
+        return {name: limit for name, limit in [('minute', self.per_minute), ('day', self.per_day)] if limit}
+
+    def acquire(self, priority=None):
+        priority = priority or current_priority()
+        shared = caches[self.backend]
+        paused = (shared.get(self.key_prefix + 'paused-until') or 0) - time.time()
+        if paused > 0:
+            self._reject(priority)
+            raise QuotaExceeded('Weather provider rate limit reached', retry_after=paused)
+
+        now = time.time()
+        taken = []
+        for name, limit in self.limits.items():
+            period = self.WINDOWS[name]
+            key = f'{self.key_prefix}{name}:{int(now // period)}'
+            shared.add(key, 0, timeout=period * 2)
+            taken.append(key)
+            if shared.incr(key) > limit * (1 - self.reserves[priority]):
+                for key in taken:
+                    shared.decr(key)
+                self._reject(priority)
+                raise QuotaExceeded(f'Upstream {name} quota exhausted for {priority} calls',
+                                    retry_after=period - now % period)
+        with self._lock:
+            self._counters['granted'][priority] += 1
+
+    def refund(self):
+        shared = caches[self.backend]
+        now = time.time()
+        for name in self.limits:
+            key = f'{self.key_prefix}{name}:{int(now // self.WINDOWS[name])}'
+            try:
+                shared.decr(key)
+            except ValueError:
+                pass  # the window rolled over in the meantime
+
+    def pause(self, seconds):
+        caches[self.backend].set(self.key_prefix + 'paused-until', time.time() + (seconds or 1), timeout=seconds or 1)
+
+    def stats(self):
+        with self._lock:
+            snapshot = {name: dict(counts) for name, counts in self._counters.items()}
+        shared = caches[self.backend]
+        now = time.time()
+        for name, limit in self.limits.items():
+            used = shared.get(f'{self.key_prefix}{name}:{int(now // self.WINDOWS[name])}') or 0
+            snapshot[f'{name}_remaining'] = max(0, limit - used)
+        snapshot['per_minute'] = self.per_minute
+        snapshot['per_day'] = self.per_day
+        snapshot['backend'] = self.backend
+        return snapshot
+
+    def _reject(self, priority):
+        with self._lock:
+            self._counters['rejected'][priority] += 1
+
+
+def budget_from_settings():
+    """The QuotaBudget described by WEATHER_QUOTA: shared through its BACKEND cache when one is named"""
+    options = getattr(settings, 'WEATHER_QUOTA', {})
+    kwargs = {
+        'per_minute': options.get('PER_MINUTE', 60),
+        'per_day': options.get('PER_DAY', 0),
+        'reserves': options.get('RESERVES'),
+    }
+    if options.get('BACKEND'):
+        return SharedQuotaBudget(backend=options['BACKEND'], **kwargs)
+    return QuotaBudget(**kwargs)
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .analytics import invalidate_search_analytics
+from .models import WeatherSearch
+from .rollups import apply_city_popularity, apply_searches, deletes_counted, remove_city_popularity, remove_searches
+from .signals import searches_recorded
+from .suggest import city_index
+
+
+@receiver(post_save, sender=WeatherSearch)
+def record_saved_search(sender, instance, created, raw=False, **kwargs):
+    # The recorder writes in bulk and sends searches_recorded itself; this covers rows saved one at a time
+    if created and not raw:
+        searches_recorded.send(sender=WeatherSearch, searches=[instance])
+
+
+@receiver(searches_recorded)
+def update_rollups_on_search(sender, searches, **kwargs):
+    apply_searches(searches)
+    apply_city_popularity(searches)
+
+
+@receiver(searches_recorded)
+def update_city_index_on_search(sender, searches, **kwargs):
+    city_index.record(searches)
+
+
+@receiver(searches_recorded)
+def invalidate_analytics_on_search(sender, searches, **kwargs):
+    invalidate_search_analytics({search.user_id for search in searches})
+
+
+@receiver(post_delete, sender=WeatherSearch)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if deletes_counted():
+        remove_searches([instance])
+        remove_city_popularity([instance])
+        invalidate_search_analytics({instance.user_id})
@@ -0,0 +1,209 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+
+from .models import WeatherSearch
+from .signals import searches_recorded
+
+logger = logging.getLogger(__name__)
+
+
+class SearchRecorder:
+    """
+    Write-behind buffer for WeatherSearch history rows.
+
+    Views hand unsaved rows to ``record()``; a background thread writes them
+    with ``bulk_create`` once ``BATCH_SIZE`` rows are pending or every
+    ``FLUSH_INTERVAL_MS``. When the buffer holds ``MAX_QUEUE`` rows the
+    ``OVERFLOW`` policy applies: ``block`` waits for room (falling back to a
+    synchronous write after ``BLOCK_TIMEOUT_MS``), ``drop_oldest`` discards
+    the oldest pending row, and ``sync`` writes the new rows immediately.
+    With ``WRITE_BEHIND`` disabled every row is written synchronously.
+    """
+
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'sync')
+
+    def __init__(self):
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+        self._stopping = False
+        self._writing = 0  # batches the flusher thread has taken but not yet written
+        self._counters = dict.fromkeys(
+            ['enqueued', 'written', 'flushes', 'dropped', 'sync_writes', 'write_errors', 'receiver_errors'], 0
+        )
+        self._last_flush_ms = None
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def options(self):
+        options = {
+            'WRITE_BEHIND': True,
+            'MAX_QUEUE': 10000,
+            'BATCH_SIZE': 200,
+            'FLUSH_INTERVAL_MS': 500,
+            'OVERFLOW': 'sync',
+            'BLOCK_TIMEOUT_MS': 1000,
+        }
+        options.update(getattr(settings, 'WEATHER_RECORDER', {}))
+        if options['OVERFLOW'] not in self.OVERFLOW_POLICIES:
+            raise ImproperlyConfigured(f"WEATHER_RECORDER['OVERFLOW'] must be one of {self.OVERFLOW_POLICIES}")
+        return options
+
+    def record(self, searches):
+        """Record unsaved WeatherSearch rows"""
+        pending = self._enqueue(searches, may_block=True)
+        if pending:
+            self._write(pending, sync=True)
+
+    async def arecord(self, searches):
+        """Async variant of record(); never blocks the event loop waiting for buffer space"""
+        pending = self._enqueue(searches, may_block=False)
+        if pending:
+            await sync_to_async(self._write)(pending, sync=True)
+
+    def flush(self):
+        """
+        Write every pending row from the calling thread, then wait for a batch the flusher thread is writing.
+
+        Call it before deleting users whose searches may still be queued.
+        """
+        while True:
+            batch = self._take(self.options['BATCH_SIZE'])
+            if not batch:
+                break
+            self._write(batch)
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writing, timeout=5)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._counters)
+            snapshot['queue_depth'] = len(self._queue)
+        snapshot['last_flush_ms'] = self._last_flush_ms
+        snapshot['max_flush_ms'] = round(self._max_flush_ms, 3)
+        snapshot['avg_flush_ms'] = (
+            round(self._total_flush_ms / snapshot['flushes'], 3) if snapshot['flushes'] else None
+        )
+        return snapshot
+
+    def _enqueue(self, searches, may_block):
+        """Buffer rows according to the overflow policy; returns rows that must be written synchronously"""
+        options = self.options
+        if not options['WRITE_BEHIND']:
+            return list(searches)
+
+        pending = []
+        with self._cond:
+            for search in searches:
+                if len(self._queue) >= options['MAX_QUEUE']:
+                    if options['OVERFLOW'] == 'drop_oldest':
+                        self._queue.popleft()
+                        self._counters['dropped'] += 1
+                    elif options['OVERFLOW'] == 'block' and may_block:
+                        self._cond.notify_all()
+                        self._cond.wait_for(
+                            lambda: len(self._queue) < options['MAX_QUEUE'],
+                            timeout=options['BLOCK_TIMEOUT_MS'] / 1000,
+                        )
+                    if len(self._queue) >= options['MAX_QUEUE']:
+                        pending.append(search)
+                        continue
+                self._queue.append(search)
+                self._counters['enqueued'] += 1
+
+            if len(self._queue) >= options['BATCH_SIZE']:
+                self._cond.notify_all()
+        if self._queue:
+            self._ensure_flusher()
+        return pending
+
+    def _take(self, limit, writing=False):
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(limit, len(self._queue)))]
+            if batch and writing:
+                self._writing += 1
+            self._cond.notify_all()
+        return batch
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='weather-search-recorder', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            options = self.options
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._queue) >= options['BATCH_SIZE'],
+                    timeout=options['FLUSH_INTERVAL_MS'] / 1000,
+                )
+                if self._stopping:
+                    return
+            batch = self._take(options['BATCH_SIZE'], writing=True)
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    with self._cond:
+                        self._writing -= 1
+                        self._cond.notify_all()
+                close_old_connections()
+
+    def _write(self, batch, sync=False):
+        started = time.perf_counter()
+        try:
+            WeatherSearch.objects.bulk_create(batch)
+        except Exception:
+            logger.exception('Failed to write %d weather searches', len(batch))
+            with self._cond:
+                self._counters['write_errors'] += 1
+            if sync:
+                raise
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self._counters['written'] += len(batch)
+            self._counters['sync_writes' if sync else 'flushes'] += 1
+            if not sync:
+                self._last_flush_ms = round(elapsed_ms, 3)
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+        # The rows are committed: a failing receiver (rollups, analytics) must neither stop the flusher
+        # thread nor fail the request that wrote them synchronously
+        for receiver, result in searches_recorded.send_robust(sender=WeatherSearch, searches=batch):
+            if isinstance(result, Exception):
+                logger.error('searches_recorded receiver %r failed for %d weather searches', receiver, len(batch),
+                             exc_info=result)
+                with self._cond:
+                    self._counters['receiver_errors'] += 1
+
+
+search_recorder = SearchRecorder()
+atexit.register(search_recorder.shutdown)
@@ -0,0 +1,337 @@
+"""
+Protection for the portal against a degraded upstream provider.
+
+``CircuitBreaker`` tracks upstream calls over a rolling window and opens
+when too many of them fail or are slow, so lookups fail fast instead of
+each holding a worker for the full timeout. ``AdaptiveLimiter`` caps the
+number of concurrent upstream calls with an AIMD limit that grows while
+calls are fast and shrinks when they fail or slow down. Both are applied
+by ``UpstreamGuard`` around every request made by the upstream clients
+(see ``weather.upstream.upstream_guard``).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream call was refused locally; ``retry_after`` is a hint in seconds"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class ConcurrencyLimitExceeded(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker over a rolling window.
+
+    Calls are counted in one-second buckets covering ``window`` seconds. Once
+    the window holds ``min_calls`` calls and either the failure rate reaches
+    ``failure_rate`` or the share of calls slower than ``slow_call_ms``
+    reaches ``slow_rate``, the breaker opens and rejects calls for
+    ``open_seconds``. It then lets ``half_open_calls`` trial calls through:
+    if they all succeed it closes, and any failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, window=30, min_calls=20, failure_rate=0.5, slow_call_ms=3000, slow_rate=0.8,
+                 open_seconds=30, half_open_calls=3):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_CIRCUIT_BREAKER', {})
+        return cls(
+            window=options.get('WINDOW', 30),
+            min_calls=options.get('MIN_CALLS', 20),
+            failure_rate=options.get('FAILURE_RATE', 0.5),
+            slow_call_ms=options.get('SLOW_CALL_MS', 3000),
+            slow_rate=options.get('SLOW_RATE', 0.8),
+            open_seconds=options.get('OPEN_SECONDS', 30),
+            half_open_calls=options.get('HALF_OPEN_CALLS', 3),
+        )
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._buckets = deque()
+            self._opened_at = None
+            self._trials_started = 0
+            self._trials_passed = 0
+            self._counters = dict.fromkeys(['opened', 'rejected'], 0)
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go upstream now"""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self._counters['rejected'] += 1
+                    raise CircuitOpen('Weather provider circuit is open', retry_after=remaining)
+                self._state = self.HALF_OPEN
+                self._trials_started = self._trials_passed = 0
+            if self._state == self.HALF_OPEN:
+                if self._trials_started >= self.half_open_calls:
+                    self._counters['rejected'] += 1
+                    raise CircuitOpen('Weather provider circuit is half-open', retry_after=1)
+                self._trials_started += 1
+
+    def record(self, success, elapsed_ms):
+        slow = elapsed_ms >= self.slow_call_ms
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if success and not slow:
+                    self._trials_passed += 1
+                    if self._trials_passed >= self.half_open_calls:
+                        self._state = self.CLOSED
+                        self._buckets.clear()
+                else:
+                    self._open()
+                return
+            if self._state == self.OPEN:
+                return
+
+            now = int(time.monotonic())
+            if not self._buckets or self._buckets[-1][0] != now:
+                self._buckets.append([now, 0, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += not success
+            bucket[3] += slow
+            calls, failures, slow_calls = self._window_totals(now)
+            if calls >= self.min_calls and (failures / calls >= self.failure_rate or
+                                            slow_calls / calls >= self.slow_rate):
+                self._open()
+
+    def stats(self):
+        with self._lock:
+            calls, failures, slow_calls = self._window_totals(int(time.monotonic()))
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'state': self._state,
+                'window_calls': calls,
+                'window_failure_rate': round(failures / calls, 4) if calls else None,
+                'window_slow_rate': round(slow_calls / calls, 4) if calls else None,
+            })
+        return snapshot
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._buckets.clear()
+        self._counters['opened'] += 1
+
+    def _window_totals(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        return tuple(sum(bucket[i] for bucket in self._buckets) for i in (1, 2, 3))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent upstream calls.
+
+    A call that would exceed the current limit waits up to ``queue_ms`` for a
+    slot to free up and is then rejected. Each fast successful call made while
+    the limit is at least half used raises the limit by ``1 / limit`` (about
+    +1 per limit's worth of calls); a failed call, or one slower than
+    ``latency_ms``, multiplies it by ``backoff``.
+    """
+
+    POLL_INTERVAL = 0.01  # seconds between slot checks while a coroutine waits
+
+    def __init__(self, initial=20, min_limit=2, max_limit=200, latency_ms=2000, backoff=0.9, queue_ms=0):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_ms = latency_ms
+        self.backoff = backoff
+        self.queue_ms = queue_ms
+        self._cond = threading.Condition()
+        self.reset()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_CONCURRENCY_LIMIT', {})
+        return cls(
+            initial=options.get('INITIAL', 20),
+            min_limit=options.get('MIN', 2),
+            max_limit=options.get('MAX', 200),
+            latency_ms=options.get('LATENCY_MS', 2000),
+            backoff=options.get('BACKOFF', 0.9),
+            queue_ms=options.get('QUEUE_MS', 0),
+        )
+
+    def reset(self):
+        with self._cond:
+            self._limit = float(self.initial)
+            self._in_flight = 0
+            self._max_in_flight = 0
+            self._counters = dict.fromkeys(['rejected', 'increases', 'decreases'], 0)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lifted(self, limit=None):
+        """Start the block at ``limit`` (default ``max_limit``), e.g. for load tests against a local stub"""
+        configured = self.initial, self.max_limit
+        self.initial = limit or self.max_limit
+        self.max_limit = max(self.max_limit, self.initial)
+        self.reset()
+        try:
+            yield self
+        finally:
+            self.initial, self.max_limit = configured
+            self.reset()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def _take_slot(self):
+        # Called with _cond held
+        if self._in_flight >= int(self._limit):
+            return False
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        return True
+
+    def _reject(self):
+        self._counters['rejected'] += 1
+        raise ConcurrencyLimitExceeded('Too many concurrent weather provider requests', retry_after=1)
+
+    def acquire(self):
+        with self._cond:
+            if not self._cond.wait_for(self._take_slot, timeout=self.queue_ms / 1000):
+                self._reject()
+
+    async def aacquire(self):
+        """acquire() for coroutines, polling for a slot instead of blocking the event loop"""
+        deadline = time.monotonic() + self.queue_ms / 1000
+        while True:
+            with self._cond:
+                if self._take_slot():
+                    return
+                if time.monotonic() >= deadline:
+                    self._reject()
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def release(self, success, elapsed_ms):
+        with self._cond:
+            in_flight = self._in_flight
+            self._in_flight = max(0, in_flight - 1)
+            if not success or elapsed_ms >= self.latency_ms:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._counters['decreases'] += 1
+            elif in_flight * 2 >= self._limit:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                self._counters['increases'] += 1
+            self._cond.notify()
+
+    def cancel(self):
+        """Give back a slot that was acquired but never used"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'max_in_flight': self._max_in_flight,
+            })
+        return snapshot
+
+
+class UpstreamGuard:
+    """
+    Runs upstream calls through a CircuitBreaker and an AdaptiveLimiter.
+
+    Exceptions of ``failure_types`` count as failures; anything else the call
+    returns or raises (e.g. "city not found") means the provider answered.
+    """
+
+    def __init__(self, breaker, limiter, failure_types=(Exception,)):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.failure_types = failure_types
+
+    @classmethod
+    def from_settings(cls, failure_types=(Exception,)):
+        return cls(CircuitBreaker.from_settings(), AdaptiveLimiter.from_settings(), failure_types)
+
+    def call(self, fn):
+        self._enter()
+        started = time.perf_counter()
+        success = False
+        try:
+            result = fn()
+            success = True
+            return result
+        except Exception as e:
+            success = not isinstance(e, self.failure_types)
+            raise
+        finally:
+            self._exit(success, started)
+
+    async def acall(self, fn):
+        await self.limiter.aacquire()
+        self._check_breaker()
+        started = time.perf_counter()
+        success = False
+        try:
+            result = await fn()
+            success = True
+            return result
+        except Exception as e:
+            success = not isinstance(e, self.failure_types)
+            raise
+        finally:
+            self._exit(success, started)
+
+    def reset(self):
+        self.breaker.reset()
+        self.limiter.reset()
+
+    def stats(self):
+        return {'breaker': self.breaker.stats(), 'limiter': self.limiter.stats()}
+
+    def _enter(self):
+        self.limiter.acquire()
+        self._check_breaker()
+
+    def _check_breaker(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self.limiter.cancel()
+            raise
+
+    def _exit(self, success, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.limiter.release(success, elapsed_ms)
+        self.breaker.record(success, elapsed_ms)
+
@@ -0,0 +1,154 @@
+"""
+Retention for the raw WeatherSearch history.
+
+Searches older than the retention period are folded into DailySearchSummary
+rows (one per user, day and city), optionally written to a gzipped NDJSON
+archive, and deleted. Each batch is rolled up and deleted in one short
+transaction, so the site keeps serving and recording searches while a prune
+runs, and an interrupted run loses nothing.
+
+The rollups behind analytics and suggestions (UserSearchStats,
+UserSearchTally, CityPopularity) keep counting the pruned searches, which
+live on in the summaries: the delete runs under ``rollups_unchanged()``,
+and ``weather.rollups`` adds the summaries back in when it rebuilds them.
+Each user's latest search is never pruned, because
+UserSearchStats.last_search points at it.
+"""
+import gzip
+from collections import Counter, defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DailySearchSummary, UserSearchStats, WeatherSearch
+from .rollups import rollups_unchanged, temperature_bucket
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'city', 'country', 'temperature', 'description', 'humidity', 'wind_speed',
+                  'pressure', 'searched_at']
+SUMMARY_FIELDS = ['searches', 'cold', 'cool', 'warm', 'hot', 'conditions', 'min_temperature', 'max_temperature']
+
+
+def retention_options():
+    """WEATHER_RETENTION merged over the defaults"""
+    options = {'DAYS': 90, 'BATCH_SIZE': 1000, 'ARCHIVE_DIR': ''}
+    options.update(getattr(settings, 'WEATHER_RETENTION', {}))
+    return options
+
+
+def retention_cutoff(days=None, now=None):
+    days = retention_options()['DAYS'] if days is None else days
+    if days < 1:
+        raise ValueError('Retention must be at least one day')
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def prunable_searches(cutoff):
+    """Searches recorded before ``cutoff``, except each user's latest"""
+    latest = UserSearchStats.objects.filter(last_search__isnull=False).values('last_search_id')
+    return WeatherSearch.objects.filter(searched_at__lt=cutoff).exclude(id__in=latest)
+
+
+def open_archive(directory, now=None):
+    """A new gzipped NDJSON file in ``directory`` for one prune run"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = (now or timezone.now()).strftime('%Y%m%dT%H%M%S')
+    return gzip.open(directory / f'weather-searches-{stamp}.ndjson.gz', 'xt', encoding='utf-8')
+
+
+def _summarize(rows):
+    summaries = {}
+    for row in rows:
+        key = (row['user_id'], timezone.localdate(row['searched_at']), row['city'])
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = {
+                'searches': 0, 'buckets': Counter(), 'conditions': Counter(),
+                'min_temperature': row['temperature'], 'max_temperature': row['temperature'],
+            }
+        summary['searches'] += 1
+        summary['buckets'][temperature_bucket(row['temperature'])] += 1
+        summary['conditions'][row['description']] += 1
+        summary['min_temperature'] = min(summary['min_temperature'], row['temperature'])
+        summary['max_temperature'] = max(summary['max_temperature'], row['temperature'])
+    return summaries
+
+
+def _merge(summary, added):
+    summary.searches += added['searches']
+    for bucket, amount in added['buckets'].items():
+        setattr(summary, bucket, getattr(summary, bucket) + amount)
+    conditions = Counter(summary.conditions)
+    conditions.update(added['conditions'])
+    summary.conditions = dict(conditions)
+    summary.min_temperature = min(summary.min_temperature, added['min_temperature'])
+    summary.max_temperature = max(summary.max_temperature, added['max_temperature'])
+
+
+def prune_batch(rows, archive=None):
+    """
+    Fold ``rows`` (dicts of ARCHIVE_FIELDS) into their daily summaries and delete them.
+
+    Rows are written to ``archive`` first, so a batch that then fails
+    appears in the archive and is archived again by the next run; archive
+    readers should de-duplicate on ``id``.
+    """
+    if archive is not None:
+        encoder = DjangoJSONEncoder()
+        archive.writelines(encoder.encode(row) + '\n' for row in rows)
+        archive.flush()
+
+    summaries = _summarize(rows)
+    with transaction.atomic():
+        existing = {}
+        by_user = defaultdict(lambda: (set(), set()))
+        for user_id, day, city in summaries:
+            by_user[user_id][0].add(day)
+            by_user[user_id][1].add(city)
+        # Per user, so a batch spanning many users and days does not read their whole summary history
+        for user_id, (days, cities) in by_user.items():
+            for summary in DailySearchSummary.objects.select_for_update().filter(user_id=user_id, day__in=days,
+                                                                                 city__in=cities):
+                existing[summary.user_id, summary.day, summary.city] = summary
+        changed, created = [], []
+        for key, added in summaries.items():
+            summary = existing.get(key)
+            if summary is None:
+                user_id, day, city = key
+                summary = DailySearchSummary(user_id=user_id, day=day, city=city,
+                                             min_temperature=added['min_temperature'],
+                                             max_temperature=added['max_temperature'])
+                created.append(summary)
+            else:
+                changed.append(summary)
+            _merge(summary, added)
+        for summary in changed:
+            summary.save(update_fields=SUMMARY_FIELDS)
+        DailySearchSummary.objects.bulk_create(created, batch_size=500)
+        with rollups_unchanged():
+            WeatherSearch.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        # The counts stand, but the history changed: a new updated_at changes its ETag (see views.history_version)
+        UserSearchStats.objects.filter(user_id__in=by_user).update(updated_at=timezone.now())
+    return len(created)
+
+
+def prune_searches(cutoff, batch_size=None, archive=None):
+    """
+    Prune every prunable search before ``cutoff``, yielding ``(rows, summaries_created)`` per batch.
+
+    Batches walk the primary key, so the whole run reads the table once
+    rather than rescanning it for each batch.
+    """
+    batch_size = batch_size or retention_options()['BATCH_SIZE']
+    searches = prunable_searches(cutoff).order_by('id').values(*ARCHIVE_FIELDS)
+    last_id = 0
+    while True:
+        rows = list(searches.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield len(rows), prune_batch(rows, archive)
@@ -0,0 +1,223 @@
+"""
+Maintenance of the UserSearchStats / UserSearchTally rollups that back
+search_analytics: incremental updates as searches are recorded or deleted,
+and a from-scratch rebuild used by the rebuild_search_stats command.
+Rebuilds count both the raw WeatherSearch history and the DailySearchSummary
+rows left by pruning (see weather.retention).
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .analytics import TEMPERATURE_BUCKETS
+from .cache import normalize_city
+from .models import CityPopularity, DailySearchSummary, UserSearchStats, UserSearchTally, WeatherSearch
+
+
+_deletes_counted = ContextVar('rollups_deletes_counted', default=True)
+
+
+@contextmanager
+def rollups_unchanged():
+    """Delete WeatherSearch rows inside the block without taking them out of the rollups"""
+    token = _deletes_counted.set(False)
+    try:
+        yield
+    finally:
+        _deletes_counted.reset(token)
+
+
+def deletes_counted():
+    return _deletes_counted.get()
+
+
+def temperature_bucket(temperature):
+    if temperature < 10:
+        return 'cold'
+    if temperature < 20:
+        return 'cool'
+    if temperature < 30:
+        return 'warm'
+    return 'hot'
+
+
+def _increment_tally(user_id, kind, value, amount):
+    updated = UserSearchTally.objects.filter(user_id=user_id, kind=kind, value=value).update(count=F('count') + amount)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            UserSearchTally.objects.create(user_id=user_id, kind=kind, value=value, count=amount)
+    except IntegrityError:
+        # Created concurrently by another writer
+        UserSearchTally.objects.filter(user_id=user_id, kind=kind, value=value).update(count=F('count') + amount)
+
+
+def locked_user_stats():
+    """
+    UserSearchStats with their last search, locking only the stats rows.
+
+    ``last_search`` is nullable, so it is joined with a LEFT OUTER JOIN, and
+    PostgreSQL refuses to lock the nullable side of an outer join.
+    """
+    return UserSearchStats.objects.select_for_update(of=('self',)).select_related('last_search')
+
+
+def apply_searches(searches):
+    """Add newly recorded searches to their users' rollups"""
+    by_user = defaultdict(list)
+    for search in searches:
+        by_user[search.user_id].append(search)
+
+    for user_id, user_searches in by_user.items():
+        buckets = Counter(temperature_bucket(search.temperature) for search in user_searches)
+        latest = max(user_searches, key=lambda search: (search.searched_at, search.pk or 0))
+
+        with transaction.atomic():
+            stats, _ = locked_user_stats().get_or_create(user_id=user_id)
+            UserSearchStats.objects.filter(pk=stats.pk).update(
+                total_searches=F('total_searches') + len(user_searches),
+                **{bucket: F(bucket) + amount for bucket, amount in buckets.items()}
+            )
+            current = stats.last_search
+            if current is None or (latest.searched_at, latest.pk or 0) >= (current.searched_at, current.pk):
+                if latest.pk is None:
+                    # Backends that do not return primary keys from bulk_create
+                    latest = WeatherSearch.objects.filter(user_id=user_id).order_by('-searched_at', '-id').first()
+                UserSearchStats.objects.filter(pk=stats.pk).update(last_search=latest)
+
+            for city, amount in Counter(search.city for search in user_searches).items():
+                _increment_tally(user_id, UserSearchTally.CITY, city, amount)
+            for description, amount in Counter(search.description for search in user_searches).items():
+                _increment_tally(user_id, UserSearchTally.CONDITION, description, amount)
+
+
+def _decrement_tally(user_id, kind, value, amount):
+    tallies = UserSearchTally.objects.filter(user_id=user_id, kind=kind, value=value)
+    tallies.update(count=F('count') - amount)
+    tallies.filter(count__lte=0).delete()
+
+
+def remove_searches(searches):
+    """Take deleted searches out of their users' rollups"""
+    by_user = defaultdict(list)
+    for search in searches:
+        by_user[search.user_id].append(search)
+
+    for user_id, user_searches in by_user.items():
+        buckets = Counter(temperature_bucket(search.temperature) for search in user_searches)
+        with transaction.atomic():
+            UserSearchStats.objects.filter(user_id=user_id).update(
+                total_searches=F('total_searches') - len(user_searches),
+                **{bucket: F(bucket) - amount for bucket, amount in buckets.items()}
+            )
+            # Deleting the latest search has already cleared last_search (SET_NULL); point it at the one before
+            latest = WeatherSearch.objects.filter(user_id=user_id).order_by('-searched_at', '-id').first()
+            if latest is not None:
+                UserSearchStats.objects.filter(user_id=user_id, last_search__isnull=True).update(last_search=latest)
+
+            for city, amount in Counter(search.city for search in user_searches).items():
+                _decrement_tally(user_id, UserSearchTally.CITY, city, amount)
+            for description, amount in Counter(search.description for search in user_searches).items():
+                _decrement_tally(user_id, UserSearchTally.CONDITION, description, amount)
+
+
+def remove_city_popularity(searches):
+    """Take deleted searches out of the global per-city counts"""
+    for key, amount in Counter(normalize_city(search.city) for search in searches).items():
+        cities = CityPopularity.objects.filter(normalized=key)
+        cities.update(count=F('count') - amount)
+        cities.filter(count__lte=0).delete()
+
+
+def apply_city_popularity(searches):
+    """Add newly recorded searches to the global per-city counts"""
+    added = Counter()
+    names = {}
+    for search in searches:
+        key = normalize_city(search.city)
+        added[key] += 1
+        names.setdefault(key, search.city)
+
+    for key, amount in added.items():
+        if CityPopularity.objects.filter(normalized=key).update(count=F('count') + amount):
+            continue
+        try:
+            with transaction.atomic():
+                CityPopularity.objects.create(normalized=key, city=names[key], count=amount)
+        except IntegrityError:
+            CityPopularity.objects.filter(normalized=key).update(count=F('count') + amount)
+
+
+def rebuild_city_popularity():
+    """Recompute the global per-city counts from the WeatherSearch history and pruned daily summaries"""
+    spellings = Counter()
+    for row in WeatherSearch.objects.values('city').annotate(count=Count('id')).order_by():
+        spellings[row['city']] += row['count']
+    for row in DailySearchSummary.objects.values('city').annotate(count=Sum('searches')).order_by():
+        spellings[row['city']] += row['count']
+
+    counts = Counter()
+    names = {}
+    for city, count in spellings.most_common():
+        key = normalize_city(city)
+        counts[key] += count
+        # Most searched spelling wins
+        names.setdefault(key, city)
+
+    with transaction.atomic():
+        CityPopularity.objects.all().delete()
+        CityPopularity.objects.bulk_create([
+            CityPopularity(normalized=key, city=names[key], count=count) for key, count in counts.items()
+        ], batch_size=1000)
+    return len(counts)
+
+
+def rebuild_user_stats(user_ids):
+    """Recompute the rollups for ``user_ids`` from their WeatherSearch history and pruned daily summaries"""
+    searches = WeatherSearch.objects.filter(user_id__in=user_ids)
+    summaries = DailySearchSummary.objects.filter(user_id__in=user_ids)
+    buckets = list(TEMPERATURE_BUCKETS)
+
+    totals = defaultdict(Counter)
+    for row in searches.values('user_id').annotate(
+        total_searches=Count('id'),
+        **{bucket: Count('id', filter=condition) for bucket, condition in TEMPERATURE_BUCKETS.items()}
+    ).order_by():
+        totals[row.pop('user_id')].update(row)
+    for row in summaries.values('user_id').annotate(
+        total_searches=Sum('searches'), **{bucket: Sum(bucket) for bucket in buckets}
+    ).order_by():
+        totals[row.pop('user_id')].update(row)
+
+    stats = []
+    for user_id, row in totals.items():
+        last_search_id = WeatherSearch.objects.filter(user_id=user_id).order_by('-searched_at', '-id') \
+                                              .values_list('id', flat=True).first()
+        stats.append(UserSearchStats(user_id=user_id, last_search_id=last_search_id,
+                                     total_searches=row['total_searches'],
+                                     **{bucket: row[bucket] for bucket in buckets}))
+
+    tally_counts = Counter()
+    for kind, field in [(UserSearchTally.CITY, 'city'), (UserSearchTally.CONDITION, 'description')]:
+        for row in searches.values('user_id', field).annotate(count=Count('id')).order_by():
+            tally_counts[row['user_id'], kind, row[field]] += row['count']
+    for row in summaries.values('user_id', 'city').annotate(count=Sum('searches')).order_by():
+        tally_counts[row['user_id'], UserSearchTally.CITY, row['city']] += row['count']
+    for user_id, conditions in summaries.values_list('user_id', 'conditions').iterator():
+        for description, count in conditions.items():
+            tally_counts[user_id, UserSearchTally.CONDITION, description] += count
+    tallies = [
+        UserSearchTally(user_id=user_id, kind=kind, value=value, count=count)
+        for (user_id, kind, value), count in tally_counts.items()
+    ]
+
+    with transaction.atomic():
+        UserSearchStats.objects.filter(user_id__in=user_ids).delete()
+        UserSearchTally.objects.filter(user_id__in=user_ids).delete()
+        UserSearchStats.objects.bulk_create(stats)
+        UserSearchTally.objects.bulk_create(tallies, batch_size=1000)
+    return len(stats)
@@ -1,6 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
+from .cache import normalize_city
 from .models import WeatherSearch, SearchFilter
-import json
 
 
 class WeatherSearchSerializer(serializers.ModelSerializer):
@@ -11,51 +12,26 @@ class WeatherSearchSerializer(serializers.ModelSerializer):
 
 
 class SearchFilterSerializer(serializers.ModelSerializer):
-    weather_conditions = serializers.SerializerMethodField()
-    favorite_cities = serializers.SerializerMethodField()
+    weather_conditions = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    favorite_cities = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
 
     class Meta:
         model = SearchFilter
         fields = ['id', 'min_temperature', 'max_temperature', 'weather_conditions', 'favorite_cities', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-    def get_weather_conditions(self, obj):
-        if obj.weather_conditions:
-            try:
-                return json.loads(obj.weather_conditions)
-            except json.JSONDecodeError:
-                return []
-        return []
-
-    def get_favorite_cities(self, obj):
-        if obj.favorite_cities:
-            try:
-                return json.loads(obj.favorite_cities)
-            except json.JSONDecodeError:
-                return []
-        return []
-
     def create(self, validated_data):
-        # Handle JSON fields
-        weather_conditions = self.initial_data.get('weather_conditions', [])
-        favorite_cities = self.initial_data.get('favorite_cities', [])
-        
-        validated_data['weather_conditions'] = json.dumps(weather_conditions)
-        validated_data['favorite_cities'] = json.dumps(favorite_cities)
-        
-        return super().create(validated_data)
+        favorite_cities = validated_data.pop('favorite_cities', [])
+        instance = super().create(validated_data)
+        instance.set_favorite_cities(favorite_cities)
+        return instance
 
     def update(self, instance, validated_data):
-        # Handle JSON fields
-        weather_conditions = self.initial_data.get('weather_conditions', instance.weather_conditions)
-        favorite_cities = self.initial_data.get('favorite_cities', instance.favorite_cities)
-        
-        if isinstance(weather_conditions, list):
-            validated_data['weather_conditions'] = json.dumps(weather_conditions)
-        if isinstance(favorite_cities, list):
-            validated_data['favorite_cities'] = json.dumps(favorite_cities)
-        
-        return super().update(instance, validated_data)
+        favorite_cities = validated_data.pop('favorite_cities', None)
+        instance = super().update(instance, validated_data)
+        if favorite_cities is not None:
+            instance.set_favorite_cities(favorite_cities)
+        return instance
 
 
 class WeatherSearchRequestSerializer(serializers.Serializer):
@@ -66,3 +42,18 @@ class WeatherSearchRequestSerializer(serializers.Serializer):
     weather_condition = serializers.CharField(max_length=100, required=False)
     country = serializers.CharField(max_length=100, required=False)
     search_type = serializers.ChoiceField(choices=['current', 'history', 'favorites'], default='current')
+
+
+class WeatherBatchRequestSerializer(serializers.Serializer):
+    """Serializer for batch weather requests; de-duplicates cities by normalized name"""
+    cities = serializers.ListField(child=serializers.CharField(max_length=100), allow_empty=False)
+
+    def validate_cities(self, value):
+        unique = {}
+        for city in value:
+            unique.setdefault(normalize_city(city), city.strip())
+
+        max_cities = getattr(settings, 'WEATHER_BATCH', {}).get('MAX_CITIES', 20)
+        if len(unique) > max_cities:
+            raise serializers.ValidationError(f'At most {max_cities} distinct cities per request')
+        return list(unique.values())
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after WeatherSearch rows have been written, with ``searches`` holding the saved instances.
+# The recorder writes rows in bulk, so post_save does not fire for them; rows saved one at a time
+# (admin, shell, tests) are forwarded here from post_save by weather.receivers.
+searches_recorded = Signal()
@@ -0,0 +1,124 @@
+"""
+Global half of search suggestions: the most searched cities whose
+normalized name starts with what the user has typed.
+
+``CityPrefixIndex`` keeps every known city in a sorted list of normalized
+names with their search counts, loaded from the CityPopularity table and
+bumped in place as searches are recorded, so a lookup is a binary search
+plus a short scan. With several workers each index only sees its own
+worker's searches until it reloads; set ``REFRESH_SECONDS`` to reload
+periodically, or ``BACKEND = 'table'`` to query CityPopularity directly.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+
+from .cache import normalize_city
+from .models import CityPopularity
+
+
+def _options():
+    options = {'BACKEND': 'memory', 'REFRESH_SECONDS': 0, 'LIMIT': 5}
+    options.update(getattr(settings, 'WEATHER_SUGGESTIONS', {}))
+    return options
+
+
+class CityPrefixIndex:
+    def __init__(self):
+        self._keys = None
+        self._cities = {}
+        self._counts = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._counters = dict.fromkeys(['lookups', 'loads'], 0)
+
+    def load(self):
+        """(Re)build the index from the CityPopularity table"""
+        rows = CityPopularity.objects.values_list('normalized', 'city', 'count')
+        cities, counts = {}, {}
+        for normalized, city, count in rows.iterator(chunk_size=2000):
+            cities[normalized] = city
+            counts[normalized] = count
+        with self._lock:
+            self._keys = sorted(cities)
+            self._cities = cities
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+            self._counters['loads'] += 1
+
+    def ensure_loaded(self, refresh_seconds=0):
+        if self._needs_load(refresh_seconds):
+            with self._load_lock:
+                if self._needs_load(refresh_seconds):
+                    self.load()
+
+    def _needs_load(self, refresh_seconds):
+        loaded_at = self._loaded_at
+        return loaded_at is None or (refresh_seconds and time.monotonic() - loaded_at >= refresh_seconds)
+
+    def suggest(self, query, limit=5):
+        """Return up to ``limit`` city names starting with ``query``, most searched first"""
+        prefix = normalize_city(query)
+        with self._lock:
+            keys, counts, cities = self._keys or [], self._counts, self._cities
+            self._counters['lookups'] += 1
+        matches = []
+        for key in keys[bisect_left(keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            matches.append(key)
+        top = heapq.nsmallest(limit, matches, key=lambda key: (-counts[key], key))
+        return [cities[key] for key in top]
+
+    def record(self, searches):
+        """Count newly recorded searches; a no-op until the index has been loaded"""
+        if self._keys is None:
+            return
+        added = Counter(search.city for search in searches)
+        with self._lock:
+            for city, amount in added.items():
+                key = normalize_city(city)
+                if key not in self._counts:
+                    # Copy so lookups that took a reference to the old list are unaffected
+                    keys = list(self._keys)
+                    insort(keys, key)
+                    self._keys = keys
+                    self._cities[key] = city
+                    self._counts[key] = 0
+                self._counts[key] += amount
+
+    def clear(self):
+        with self._lock:
+            self._keys = None
+            self._cities = {}
+            self._counts = {}
+            self._loaded_at = None
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['cities'] = len(self._keys) if self._keys is not None else None
+            snapshot['age_seconds'] = round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None
+        return snapshot
+
+
+def popular_cities(query, limit=None):
+    """Most searched cities (across all users) whose name starts with ``query``"""
+    options = _options()
+    limit = limit or options['LIMIT']
+    if options['BACKEND'] == 'table':
+        prefix = normalize_city(query)
+        # Range scan on the primary key; normalized names are already casefolded
+        return list(CityPopularity.objects.filter(normalized__gte=prefix, normalized__lt=prefix + '\U0010ffff')
+                                          .order_by('-count', 'normalized')
+                                          .values_list('city', flat=True)[:limit])
+    city_index.ensure_loaded(options['REFRESH_SECONDS'])
+    return city_index.suggest(query, limit)
+
+
+city_index = CityPrefixIndex()
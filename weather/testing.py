@@ -0,0 +1,108 @@
+"""
+Local stand-in for the OpenWeatherMap API, used by tests and benchmark commands.
+"""
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def stub_observation(city: str, temperature=15.5):
+    return {
+        'id': zlib.crc32(city.casefold().encode()) % 10_000_000,
+        'name': city.title(),
+        'main': {'temp': temperature, 'humidity': 70, 'pressure': 1013},
+        'weather': [{'description': 'scattered clouds'}],
+        'sys': {'country': 'GB'},
+        'wind': {'speed': 5.2},
+    }
+
+
+class StubWeatherServer:
+    """
+    Threaded HTTP server answering ``/weather?q=<city>`` and ``/group?id=<ids>``
+    like OpenWeatherMap (group lookups only know cities already requested).
+
+    ``delay`` adds latency to every response. ``request_count`` counts upstream
+    calls and ``max_in_flight`` records the highest observed concurrency.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.request_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cities_by_id = {}
+        self.paths = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, params):
+        """Return ``(status, payload)`` for a request; override to change behaviour"""
+        if path.endswith('/weather') and params.get('q'):
+            observation = stub_observation(params['q'][0])
+            self.cities_by_id[observation['id']] = params['q'][0]
+            return 200, observation
+        if path.endswith('/group') and params.get('id'):
+            ids = [int(city_id) for city_id in params['id'][0].split(',')]
+            observations = [stub_observation(self.cities_by_id[i]) for i in ids if i in self.cities_by_id]
+            return 200, {'cnt': len(observations), 'list': observations}
+        return 404, {'cod': '404', 'message': 'city not found'}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.request_count += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    parsed = urlparse(self.path)
+                    with stub._lock:
+                        stub.paths[parsed.path.rsplit('/', 1)[-1]] += 1
+                    status, payload = stub.respond(parsed.path, parse_qs(parsed.query))
+                    body = json.dumps(payload).encode()
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,15 +1,64 @@
+import asyncio
+import csv
+import gzip
+import json
 import os
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import status
 from unittest.mock import patch, Mock
-from .models import WeatherSearch
+from .analytics import build_search_analytics, get_search_analytics, read_search_analytics
+from .cache import WeatherCache, weather_cache
+from .async_views import _gather_weather
+from .coalesce import AsyncSingleFlight, SingleFlight
+from .fanout import fan_out
+from .gazetteer import UnknownCity, get_gazetteer, reset_gazetteer, resolve_city
+from .models import (CityPopularity, DailySearchSummary, FavoriteCity, WeatherSearch, SearchFilter, UserSearchStats,
+                     UserSearchTally)
+from .recorder import SearchRecorder, search_recorder
+from .rollups import locked_user_stats
+from .signals import searches_recorded
+from .suggest import city_index
+from .testing import StubWeatherServer
+from .quota import BATCH, WARMER, QuotaBudget, QuotaExceeded, upstream_priority
+from .resilience import AdaptiveLimiter, CircuitBreaker, ConcurrencyLimitExceeded
+from .upstream import JitteredRetry, OpenWeatherClient, city_ids, failed_lookups, upstream_client, upstream_guard, upstream_quota
+from .views import lookup_weather, lookup_weather_many
+from weather_portal.database import database_settings, sqlite_pragma_values
+from weather_portal.throttling import SlidingWindowRateThrottle
+from .warmer import CacheWarmer, warm_targets
 
 User = get_user_model()
 
 
+def reset_weather_state():
+    weather_cache.clear()
+    city_ids.clear()
+    city_index.clear()
+    failed_lookups.clear()
+    upstream_guard.reset()
+    upstream_quota.reset()
+    cache.clear()  # analytics payloads and throttle counters
+
+
 class WeatherSearchModelTest(TestCase):
     def setUp(self):
         test_password = os.getenv("TEST_USER_PASSWORD", "testpass123")  # safer than hardcoding
@@ -32,6 +81,7 @@ class WeatherSearchModelTest(TestCase):
         self.assertEqual(weather_search.user, self.user)
 
 
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
 class WeatherAPITest(APITestCase):
     def setUp(self):
         test_password = os.getenv("TEST_USER_PASSWORD", "testpass123")
@@ -41,8 +91,9 @@ class WeatherAPITest(APITestCase):
             password=test_password
         )
         self.client.force_authenticate(user=self.user)
+        reset_weather_state()
 
-    @patch('weather.views.requests.get')
+    @patch('weather.upstream.requests.Session.get')
     def test_get_weather_success(self, mock_get):
         # Mock the OpenWeatherMap API response
         mock_response = Mock()
@@ -96,3 +147,1430 @@ class WeatherAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)
         self.assertEqual(response.data[0]['city'], 'Paris')  # Most recent first
+
+
+class WeatherCacheTest(TestCase):
+    def test_hit_after_miss(self):
+        cache = WeatherCache(ttl=60, stale_ttl=60)
+        fetcher = Mock(return_value={'city': 'London', 'temperature': 15.5})
+
+        first = cache.get('London', fetcher)
+        second = cache.get('  london ', fetcher)
+
+        self.assertEqual(first, second)
+        fetcher.assert_called_once()
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_stale_entry_served_while_refreshing(self):
+        cache = WeatherCache(ttl=0, stale_ttl=60)
+        refreshed = threading.Event()
+        calls = []
+
+        def fetcher(city):
+            calls.append(city)
+            if len(calls) > 1:
+                refreshed.set()
+            return {'city': 'London', 'temperature': len(calls)}
+
+        cache.get('London', fetcher)
+        stale = cache.get('London', fetcher)
+
+        self.assertEqual(stale['temperature'], 1)
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+    def test_lru_eviction(self):
+        cache = WeatherCache(max_entries=2)
+        for city in ['London', 'Paris', 'Tokyo']:
+            cache.set(city, {'city': city})
+
+        self.assertIsNone(cache.peek('London'))
+        self.assertIsNotNone(cache.peek('Tokyo'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        reset_weather_state()
+
+    def test_concurrent_lookups_share_one_upstream_call(self):
+        with StubWeatherServer(delay=0.3) as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            barrier = threading.Barrier(100)
+            results = []
+
+            def worker():
+                barrier.wait()
+                results.append(lookup_weather('London'))
+
+            threads = [threading.Thread(target=worker) for _ in range(100)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(stub.request_count, 1)
+        self.assertEqual(len(results), 100)
+        self.assertTrue(all(result['city'] == 'London' for result in results))
+
+    def test_followers_receive_leader_error(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def failing_fetch():
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream down')
+
+        def call():
+            try:
+                flight.do('london', failing_fetch)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for _ in range(5)]
+        for thread in followers:
+            thread.start()
+        while flight.stats()['followers'] < 5:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(errors), 6)
+        self.assertEqual(flight.stats()['leaders'], 1)
+
+
+    def test_async_follower_survives_cancelled_leader(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append('london')
+            await asyncio.sleep(0.05)
+            return 'weather'
+
+        async def scenario():
+            leader = asyncio.ensure_future(flight.do('london', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do('london', fetch))
+            await asyncio.sleep(0)
+            leader.cancel()  # as _gather_weather does at its deadline
+            return await follower, leader.cancelled()
+
+        self.assertEqual(asyncio.run(scenario()), ('weather', True))
+        self.assertEqual(calls, ['london'])
+
+    def test_gather_reports_cancelled_lookup_as_timeout(self):
+        async def lookup(city):
+            if city == 'Paris':
+                raise asyncio.CancelledError
+            return {'city': city}
+
+        outcomes = asyncio.run(_gather_weather(['London', 'Paris'], lookup))
+        self.assertEqual(outcomes, [('London', 'ok', {'city': 'London'}), ('Paris', 'timeout', None)])
+
+
+class FlakyStubWeatherServer(StubWeatherServer):
+    failures = 1
+
+    def respond(self, path, params):
+        if self.request_count <= self.failures:
+            return 503, {'cod': '503', 'message': 'service unavailable'}
+        return super().respond(path, params)
+
+
+class OpenWeatherClientTest(TestCase):
+    def test_retries_server_errors_on_pooled_session(self):
+        client = OpenWeatherClient(retries=2, backoff_factor=0)
+        with FlakyStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            data = client.current_weather('Paris')
+            client.current_weather('Paris')
+
+        self.assertEqual(data['city'], 'Paris')
+        self.assertEqual(stub.request_count, 3)
+        self.assertIs(client.session, client.session)
+
+
+class BrokenCityStubWeatherServer(StubWeatherServer):
+    broken_city = 'Brokenville'
+
+    def respond(self, path, params):
+        if params.get('q', [''])[0] == self.broken_city:
+            return 500, {'cod': '500', 'message': 'internal error'}
+        if params.get('q', [''])[0].strip().casefold() == 'atlantis':
+            return 404, {'cod': '404', 'message': 'city not found'}
+        return super().respond(path, params)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class FailedLookupTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+
+    def test_not_found_is_404_and_cached(self):
+        with BrokenCityStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            for _ in range(3):
+                response = self.client.get(reverse('get_weather'), {'city': ' atlantis '})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data['error'], 'Unknown city:  atlantis ')
+
+            response = self.client.post(reverse('batch_weather'), {'cities': ['Atlantis', 'Paris']}, format='json')
+
+        self.assertEqual([result['status'] for result in response.data['results']], ['unknown', 'ok'])
+        self.assertEqual(stub.paths['weather'], 2)
+        self.assertEqual(failed_lookups.stats()['not_found_hits'], 3)
+
+    def test_upstream_errors_are_502_and_cached_briefly(self):
+        with BrokenCityStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            for _ in range(2):
+                response = self.client.get(reverse('get_weather'), {'city': 'Brokenville'})
+                self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+            requests_made = stub.request_count
+
+            with patch('weather.upstream.time.time', return_value=time.time() + failed_lookups.error_ttl + 1):
+                response = self.client.get(reverse('get_weather'), {'city': 'Brokenville'})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        # The first lookup (and its retries) went upstream, the second was answered from the negative cache
+        self.assertEqual(failed_lookups.stats()['error_hits'], 1)
+        self.assertGreater(stub.request_count, requests_made)
+
+
+class SwitchableStubWeatherServer(StubWeatherServer):
+    failing = False
+
+    def respond(self, path, params):
+        if self.failing:
+            return 503, {'cod': '503', 'message': 'service unavailable'}
+        return super().respond(path, params)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class UpstreamGuardTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+        self.url = reverse('get_weather')
+        # No retries, so each failing lookup is exactly one upstream request
+        for patcher in [patch.object(upstream_client, 'retries', 0), patch.object(upstream_client, '_session', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_breaker_opens_on_errors_then_fails_fast_or_serves_stale(self):
+        breaker = CircuitBreaker(min_calls=4, failure_rate=0.5, open_seconds=30, half_open_calls=1)
+        with patch.object(upstream_guard, 'breaker', breaker), SwitchableStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            london = self.client.get(self.url, {'city': 'London'}).data
+            # Long past the stale-while-revalidate window
+            weather_cache.set('London', london, fetched_at=time.time() - 10 ** 6)
+
+            stub.failing = True
+            for city in ['Paris', 'Madrid', 'Berlin']:
+                self.assertEqual(self.client.get(self.url, {'city': city}).status_code, status.HTTP_502_BAD_GATEWAY)
+            self.assertEqual(breaker.stats()['state'], 'open')
+            requests_made = stub.request_count
+
+            response = self.client.get(self.url, {'city': 'Rome'})
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response['Retry-After'], '30')
+
+            response = self.client.get(self.url, {'city': 'London'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data['stale'])
+            self.assertGreaterEqual(response.data['age_seconds'], 10 ** 6)
+            self.assertEqual(stub.request_count, requests_made)
+
+            stub.failing = False
+            with patch('weather.resilience.time.monotonic', return_value=time.monotonic() + 31):
+                response = self.client.get(self.url, {'city': 'Rome'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(breaker.stats()['state'], 'closed')
+
+    def test_breaker_opens_on_slow_calls(self):
+        breaker = CircuitBreaker(min_calls=2, slow_call_ms=20, slow_rate=0.5)
+        client = OpenWeatherClient(retries=0)
+        with patch.object(upstream_guard, 'breaker', breaker), StubWeatherServer(delay=0.05) as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            client.current_weather('Paris')
+            client.current_weather('Oslo')
+            self.assertEqual(breaker.stats()['state'], 'open')
+            self.assertEqual(self.client.get(self.url, {'city': 'Rome'}).status_code,
+                             status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        self.assertEqual(stub.request_count, 2)
+
+    def test_limiter_sheds_excess_and_adapts(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, latency_ms=100, backoff=0.5)
+        limiter.acquire()
+        limiter.acquire()
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            limiter.acquire()
+
+        limiter.release(success=True, elapsed_ms=10)
+        # Only grows while the limit is at least half used
+        limiter.release(success=True, elapsed_ms=10)
+        self.assertEqual(limiter.stats()['increases'], 1)
+        self.assertEqual(limiter.limit, 2)
+
+        limiter.acquire()
+        limiter.release(success=True, elapsed_ms=500)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+        limiter.acquire()
+        with patch.object(upstream_guard, 'limiter', limiter):
+            response = self.client.get(self.url, {'city': 'Oslo'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+    def test_limiter_waits_briefly_for_a_slot(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_ms=1000)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release, kwargs={'success': True, 'elapsed_ms': 10}).start()
+        limiter.acquire()  # gets the slot released while it waits
+
+        async def acquire_when_released():
+            asyncio.get_running_loop().call_later(0.05, limiter.release, True, 10)
+            await limiter.aacquire()
+
+        asyncio.run(acquire_when_released())
+        limiter.queue_ms = 50
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            limiter.acquire()
+        with self.assertRaises(ConcurrencyLimitExceeded):
+            asyncio.run(limiter.aacquire())
+        self.assertEqual(limiter.stats()['rejected'], 2)
+
+    def test_lifted_limiter_restores_configured_limit(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=10)
+        with limiter.lifted(50):
+            for _ in range(50):
+                limiter.acquire()
+        self.assertEqual((limiter.limit, limiter.max_limit, limiter.stats()['in_flight']), (2, 10, 0))
+
+
+class RateLimitedStubWeatherServer(StubWeatherServer):
+    limited = False
+
+    def respond(self, path, params):
+        if self.limited:
+            return 429, {'cod': 429, 'message': 'rate limit exceeded'}
+        return super().respond(path, params)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class UpstreamQuotaTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+        self.url = reverse('get_weather')
+        for patcher in [patch.object(upstream_client, 'retries', 0), patch.object(upstream_client, '_session', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_lower_priorities_leave_reserve_for_interactive_calls(self):
+        budget = QuotaBudget(per_minute=10)
+        granted = {}
+        for priority in [WARMER, BATCH, 'interactive']:
+            granted[priority] = 0
+            with upstream_priority(priority):
+                with self.assertRaises(QuotaExceeded):
+                    while True:
+                        budget.acquire()
+                        granted[priority] += 1
+
+        self.assertEqual(granted, {WARMER: 5, BATCH: 3, 'interactive': 2})
+        self.assertEqual(budget.stats()['minute_remaining'], 0)
+
+    def test_lifted_budget_lets_every_call_through(self):
+        budget = QuotaBudget(per_minute=1)
+        with budget.lifted():
+            for _ in range(5):
+                budget.acquire()
+        budget.acquire()
+        with self.assertRaises(QuotaExceeded):
+            budget.acquire()
+
+    def test_exhausted_budget_serves_cached_data(self):
+        with patch('weather.upstream.upstream_quota', QuotaBudget(per_minute=1)), StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            london = self.client.get(self.url, {'city': 'London'}).data
+            # Long past the stale-while-revalidate window
+            weather_cache.set('London', london, fetched_at=time.time() - 10 ** 6)
+
+            fallback = self.client.get(self.url, {'city': 'London'})
+            uncached = self.client.get(self.url, {'city': 'Paris'})
+
+        self.assertEqual(fallback.status_code, status.HTTP_200_OK)
+        self.assertTrue(fallback.data['stale'])
+        self.assertEqual(uncached.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', uncached)
+        self.assertEqual(stub.request_count, 1)
+
+    def test_batch_priority_reaches_fan_out_jobs(self):
+        budget = QuotaBudget(per_minute=5)
+        cities = ['London', 'Paris', 'Tokyo', 'Rome', 'Oslo', 'Lima']
+        with patch('weather.upstream.upstream_quota', budget), StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = self.client.post(reverse('batch_weather'), {'cities': cities}, format='json')
+
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses.count('ok'), 4)
+        self.assertEqual(stub.request_count, 4)
+        self.assertEqual(budget.stats()['rejected'][BATCH], 2)
+
+    def test_provider_429_pauses_upstream_calls(self):
+        budget = QuotaBudget(per_minute=100)
+        with patch('weather.upstream.upstream_quota', budget), RateLimitedStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            stub.limited = True
+            first = self.client.get(self.url, {'city': 'London'})
+            second = self.client.get(self.url, {'city': 'Paris'})
+
+        self.assertEqual(first.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(second.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(stub.request_count, 1)
+        self.assertEqual(upstream_guard.breaker.stats()['window_failure_rate'], 0)
+
+    def test_provider_429_is_not_retried(self):
+        with patch.object(upstream_client, 'retries', 2), patch.object(upstream_client, '_session', None), \
+                patch('weather.upstream.upstream_quota', QuotaBudget(per_minute=100)), \
+                RateLimitedStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            stub.limited = True
+            response = self.client.get(self.url, {'city': 'London'})
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(stub.request_count, 1)
+
+    def test_retry_after_sleep_is_capped(self):
+        retry = JitteredRetry(total=2)
+        self.assertEqual(retry.get_retry_after(Mock(headers={'Retry-After': '120'})), JitteredRetry.MAX_RETRY_AFTER)
+        self.assertEqual(retry.get_retry_after(Mock(headers={'Retry-After': '1'})), 1)
+
+
+class SlowCityStubWeatherServer(StubWeatherServer):
+    slow_city = 'Slowville'
+
+    def respond(self, path, params):
+        if params.get('q', [''])[0] == self.slow_city:
+            time.sleep(2)
+        return super().respond(path, params)
+
+
+class FavoritesFanOutTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+
+    def test_partial_results_keep_favorite_order(self):
+        SearchFilter.objects.create(user=self.user).set_favorite_cities(['Paris', 'Slowville', 'London'])
+        with SlowCityStubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key',
+                                  WEATHER_FANOUT={'DEADLINE': 0.5}):
+            started = time.monotonic()
+            response = self.client.post(reverse('advanced_search'), {'search_type': 'favorites'}, format='json')
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual([item['city'] for item in response.data], ['Paris', 'London'])
+        self.assertEqual(response['X-City-Status'], 'Paris=ok, Slowville=timeout, London=ok')
+        self.assertEqual(response['X-Partial-Results'], 'true')
+
+    def test_one_call_holds_a_bounded_share_of_the_pool(self):
+        started = []
+
+        def slow(key):
+            started.append(key)
+            time.sleep(0.3)
+            return key
+
+        results = fan_out(['a', 'b', 'c', 'd', 'e'], slow, deadline=0.1, max_in_flight=2)
+        time.sleep(0.4)
+
+        self.assertEqual([result.status for result in results], ['timeout'] * 5)
+        self.assertEqual(sorted(started), ['a', 'b'])
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class SearchFiltersTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+        self.url = reverse('search_filters')
+
+    def test_filters_round_trip_as_lists(self):
+        created = self.client.post(self.url, {
+            'min_temperature': 5,
+            'weather_conditions': ['Rain', 'Snow'],
+            'favorite_cities': ['Paris', ' london ', 'London', 'Tokyo'],
+        }, format='json')
+        updated = self.client.put(self.url, {'favorite_cities': ['Tokyo', 'Paris']}, format='json')
+
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(created.data['weather_conditions'], ['Rain', 'Snow'])
+        self.assertEqual(created.data['favorite_cities'], ['Paris', 'london', 'Tokyo'])
+        self.assertEqual(updated.data['favorite_cities'], ['Tokyo', 'Paris'])
+        self.assertEqual(updated.data['weather_conditions'], ['Rain', 'Snow'])
+        self.assertEqual(
+            list(FavoriteCity.objects.filter(normalized='paris').values_list('search_filter__user', flat=True)),
+            [self.user.pk]
+        )
+
+    def test_get_query_counts(self):
+        SearchFilter.objects.create(user=self.user, weather_conditions=['Clear']) \
+                            .set_favorite_cities(['Oslo', 'Rome', 'Lima'])
+        # ETag lookup, then the filter and its favorites
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.data['favorite_cities'], ['Oslo', 'Rome', 'Lima'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_rejects_non_list_favorites(self):
+        response = self.client.post(self.url, {'favorite_cities': 'Paris'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchHistoryPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+        searched_at = timezone.now()
+        # Pairs of rows share a timestamp, so pages have to break ties on id
+        WeatherSearch.objects.bulk_create([
+            WeatherSearch(user=self.user, city=f'City {i}', temperature=i, description='Clear', humidity=50,
+                          searched_at=searched_at - timedelta(minutes=i // 2))
+            for i in range(25)
+        ])
+        self.expected = list(WeatherSearch.objects.order_by('-searched_at', '-id').values_list('id', flat=True))
+
+    def test_history_pages_follow_link_header(self):
+        seen, url, params = [], reverse('weather_history'), {'page_size': 7}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data)
+            url, params = response.get('Link', '').partition('>')[0][1:] or None, None
+            # Rows recorded mid-way are newer than the cursor and must not shift later pages
+            WeatherSearch.objects.create(user=self.user, city='New', temperature=1, description='Clear', humidity=1)
+
+        self.assertEqual(seen, self.expected)
+
+    def test_history_defaults_to_ten_rows(self):
+        response = self.client.get(reverse('weather_history'))
+        self.assertEqual([item['id'] for item in response.data], self.expected[:10])
+        self.assertIn('rel="next"', response['Link'])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('weather_history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_advanced_search_history_is_paginated(self):
+        url = reverse('advanced_search')
+        first = self.client.post(url, {'search_type': 'history'}, format='json')
+        cursor = first['Link'].split('cursor=')[1].split('>')[0]
+        second = self.client.post(f'{url}?cursor={cursor}', {'search_type': 'history'}, format='json')
+
+        self.assertEqual([item['id'] for item in first.data], self.expected[:20])
+        self.assertEqual([item['id'] for item in second.data], self.expected[20:])
+        self.assertNotIn('Link', second)
+
+    def test_export_streams_full_history(self):
+        response = self.client.get(reverse('export_weather_history'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['id'] for row in rows], self.expected)
+
+        response = self.client.get(reverse('export_weather_history'), {'output': 'csv'})
+        lines = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(lines[0][:2], ['id', 'city'])
+        self.assertEqual([int(line[0]) for line in lines[1:]], self.expected)
+
+        response = self.client.get(reverse('export_weather_history'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class ConditionalRequestTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+
+    def test_weather_revalidates_without_upstream_call(self):
+        url = reverse('get_weather')
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            first = self.client.get(url, {'city': 'London'})
+            revalidated = self.client.get(url, {'city': 'London'}, HTTP_IF_NONE_MATCH=first['ETag'])
+            upstream_calls = stub.request_count
+            searches = WeatherSearch.objects.filter(user=self.user).count()
+            weather_cache.set('London', dict(first.data), fetched_at=time.time() - weather_cache.ttl - 1)
+            stale = self.client.get(url, {'city': 'London'}, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(revalidated['ETag'], first['ETag'])
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', first['Vary'])
+        # The revalidated lookup is recorded like the first one
+        self.assertEqual(searches, 2)
+        self.assertEqual(UserSearchStats.objects.get(user=self.user).total_searches, 3)
+        # A stale entry must reach the view so it gets refreshed
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+        self.assertEqual(upstream_calls, 1)
+
+    def test_history_etag_changes_with_new_search(self):
+        url = reverse('weather_history')
+        WeatherSearch.objects.create(user=self.user, city='London', temperature=15, description='Clear', humidity=70)
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        WeatherSearch.objects.create(user=self.user, city='Paris', temperature=18, description='Clear', humidity=60)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(changed.data), 2)
+
+    def test_analytics_revalidates_from_cached_payload(self):
+        url = reverse('search_analytics')
+        search_recorder.record([
+            WeatherSearch(user=self.user, city='Oslo', temperature=2, description='Snow', humidity=80)
+        ])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(first['Cache-Control'], 'private, max-age=60')
+
+    def test_history_and_export_revalidate_from_rollup_in_one_query(self):
+        WeatherSearch.objects.create(user=self.user, city='London', temperature=15, description='Clear', humidity=70)
+        history = self.client.get(reverse('weather_history'))
+        export = self.client.get(reverse('export_weather_history'), {'output': 'csv'})
+        b''.join(export.streaming_content)
+
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(reverse('weather_history'), HTTP_IF_NONE_MATCH=history['ETag'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(reverse('export_weather_history'), {'output': 'csv'},
+                                          HTTP_IF_NONE_MATCH=export['ETag'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(export['Cache-Control'], 'private, no-cache')
+
+        WeatherSearch.objects.get().delete()
+        self.assertEqual(self.client.get(reverse('export_weather_history'), {'output': 'csv'},
+                                         HTTP_IF_NONE_MATCH=export['ETag']).status_code, status.HTTP_200_OK)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class TokenUserViewsTest(APITestCase):
+    """Weather views must work with the claims-backed user of StatelessJWTAuthentication"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=TokenUser(AccessToken.for_user(self.user)))
+        reset_weather_state()
+
+    def test_search_filters_and_history(self):
+        created = self.client.post(reverse('search_filters'), {'favorite_cities': ['Oslo']}, format='json')
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            weather = self.client.get(reverse('get_weather'), {'city': 'London'})
+            favorites = self.client.post(reverse('advanced_search'), {'search_type': 'favorites'}, format='json')
+        history = self.client.get(reverse('weather_history'))
+
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(SearchFilter.objects.get().user, self.user)
+        self.assertEqual(weather.status_code, status.HTTP_200_OK)
+        self.assertEqual(favorites.status_code, status.HTTP_200_OK)
+        self.assertEqual(favorites.data[0]['city'], 'Oslo')
+        self.assertEqual([item['city'] for item in history.data], ['London'])
+        self.assertEqual(self.client.get(reverse('search_analytics')).data['total_searches'], 1)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class AsyncWeatherViewsTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        reset_weather_state()
+
+    async def test_async_get_weather_records_search(self):
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = await AsyncClient().get(reverse('async_get_weather'), {'city': 'London'}, headers=self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['city'], 'London')
+        self.assertEqual(await WeatherSearch.objects.filter(user=self.user).acount(), 1)
+
+    async def test_async_batch_deduplicates_cities(self):
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = await AsyncClient().post(
+                reverse('async_batch_weather'),
+                {'cities': ['London', 'london ', 'Paris']},
+                content_type='application/json',
+                headers=self.auth
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['city'] for item in response.json()['results']], ['London', 'Paris'])
+        self.assertEqual(stub.request_count, 2)
+
+    async def test_async_favorites_keep_list_shape(self):
+        await sync_to_async(lambda: SearchFilter.objects.create(user=self.user).set_favorite_cities(['Oslo', 'Paris']))()
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = await AsyncClient().post(
+                reverse('async_advanced_search'),
+                {'search_type': 'favorites'},
+                content_type='application/json',
+                headers=self.auth
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['city'] for item in response.json()], ['Oslo', 'Paris'])
+        self.assertEqual(response['X-City-Status'], 'Oslo=ok, Paris=ok')
+        self.assertEqual(response['X-Partial-Results'], 'false')
+
+    async def test_async_views_require_authentication(self):
+        response = await AsyncClient().get(reverse('async_get_weather'), {'city': 'London'})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class BatchWeatherTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+
+    def test_batch_serves_cached_and_fetches_misses(self):
+        weather_cache.set('Paris', {
+            'city': 'Paris', 'temperature': 18.0, 'description': 'Sunny', 'humidity': 60,
+            'country': 'FR', 'wind_speed': 3.0, 'pressure': 1015,
+        })
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = self.client.post(
+                reverse('batch_weather'), {'cities': ['London', 'paris', 'Tokyo', ' LONDON']}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['city'], item['status'], item['cache']) for item in response.data['results']],
+            [('London', 'ok', 'miss'), ('paris', 'ok', 'hit'), ('Tokyo', 'ok', 'miss')]
+        )
+        self.assertEqual(stub.request_count, 2)
+        self.assertEqual(WeatherSearch.objects.filter(user=self.user).count(), 3)
+
+    @override_settings(WEATHER_BATCH={'MAX_CITIES': 2})
+    def test_batch_rejects_too_many_cities(self):
+        response = self.client.post(reverse('batch_weather'), {'cities': ['London', 'Paris', 'Tokyo']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class GroupRefreshTest(TestCase):
+    def setUp(self):
+        reset_weather_state()
+
+    def test_known_cities_refresh_through_group_endpoint(self):
+        cities = [f'City {i}' for i in range(25)]
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            first = lookup_weather_many(cities)
+            weather_cache.clear()
+            second = lookup_weather_many(cities)
+
+        self.assertTrue(all(result['status'] == 'ok' for result in first + second))
+        self.assertEqual([result['weather']['city'] for result in second], [city.title() for city in cities])
+        self.assertEqual(stub.paths['weather'], 25)
+        self.assertEqual(stub.paths['group'], 2)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class CacheWarmerTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+        self.warmer = CacheWarmer()
+
+    def test_rejects_less_than_one_call_per_minute(self):
+        with self.assertRaises(CommandError):
+            call_command('warm_weather_cache', once=True, max_calls_per_minute=0, stdout=StringIO(), stderr=StringIO())
+        with override_settings(WEATHER_WARMER={'MAX_CALLS_PER_MINUTE': 0}), self.assertRaises(ImproperlyConfigured):
+            self.warmer.run_once()
+
+    def test_targets_are_favorites_and_popular_cities(self):
+        SearchFilter.objects.create(user=self.user).set_favorite_cities(['Oslo', 'london'])
+        for city in ['London', 'London', 'Paris', 'Tokyo']:
+            WeatherSearch.objects.create(user=self.user, city=city, temperature=10, description='Clear', humidity=50)
+
+        self.assertEqual(warm_targets(top_k=2, days=7), ['london', 'Oslo', 'Paris'])
+
+    def test_warmed_entry_prevents_request_path_miss(self):
+        SearchFilter.objects.create(user=self.user).set_favorite_cities(['London', 'Paris'])
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            london = lookup_weather('London')
+            # Expired beyond the stale window: the next read would be a miss
+            weather_cache.set('London', london, fetched_at=time.time() - 10 ** 6)
+
+            summary = self.warmer.run_once(max_calls=10, pace=0)
+            requests_made = stub.request_count
+            response = self.client.get(reverse('get_weather'), {'city': 'London'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(summary['warmed'], 2)
+        self.assertEqual(summary['calls'], 2)
+        self.assertEqual(stub.request_count, requests_made)
+        stats = weather_cache.stats()
+        self.assertEqual(stats['prevented_misses'], 1)
+        self.assertEqual(stats['warmed'], 2)
+
+        # Fresh entries are not refreshed again
+        self.assertEqual(self.warmer.run_once(max_calls=10, pace=0)['calls'], 0)
+
+    def test_calls_stay_within_budget(self):
+        SearchFilter.objects.create(user=self.user).set_favorite_cities(['Oslo', 'Paris', 'Rome', 'Tokyo', 'Lima'])
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            summary = self.warmer.run_once(max_calls=2, pace=0)
+
+        self.assertEqual(stub.request_count, 2)
+        self.assertEqual(summary['warmed'], 2)
+        self.assertEqual(summary['deferred'], 3)
+
+
+def throttle_rates(**rates):
+    return dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates)
+
+
+class ThrottleTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        reset_weather_state()
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(search_suggestions='3/min'))
+    def test_endpoint_limited_per_user(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='otherpass123')
+        url = reverse('search_suggestions')
+        self.client.force_authenticate(user=self.user)
+        codes = [self.client.get(url, {'q': 'lo'}).status_code for _ in range(4)]
+        throttled = self.client.get(url, {'q': 'lo'})
+        self.client.force_authenticate(user=other)
+        other_user = self.client.get(url, {'q': 'lo'})
+
+        self.assertEqual(codes, [200, 200, 200, 429])
+        self.assertGreaterEqual(int(throttled['Retry-After']), 1)
+        self.assertEqual(other_user.status_code, status.HTTP_200_OK)
+        # Endpoints without a configured rate are not throttled
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('weather_history')).status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(search_suggestions_ip='2/min'))
+    def test_endpoint_limited_per_ip_across_users(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='otherpass123')
+        codes = []
+        for user in [self.user, other, other]:
+            self.client.force_authenticate(user=user)
+            codes.append(self.client.get(reverse('search_suggestions'), {'q': 'lo'}).status_code)
+
+        self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(search_suggestions_ip='2/min'))
+    def test_forwarded_for_ignored_without_trusted_proxies(self):
+        self.client.force_authenticate(user=self.user)
+        codes = [
+            self.client.get(reverse('search_suggestions'), {'q': 'lo'}, HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(get_weather='10/min'))
+    def test_previous_window_is_weighted_by_overlap(self):
+        now = [30.0]
+        request = RequestFactory().get('/api/weather/', {'city': 'London'})
+        request.user = self.user
+        request.resolver_match = Mock(url_name='get_weather')
+
+        def allowed():
+            throttle = SlidingWindowRateThrottle()
+            throttle.timer = lambda: now[0]
+            return throttle.allow_request(request, None)
+
+        self.assertEqual(sum(allowed() for _ in range(12)), 10)
+        # Halfway through the next window, half of the previous window's requests still count
+        now[0] = 90.0
+        self.assertEqual(sum(allowed() for _ in range(10)), 5)
+        now[0] = 121.0
+        self.assertTrue(allowed())
+
+
+class SearchRecorderTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.recorder = SearchRecorder()
+        self.addCleanup(self.recorder.shutdown)
+
+    def make_search(self, city='London'):
+        return WeatherSearch(user=self.user, city=city, temperature=15.5, description='Cloudy', humidity=70)
+
+    @override_settings(WEATHER_RECORDER={'BATCH_SIZE': 100, 'FLUSH_INTERVAL_MS': 60000})
+    def test_rows_are_buffered_until_flush(self):
+        received = []
+
+        def receiver(sender, searches, **kwargs):
+            received.extend(searches)
+
+        searches_recorded.connect(receiver)
+        self.addCleanup(searches_recorded.disconnect, receiver)
+
+        self.recorder.record([self.make_search() for _ in range(5)])
+        self.assertEqual(WeatherSearch.objects.count(), 0)
+        self.assertEqual(self.recorder.stats()['queue_depth'], 5)
+
+        self.recorder.flush()
+        self.assertEqual(WeatherSearch.objects.count(), 5)
+        self.assertEqual(len(received), 5)
+        self.assertEqual(self.recorder.stats()['queue_depth'], 0)
+
+    @override_settings(WEATHER_RECORDER={'BATCH_SIZE': 3, 'FLUSH_INTERVAL_MS': 60000})
+    def test_background_flush_when_batch_is_full(self):
+        self.recorder.record([self.make_search() for _ in range(3)])
+
+        deadline = time.monotonic() + 5
+        while self.recorder.stats()['written'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(WeatherSearch.objects.count(), 3)
+        self.assertEqual(self.recorder.stats()['flushes'], 1)
+
+    @override_settings(WEATHER_RECORDER={'BATCH_SIZE': 3, 'FLUSH_INTERVAL_MS': 60000})
+    def test_flush_waits_for_background_write(self):
+        taken, written = threading.Event(), threading.Event()
+
+        def slow_receiver(sender, searches, **kwargs):
+            taken.set()
+            time.sleep(0.2)
+            written.set()
+
+        searches_recorded.connect(slow_receiver)
+        self.addCleanup(searches_recorded.disconnect, slow_receiver)
+
+        self.recorder.record([self.make_search() for _ in range(3)])
+        self.assertTrue(taken.wait(5))
+        self.recorder.flush()
+        self.assertTrue(written.is_set())
+        self.user.delete()
+        self.assertEqual(WeatherSearch.objects.count(), 0)
+
+    @override_settings(WEATHER_RECORDER={'BATCH_SIZE': 2, 'FLUSH_INTERVAL_MS': 60000})
+    def test_failing_receiver_does_not_stop_the_flusher(self):
+        def broken_receiver(sender, searches, **kwargs):
+            raise RuntimeError('rollups unavailable')
+
+        searches_recorded.connect(broken_receiver)
+        self.addCleanup(searches_recorded.disconnect, broken_receiver)
+
+        with self.assertLogs('weather.recorder', 'ERROR'):
+            for failures in [1, 2]:
+                self.recorder.record([self.make_search() for _ in range(2)])
+                deadline = time.monotonic() + 5
+                while self.recorder.stats()['receiver_errors'] < failures and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            with override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False}):
+                self.recorder.record([self.make_search()])
+
+        self.assertEqual(WeatherSearch.objects.count(), 5)
+        self.assertEqual(self.recorder.stats()['flushes'], 2)
+        self.assertEqual(self.recorder.stats()['receiver_errors'], 3)
+
+    @override_settings(WEATHER_RECORDER={'MAX_QUEUE': 2, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL_MS': 60000,
+                                         'OVERFLOW': 'drop_oldest'})
+    def test_drop_oldest_overflow(self):
+        self.recorder.record([self.make_search(city) for city in ['London', 'Paris', 'Tokyo']])
+        self.recorder.flush()
+
+        self.assertEqual(sorted(WeatherSearch.objects.values_list('city', flat=True)), ['Paris', 'Tokyo'])
+        self.assertEqual(self.recorder.stats()['dropped'], 1)
+
+    @override_settings(WEATHER_RECORDER={'MAX_QUEUE': 2, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL_MS': 60000,
+                                         'OVERFLOW': 'sync'})
+    def test_sync_overflow_writes_immediately(self):
+        self.recorder.record([self.make_search(city) for city in ['London', 'Paris', 'Tokyo']])
+
+        self.assertEqual(list(WeatherSearch.objects.values_list('city', flat=True)), ['Tokyo'])
+        self.assertEqual(self.recorder.stats()['sync_writes'], 1)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class SearchAnalyticsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+
+    def create_searches(self, count, user=None):
+        search_recorder.record([
+            WeatherSearch(user=user or self.user, city=['London', 'Paris', 'Tokyo'][i % 3 if i % 4 else 0],
+                          temperature=i * 3 - 5, description=['Cloudy', 'Rain'][i % 2], humidity=70)
+            for i in range(count)
+        ])
+
+    def test_query_count_is_constant(self):
+        self.create_searches(3)
+        with self.assertNumQueries(4):
+            build_search_analytics(self.user.id)
+        with self.assertNumQueries(3):
+            read_search_analytics(self.user.id)
+
+        self.create_searches(30)
+        with self.assertNumQueries(4):
+            analytics = build_search_analytics(self.user.id)
+        with self.assertNumQueries(3):
+            read_search_analytics(self.user.id)
+
+        self.assertEqual(analytics['total_searches'], 33)
+        self.assertEqual(sum(analytics['temperature_distribution'].values()), 33)
+        self.assertEqual(analytics['popular_cities'][0], {'city': 'London', 'count': 16})
+
+    def test_rollup_matches_raw_aggregate(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        self.assertEqual(read_search_analytics(self.user.id), build_search_analytics(self.user.id))
+
+        for count in [1, 7, 25]:
+            self.create_searches(count)
+            self.create_searches(count // 2, user=other)
+            self.assertEqual(read_search_analytics(self.user.id), build_search_analytics(self.user.id))
+            self.assertEqual(read_search_analytics(other.id), build_search_analytics(other.id))
+
+    def test_rollup_follows_searches_saved_and_deleted_one_at_a_time(self):
+        self.create_searches(8)
+        WeatherSearch.objects.create(user=self.user, city='Oslo', temperature=12, description='Snow', humidity=80)
+        self.assertEqual(read_search_analytics(self.user.id), build_search_analytics(self.user.id))
+        self.assertEqual(CityPopularity.objects.get(normalized='oslo').count, 1)
+
+        WeatherSearch.objects.filter(city='London').delete()
+        WeatherSearch.objects.get(city='Oslo').delete()
+        self.assertEqual(read_search_analytics(self.user.id), build_search_analytics(self.user.id))
+        self.assertFalse(CityPopularity.objects.filter(normalized__in=['london', 'oslo']).exists())
+        self.assertFalse(UserSearchTally.objects.filter(value__in=['London', 'Oslo', 'Snow']).exists())
+
+    def test_stats_lock_leaves_the_joined_last_search_unlocked(self):
+        with patch.object(connection.features, 'has_select_for_update', True), \
+                patch.object(connection.features, 'has_select_for_update_of', True), transaction.atomic():
+            sql, _ = locked_user_stats().filter(user_id=self.user.id).query.get_compiler(connection=connection).as_sql()
+
+        self.assertIn('LEFT OUTER JOIN', sql)
+        self.assertTrue(sql.endswith(f'FOR UPDATE OF {connection.ops.quote_name(UserSearchStats._meta.db_table)}'))
+
+    def test_rebuild_command_restores_rollup(self):
+        self.create_searches(12)
+        expected = build_search_analytics(self.user.id)
+        UserSearchStats.objects.filter(user=self.user).update(total_searches=0, hot=99)
+        get_search_analytics(self.user.id)
+
+        out = StringIO()
+        call_command('rebuild_search_stats', chunk_size=1, stdout=out)
+
+        self.assertIn('Rebuilt search stats for 1 users', out.getvalue())
+        self.assertEqual(read_search_analytics(self.user.id), expected)
+        self.assertEqual(get_search_analytics(self.user.id), expected)
+
+    def test_cached_until_user_records_search(self):
+        self.create_searches(2)
+        url = reverse('search_analytics')
+        self.assertEqual(self.client.get(url).data['total_searches'], 2)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.data['total_searches'], 2)
+
+        search_recorder.record([
+            WeatherSearch(user=self.user, city='Tokyo', temperature=25, description='Clear Sky', humidity=40)
+        ])
+        response = self.client.get(url)
+        self.assertEqual(response.data['total_searches'], 3)
+        self.assertEqual(response.data['last_search']['city'], 'Tokyo')
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class SearchSuggestionsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('search_suggestions')
+        reset_weather_state()
+
+    def record(self, user, *cities):
+        search_recorder.record([
+            WeatherSearch(user=user, city=city, temperature=20, description='Clear Sky', humidity=50)
+            for city in cities
+        ])
+
+    def test_user_cities_then_popular_prefix_matches(self):
+        self.record(self.user, 'Dublin', 'Dublin', 'London')
+        self.record(self.other, 'Londrina', 'Lonavala', 'Lonavala', 'Lyon', 'london')
+
+        response = self.client.get(self.url, {'q': 'lon'})
+
+        self.assertEqual(response.data['suggestions'], ['London', 'Lonavala', 'Londrina'])
+        self.assertEqual(CityPopularity.objects.get(normalized='london').count, 2)
+
+    def test_index_is_updated_as_searches_are_recorded(self):
+        self.record(self.other, 'Paris')
+        self.assertEqual(self.client.get(self.url, {'q': 'pa'}).data['suggestions'], ['Paris'])
+
+        self.record(self.other, 'Panama City', 'Panama City')
+        # Only the per-user tally is queried once the index is loaded
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'q': 'PA'})
+        self.assertEqual(response.data['suggestions'], ['Panama City', 'Paris'])
+
+    def test_table_backend_matches_memory_index(self):
+        self.record(self.other, 'Berlin', 'Bern', 'Bern', 'Bergen', 'Oslo')
+
+        memory = self.client.get(self.url, {'q': 'ber'}).data['suggestions']
+        with override_settings(WEATHER_SUGGESTIONS={'BACKEND': 'table'}):
+            table = self.client.get(self.url, {'q': 'ber'}).data['suggestions']
+
+        self.assertEqual(memory, ['Bern', 'Bergen', 'Berlin'])
+        self.assertEqual(table, memory)
+
+    def test_refresh_picks_up_other_workers_searches(self):
+        self.record(self.other, 'Oslo')
+        self.assertEqual(self.client.get(self.url, {'q': 'os'}).data['suggestions'], ['Oslo'])
+
+        # Written by another worker: this worker's index has not seen it
+        CityPopularity.objects.create(normalized='osaka', city='Osaka', count=10)
+        self.assertEqual(self.client.get(self.url, {'q': 'os'}).data['suggestions'], ['Oslo'])
+
+        with override_settings(WEATHER_SUGGESTIONS={'REFRESH_SECONDS': 1}), \
+                patch('weather.suggest.time.monotonic', return_value=time.monotonic() + 5):
+            response = self.client.get(self.url, {'q': 'os'})
+        self.assertEqual(response.data['suggestions'], ['Osaka', 'Oslo'])
+
+
+GEONAMES_ROWS = [
+    # geonameid, name, asciiname, alternatenames, lat, lon, class, code, country, cc2, admin1-4, population
+    ('2643743', 'London', 'London', 'Londres,Londra', 'GB', '8961989'),
+    ('6058560', 'London', 'London', '', 'CA', '383822'),
+    ('3448439', 'São Paulo', 'Sao Paulo', 'Sampa', 'BR', '10021295'),
+    ('2988507', 'Paris', 'Paris', 'Lutetia', 'FR', '2138551'),
+    ('3117735', 'Madrid', 'Madrid', '', 'ES', '3255944'),
+    ('2950159', 'Berlin', 'Berlin', '', 'DE', '3426354'),
+    ('2661552', 'Bern', 'Bern', 'Berne', 'CH', '121631'),
+]
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class GazetteerTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password=os.getenv("TEST_USER_PASSWORD", "testpass123")
+        )
+        self.client.force_authenticate(user=self.user)
+        reset_weather_state()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(reset_gazetteer)
+        source = os.path.join(tmp.name, 'cities.txt')
+        with open(source, 'w', encoding='utf-8') as f:
+            for geonameid, name, ascii_name, alternates, country, population in GEONAMES_ROWS:
+                f.write('\t'.join([geonameid, name, ascii_name, alternates, '0', '0', 'P', 'PPLC', country,
+                                   '', '', '', '', '', population, '', '', 'UTC', '2024-01-01']) + '\n')
+            f.write('\t'.join(['1', 'Some Hill', 'Some Hill', '', '0', '0', 'T', 'HLL', 'GB'] + [''] * 5 + ['0']) + '\n')
+
+        self.path = os.path.join(tmp.name, 'gazetteer.tsv.gz')
+        out = StringIO()
+        call_command('load_gazetteer', source, output=self.path, alternate_names=True, stdout=out)
+        self.assertIn('Wrote 7 places', out.getvalue())
+        settings = override_settings(WEATHER_GAZETTEER={'PATH': self.path})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_accent_folded_prefix_and_fuzzy_matching(self):
+        gazetteer = get_gazetteer()
+
+        self.assertEqual(gazetteer.suggest('sao'), ['São Paulo'])
+        self.assertEqual(gazetteer.suggest('SÃO P'), ['São Paulo'])
+        self.assertEqual(gazetteer.suggest('ber'), ['Berlin', 'Bern'])
+        self.assertEqual(gazetteer.lookup('londres'), gazetteer.lookup('London'))
+        self.assertEqual(gazetteer.lookup('london').country, 'GB')
+        self.assertEqual(gazetteer.closest('Lodnon'), ['London'])
+        self.assertEqual(gazetteer.closest('Madird'), ['Madrid'])
+        self.assertEqual(gazetteer.closest('Qwxyzzz'), [])
+
+    def test_suggestions_include_gazetteer_matches(self):
+        response = self.client.get(reverse('search_suggestions'), {'q': 'sao'})
+        self.assertEqual(response.data['suggestions'], ['São Paulo'])
+
+        response = self.client.get(reverse('search_suggestions'), {'q': 'Pariss'})
+        self.assertEqual(response.data['suggestions'], ['Paris'])
+
+    def test_city_is_corrected_or_rejected_before_upstream(self):
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = self.client.get(reverse('get_weather'), {'city': 'Lodnon'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['city'], 'London')
+            self.assertEqual(stub.request_count, 1)
+
+            response = self.client.get(reverse('get_weather'), {'city': 'Qwxyzzz'})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(stub.request_count, 1)
+
+            response = self.client.post(reverse('batch_weather'), {'cities': ['Pari', 'Atlantis']}, format='json')
+            self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'unknown'])
+            self.assertEqual(response.data['results'][0]['weather']['city'], 'Paris')
+            self.assertEqual(stub.request_count, 2)
+
+    def test_country_suffix_passes_through_validation(self):
+        self.assertEqual(resolve_city('London,GB'), 'London,GB')
+        self.assertEqual(resolve_city('Lodnon,GB'), 'London,GB')
+        self.assertEqual(resolve_city('Paris,TX,US'), 'Paris,TX,US')
+        with self.assertRaises(UnknownCity):
+            resolve_city('Qwxyzzz,GB')
+
+        with StubWeatherServer() as stub, \
+                override_settings(OPENWEATHER_API_URL=stub.url, OPENWEATHER_API_KEY='test-key'):
+            response = self.client.get(reverse('get_weather'), {'city': 'London,GB'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(stub.request_count, 1)
+
+
+# Kept last: migrating rebuilds tables the search recorder's background thread may still be writing to
+class FavoriteCityMigrationTest(TransactionTestCase):
+    before = [('weather', '0005_city_popularity')]
+    after = [('weather', '0006_favorite_city')]
+
+    def tearDown(self):
+        call_command('migrate', verbosity=0)
+
+    def test_json_strings_become_rows_and_lists(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('authentication', 'User').objects.create(username='legacy', email='legacy@example.com')
+        OldSearchFilter = apps.get_model('weather', 'SearchFilter')
+        first = OldSearchFilter.objects.create(user_id=user.pk, weather_conditions='["Rain"]',
+                                               favorite_cities='["Paris", "paris ", "São Paulo"]')
+        broken = OldSearchFilter.objects.create(
+            user_id=apps.get_model('authentication', 'User').objects.create(username='broken').pk,
+            weather_conditions='', favorite_cities='not json',
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        NewSearchFilter = apps.get_model('weather', 'SearchFilter')
+        NewFavoriteCity = apps.get_model('weather', 'FavoriteCity')
+
+        self.assertEqual(NewSearchFilter.objects.get(pk=first.pk).weather_conditions, ['Rain'])
+        self.assertEqual(NewSearchFilter.objects.get(pk=broken.pk).weather_conditions, [])
+        self.assertEqual(
+            list(NewFavoriteCity.objects.filter(search_filter_id=first.pk).order_by('position')
+                                        .values_list('city', 'normalized')),
+            [('Paris', 'paris'), ('São Paulo', 'são paulo')]
+        )
+        self.assertFalse(NewFavoriteCity.objects.filter(search_filter_id=broken.pk).exists())
+
+
+class DatabaseProfileTest(TestCase):
+    def test_profiles(self):
+        tuned = database_settings('sqlite', settings.BASE_DIR)
+        self.assertEqual(tuned['ENGINE'], 'weather_portal.sqlite3')
+        self.assertEqual(tuned['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        with patch('weather_portal.database.find_spec', return_value=Mock()):
+            postgres = database_settings('postgres', settings.BASE_DIR)
+        self.assertTrue(postgres['CONN_HEALTH_CHECKS'])
+        self.assertGreater(postgres['CONN_MAX_AGE'], 0)
+        with self.assertRaises(ValueError):
+            database_settings('mysql', settings.BASE_DIR)
+
+    def test_postgres_profile_without_driver_fails_clearly(self):
+        with patch('weather_portal.database.find_spec', return_value=None), \
+                self.assertRaisesMessage(ImproperlyConfigured, 'psycopg[binary]'):
+            database_settings('postgres', settings.BASE_DIR)
+
+    @skipUnless(connection.settings_dict['ENGINE'] == 'weather_portal.sqlite3', 'needs the tuned SQLite profile')
+    def test_pragmas_applied_on_connection(self):
+        values = sqlite_pragma_values(connection)
+        # The in-memory test database cannot use WAL
+        self.assertEqual(values['synchronous'], 1)
+        self.assertEqual(values['busy_timeout'], 5000)
+        self.assertEqual(values['temp_store'], 2)
+
+
+@override_settings(WEATHER_RECORDER={'WRITE_BEHIND': False})
+class SearchRetentionTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='pass12345')
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+        now = timezone.now()
+        self.old = now - timedelta(days=40)
+        search_recorder.record([
+            WeatherSearch(user=self.user, city=city, temperature=temperature, description=description, humidity=70,
+                          searched_at=searched_at)
+            for city, temperature, description, searched_at in [
+                ('London', 5, 'Rain', self.old),
+                ('London', 25, 'Cloudy', self.old + timedelta(minutes=5)),
+                ('Paris', 15, 'Rain', self.old - timedelta(days=1)),
+                ('Tokyo', 31, 'Clear Sky', now),
+            ]
+        ])
+
+    def prune(self, **options):
+        out = StringIO()
+        call_command('prune_search_history', days=30, batch_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_prune_folds_old_searches_into_summaries(self):
+        analytics = read_search_analytics(self.user.id)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        archive_dir = tmp.name
+
+        output = self.prune(archive_dir=archive_dir)
+
+        self.assertIn('Pruned 3 searches', output)
+        self.assertEqual(list(WeatherSearch.objects.values_list('city', flat=True)), ['Tokyo'])
+        london = DailySearchSummary.objects.get(city='London')
+        self.assertEqual((london.day, london.searches, london.cold, london.warm), (self.old.date(), 2, 1, 1))
+        self.assertEqual((london.min_temperature, london.max_temperature), (5, 25))
+        self.assertEqual(london.conditions, {'Rain': 1, 'Cloudy': 1})
+
+        [archive] = os.listdir(archive_dir)
+        with gzip.open(os.path.join(archive_dir, archive), 'rt') as lines:
+            self.assertEqual(sorted(json.loads(line)['city'] for line in lines), ['London', 'London', 'Paris'])
+
+        self.assertEqual(read_search_analytics(self.user.id), analytics)
+        call_command('rebuild_search_stats', stdout=StringIO())
+        self.assertEqual(read_search_analytics(self.user.id), analytics)
+        self.assertEqual(CityPopularity.objects.get(normalized='london').count, 2)
+
+    def test_summaries_merge_across_runs_and_latest_search_is_kept(self):
+        self.prune()
+        search_recorder.record([
+            WeatherSearch(user=self.user, city='London', temperature=35, description='Rain', humidity=70,
+                          searched_at=self.old + timedelta(minutes=10)),
+        ])
+        stale = User.objects.create_user(username='stale', email='stale@example.com', password='pass12345')
+        search_recorder.record([
+            WeatherSearch(user=stale, city='Oslo', temperature=0, description='Snow', humidity=70, searched_at=self.old)
+        ])
+
+        self.assertIn('Pruned 1 searches', self.prune())
+
+        london = DailySearchSummary.objects.get(user=self.user, city='London')
+        self.assertEqual((london.searches, london.hot, london.max_temperature), (3, 1, 35))
+        self.assertEqual(london.conditions, {'Rain': 2, 'Cloudy': 1})
+        self.assertTrue(WeatherSearch.objects.filter(user=stale).exists())
+        self.assertEqual(read_search_analytics(stale.id)['last_search']['city'], 'Oslo')
+
+    def test_history_etag_changes_when_history_is_pruned(self):
+        url = reverse('weather_history')
+        etag = self.client.get(url)['ETag']
+        self.prune()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+    def test_rejects_retention_below_one_day(self):
+        with self.assertRaises(CommandError):
+            call_command('prune_search_history', days=0)
@@ -0,0 +1,403 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import normalize_city
+from .gazetteer import UnknownCity
+from .quota import QuotaExceeded, budget_from_settings
+from .resilience import UpstreamGuard, UpstreamUnavailable
+
+
+class CityNotFound(UnknownCity):
+    """OpenWeatherMap answered 404 for a city name"""
+
+
+class UpstreamError(Exception):
+    """OpenWeatherMap failed to answer: transport error or a non-404 error status"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JitteredRetry(Retry):
+    """
+    Retry policy that sleeps a random time up to the exponential backoff (full jitter).
+
+    A Retry-After header is honoured up to ``MAX_RETRY_AFTER`` seconds: the
+    sleep happens in the web worker serving the lookup, and a provider asking
+    for longer is better answered from the cache.
+    """
+
+    MAX_RETRY_AFTER = 3
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.MAX_RETRY_AFTER)
+
+
+def parse_observation(data):
+    """Map an OpenWeatherMap current-weather payload to the dict shape served by the API"""
+    return {
+        'city': data['name'],
+        'temperature': data['main']['temp'],
+        'description': data['weather'][0]['description'].title(),
+        'humidity': data['main']['humidity'],
+        'country': data['sys']['country'],
+        'wind_speed': data['wind']['speed'],
+        'pressure': data['main']['pressure'],
+    }
+
+
+def upstream_error(status_code, params, retry_after=None):
+    """Exception for an error status from OpenWeatherMap; ``retry_after`` is its Retry-After header, if any"""
+    if status_code == 404 and 'q' in params:
+        return CityNotFound(params['q'])
+    if status_code == 429:
+        try:
+            retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            retry_after = 60
+        return QuotaExceeded('OpenWeatherMap rate limit reached (429)', retry_after=retry_after)
+    return UpstreamError(f'OpenWeatherMap returned {status_code}', status_code)
+
+
+class CityIdRegistry:
+    """
+    Maps normalized city names to OpenWeatherMap city IDs.
+
+    IDs are learned from ordinary ``/weather?q=`` responses and are stable, so
+    once a city has been resolved it can be refreshed through the group
+    endpoint together with other cities.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def get(self, city: str):
+        return self._ids.get(normalize_city(city))
+
+    def record(self, city: str, data):
+        if data.get('id'):
+            with self._lock:
+                self._ids[normalize_city(city)] = data['id']
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+
+city_ids = CityIdRegistry()
+
+
+class FailedLookupCache:
+    """
+    Negative cache of failed ``/weather?q=`` lookups keyed on the normalized city.
+
+    A 404 is remembered for ``not_found_ttl`` seconds and an upstream 5xx for
+    the shorter ``error_ttl``; until then the same lookup re-raises without a
+    request. Entries are shared through the Django cache named by ``backend``
+    when set, like WeatherCache.
+    """
+
+    def __init__(self, not_found_ttl=300, error_ttl=15, backend='', key_prefix='weather:failed:'):
+        self.not_found_ttl = not_found_ttl
+        self.error_ttl = error_ttl
+        self.backend = backend
+        self.key_prefix = key_prefix
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(['not_found_hits', 'error_hits', 'not_found_stored', 'errors_stored'], 0)
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_CACHE', {})
+        return cls(
+            not_found_ttl=options.get('NOT_FOUND_TTL', 300),
+            error_ttl=options.get('ERROR_TTL', 15),
+            backend=options.get('BACKEND', ''),
+        )
+
+    def check(self, city: str):
+        """Re-raise the remembered failure for ``city``, if any"""
+        key = normalize_city(city)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.backend:
+            entry = caches[self.backend].get(self.key_prefix + key)
+        if entry is None:
+            return
+        kind, status_code, expires_at = entry
+        if expires_at <= time.time():
+            with self._lock:
+                self._entries.pop(key, None)
+            return
+        if kind == 'not_found':
+            self._incr('not_found_hits')
+            raise CityNotFound(city)
+        self._incr('error_hits')
+        raise UpstreamError(f'OpenWeatherMap returned {status_code} (cached)', status_code)
+
+    def remember(self, city: str, error):
+        if isinstance(error, CityNotFound):
+            kind, ttl, counter = 'not_found', self.not_found_ttl, 'not_found_stored'
+        elif isinstance(error, UpstreamError) and (error.status_code or 0) >= 500:
+            kind, ttl, counter = 'error', self.error_ttl, 'errors_stored'
+        else:
+            return
+        if not ttl:
+            return
+        key = normalize_city(city)
+        entry = (kind, getattr(error, 'status_code', 404), time.time() + ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._counters[counter] += 1
+        if self.backend:
+            caches[self.backend].set(self.key_prefix + key, entry, timeout=ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['size'] = len(self._entries)
+        snapshot['not_found_ttl'] = self.not_found_ttl
+        snapshot['error_ttl'] = self.error_ttl
+        return snapshot
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+failed_lookups = FailedLookupCache.from_settings()
+
+# Shared by the sync and async clients: both talk to the same provider
+upstream_guard = UpstreamGuard.from_settings(failure_types=(UpstreamError,))
+upstream_quota = budget_from_settings()
+
+# Everything a lookup can raise when the provider did not give an answer
+PROVIDER_ERRORS = (UpstreamError, UpstreamUnavailable)
+
+
+class OpenWeatherClient:
+    """
+    Client for the OpenWeatherMap API backed by a pooled keep-alive session.
+
+    Each worker process gets its own ``requests.Session`` (created lazily, and
+    recreated after a fork) so connections are reused across lookups. Requests
+    that fail with 5xx are retried with jittered exponential backoff. A 429
+    is not retried: it pauses the upstream quota instead (see ``get``), so
+    later lookups are served from the cache without waiting on the provider.
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+    GROUP_SIZE = 20  # maximum IDs accepted by the group endpoint
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_connections=4, pool_maxsize=32,
+                 retries=2, backoff_factor=0.3):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_UPSTREAM', {})
+        return cls(
+            connect_timeout=options.get('CONNECT_TIMEOUT', 3.05),
+            read_timeout=options.get('READ_TIMEOUT', 10),
+            pool_connections=options.get('POOL_CONNECTIONS', 4),
+            pool_maxsize=options.get('POOL_MAXSIZE', 32),
+            retries=options.get('RETRIES', 2),
+            backoff_factor=options.get('BACKOFF_FACTOR', 0.3),
+        )
+
+    @property
+    def session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    self._session = self._build_session()
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def _build_session(self):
+        retry = JitteredRetry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, path: str, params: dict):
+        api_key = settings.OPENWEATHER_API_KEY
+        if not api_key:
+            raise ValueError("OpenWeatherMap API key not configured")
+
+        upstream_quota.acquire()
+        try:
+            return upstream_guard.call(lambda: self._get(path, params, api_key))
+        except QuotaExceeded as e:
+            upstream_quota.pause(e.retry_after)
+            raise
+        except UpstreamUnavailable:
+            upstream_quota.refund()
+            raise
+
+    def _get(self, path, params, api_key):
+        with self._lock:
+            self._calls[path] = self._calls.get(path, 0) + 1
+        try:
+            response = self.session.get(
+                f"{settings.OPENWEATHER_API_URL}/{path}",
+                params={**params, 'appid': api_key, 'units': 'metric'},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise upstream_error(e.response.status_code, params, e.response.headers.get('Retry-After')) from e
+        except requests.RequestException as e:
+            raise UpstreamError(f'OpenWeatherMap request failed: {e}') from e
+        return response.json()
+
+    def current_weather(self, city: str):
+        failed_lookups.check(city)
+        try:
+            data = self.get('weather', {'q': city})
+        except (CityNotFound, UpstreamError) as e:
+            failed_lookups.remember(city, e)
+            raise
+        city_ids.record(city, data)
+        return parse_observation(data)
+
+    def group_weather(self, ids):
+        """Fetch up to GROUP_SIZE cities by ID in one call; returns ``{city_id: weather_data}``"""
+        data = self.get('group', {'id': ','.join(str(city_id) for city_id in ids)})
+        return {item['id']: parse_observation(item) for item in data.get('list', [])}
+
+    def stats(self):
+        with self._lock:
+            snapshot = {'calls': dict(self._calls), 'known_city_ids': len(city_ids)}
+        snapshot.update(upstream_guard.stats())
+        snapshot['quota'] = upstream_quota.stats()
+        return snapshot
+
+
+class AsyncOpenWeatherClient:
+    """
+    Coroutine client for the OpenWeatherMap API used by the async views.
+
+    Keeps one pooled ``httpx.AsyncClient`` per event loop and applies the same
+    timeouts as OpenWeatherClient. Like it, it retries only
+    ``OpenWeatherClient.RETRY_STATUSES`` (transient 5xx), here with jittered
+    backoff; a 429 is not retried and raises QuotaExceeded, which pauses the
+    quota for its Retry-After.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, pool_maxsize=100, retries=2, backoff_factor=0.3):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'WEATHER_UPSTREAM', {})
+        return cls(
+            connect_timeout=options.get('CONNECT_TIMEOUT', 3.05),
+            read_timeout=options.get('READ_TIMEOUT', 10),
+            pool_maxsize=options.get('ASYNC_POOL_MAXSIZE', 100),
+            retries=options.get('RETRIES', 2),
+            backoff_factor=options.get('BACKOFF_FACTOR', 0.3),
+        )
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    async def get(self, path: str, params: dict):
+        api_key = settings.OPENWEATHER_API_KEY
+        if not api_key:
+            raise ValueError("OpenWeatherMap API key not configured")
+
+        upstream_quota.acquire()
+        try:
+            return await upstream_guard.acall(lambda: self._get(path, params, api_key))
+        except QuotaExceeded as e:
+            upstream_quota.pause(e.retry_after)
+            raise
+        except UpstreamUnavailable:
+            upstream_quota.refund()
+            raise
+
+    async def _get(self, path, params, api_key):
+        url = f"{settings.OPENWEATHER_API_URL}/{path}"
+        query = {**params, 'appid': api_key, 'units': 'metric'}
+        try:
+            for attempt in range(self.retries + 1):
+                response = await self.client.get(url, params=query)
+                if response.status_code not in OpenWeatherClient.RETRY_STATUSES or attempt == self.retries:
+                    break
+                await asyncio.sleep(random.uniform(0, self.backoff_factor * (2 ** attempt)))
+        except httpx.HTTPError as e:
+            raise UpstreamError(f'OpenWeatherMap request failed: {e}') from e
+        if response.is_error:
+            raise upstream_error(response.status_code, params, response.headers.get('Retry-After'))
+        return response.json()
+
+    async def current_weather(self, city: str):
+        failed_lookups.check(city)
+        try:
+            data = await self.get('weather', {'q': city})
+        except (CityNotFound, UpstreamError) as e:
+            failed_lookups.remember(city, e)
+            raise
+        city_ids.record(city, data)
+        return parse_observation(data)
+
+
+upstream_client = OpenWeatherClient.from_settings()
+async_upstream_client = AsyncOpenWeatherClient.from_settings()
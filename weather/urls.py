@@ -1,14 +1,21 @@
 from django.urls import path
+from .async_views import async_get_weather, async_advanced_search, async_batch_weather
 from .views import (
-    get_weather, weather_history, advanced_search, 
-    search_filters, search_suggestions, search_analytics
+    get_weather, batch_weather, weather_history, export_weather_history, advanced_search,
+    search_filters, search_suggestions, search_analytics, weather_metrics
 )
 
 urlpatterns = [
     path('', get_weather, name='get_weather'),
+    path('batch/', batch_weather, name='batch_weather'),
     path('history/', weather_history, name='weather_history'),
+    path('history/export/', export_weather_history, name='export_weather_history'),
     path('search/', advanced_search, name='advanced_search'),
     path('filters/', search_filters, name='search_filters'),
     path('suggestions/', search_suggestions, name='search_suggestions'),
     path('analytics/', search_analytics, name='search_analytics'),
+    path('metrics/', weather_metrics, name='weather_metrics'),
+    path('async/', async_get_weather, name='async_get_weather'),
+    path('async/search/', async_advanced_search, name='async_advanced_search'),
+    path('async/batch/', async_batch_weather, name='async_batch_weather'),
 ]
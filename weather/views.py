@@ -1,75 +1,246 @@
-import json
-import requests
-from django.db.models import Count
+import math
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from django.conf import settings
-from .models import WeatherSearch, SearchFilter
-from .serializers import WeatherSearchSerializer, SearchFilterSerializer, WeatherSearchRequestSerializer
+from authentication.authentication import MODEL_USER_AUTHENTICATION, active_users, token_blacklist, verified_tokens
+from .analytics import get_search_analytics
+from .cache import normalize_city, weather_cache
+from .coalesce import upstream_flight
+from .conditional import conditional, make_etag
+from .export import EXPORT_FORMATS, export_response
+from .fanout import FanOutResult, fan_out, status_headers
+from .gazetteer import UnknownCity, gazetteer_suggestions, resolve_city
+from .models import FavoriteCity, WeatherSearch, SearchFilter, UserSearchStats, UserSearchTally
+from .pagination import SearchHistoryPagination
+from .recorder import search_recorder
+from .serializers import (
+    WeatherSearchSerializer, SearchFilterSerializer, WeatherSearchRequestSerializer, WeatherBatchRequestSerializer
+)
+from .suggest import city_index, popular_cities
+from .quota import BATCH, upstream_priority
+from .resilience import UpstreamUnavailable
+from .upstream import PROVIDER_ERRORS, UpstreamError, city_ids, failed_lookups, upstream_client
+from .warmer import cache_warmer
 
 
 def fetch_weather(city: str):
     """Fetch weather data from OpenWeatherMap API"""
-    api_key = settings.OPENWEATHER_API_KEY
-    if not api_key:
-        raise ValueError("OpenWeatherMap API key not configured")
-    
-    url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-    response = requests.get(url, timeout=10)
-    response.raise_for_status()
-    data = response.json()
-    
-    return {
-        'city': data['name'],
-        'temperature': data['main']['temp'],
-        'description': data['weather'][0]['description'].title(),
-        'humidity': data['main']['humidity'],
-        'country': data['sys']['country'],
-        'wind_speed': data['wind']['speed'],
-        'pressure': data['main']['pressure'],
-    }
+    return upstream_client.current_weather(city)
+
+
+def fetch_weather_coalesced(city: str):
+    """Fetch weather, sharing one upstream request between concurrent callers for the same city"""
+    return upstream_flight.do(normalize_city(city), lambda: fetch_weather(city))
+
+
+def lookup_weather(city: str):
+    """
+    Return weather for a city, served from the weather cache when possible.
+
+    When the provider cannot answer, the last cached observation is served
+    instead, marked ``stale``.
+    """
+    try:
+        return weather_cache.get(city, fetch_weather_coalesced)
+    except PROVIDER_ERRORS:
+        fallback = weather_cache.fallback(city)
+        if fallback is None:
+            raise
+        return fallback
+
+
+def fetch_weather_many(cities, deadline=None):
+    """
+    Fetch several cities with as few upstream calls as possible.
+
+    Cities whose OpenWeatherMap ID is already known are refreshed through the
+    group endpoint, GROUP_SIZE IDs per call; the rest are fetched one by one,
+    which also records their IDs for next time. All calls run concurrently on
+    the fan-out pool. Returns one FanOutResult per city, in order.
+    """
+    known = {city: city_ids.get(city) for city in cities}
+    ids = list(dict.fromkeys(city_id for city_id in known.values() if city_id is not None))
+    chunks = [tuple(ids[i:i + upstream_client.GROUP_SIZE]) for i in range(0, len(ids), upstream_client.GROUP_SIZE)]
+    singles = [city for city, city_id in known.items() if city_id is None]
+
+    def run(job):
+        kind, arg = job
+        return upstream_client.group_weather(arg) if kind == 'group' else fetch_weather_coalesced(arg)
+
+    outcomes = fan_out([('group', chunk) for chunk in chunks] + [('city', city) for city in singles], run, deadline)
+    by_city = {outcome.key[1]: outcome for outcome in outcomes if outcome.key[0] == 'city'}
+    by_id = {}
+    for outcome in outcomes:
+        if outcome.key[0] == 'group':
+            for city_id in outcome.key[1]:
+                by_id[city_id] = outcome
+
+    results = []
+    for city in cities:
+        city_id = known[city]
+        if city_id is None:
+            outcome = by_city[city]
+            results.append(FanOutResult(city, outcome.status, outcome.value, outcome.error))
+        elif by_id[city_id].status != 'ok':
+            results.append(FanOutResult(city, by_id[city_id].status, error=by_id[city_id].error))
+        elif city_id not in by_id[city_id].value:
+            results.append(FanOutResult(city, 'error', error=KeyError(city_id)))
+        else:
+            results.append(FanOutResult(city, 'ok', dict(by_id[city_id].value[city_id])))
+    return results
+
+
+def lookup_weather_many(cities, deadline=None):
+    """
+    Return ``{'city', 'status', 'cache', 'weather'}`` for each city, in order.
+
+    Cities unknown to the gazetteer get status ``'unknown'`` without an
+    upstream call, as do cities OpenWeatherMap does not know. Cached cities
+    are served immediately; misses are refreshed together via
+    fetch_weather_many and stored in the cache. When the provider cannot
+    answer for a city that has any cached observation, that observation is
+    served with cache ``'fallback'`` and marked ``stale``.
+    """
+    results = {}
+    misses = []
+    resolved = {}
+    for city in cities:
+        try:
+            resolved[city] = resolve_city(city)
+        except UnknownCity:
+            results[city] = {'city': city, 'status': 'unknown', 'cache': None, 'weather': None}
+            continue
+        cached = weather_cache.get_cached(resolved[city], fetch_weather_coalesced)
+        if cached is None:
+            misses.append(city)
+        else:
+            results[city] = {'city': city, 'status': 'ok', 'cache': cached[1], 'weather': cached[0]}
+
+    for city, outcome in zip(misses, fetch_weather_many([resolved[city] for city in misses], deadline)):
+        if outcome.status == 'ok':
+            weather_cache.set(outcome.key, outcome.value)
+        elif isinstance(outcome.error, UnknownCity):
+            results[city] = {'city': city, 'status': 'unknown', 'cache': None, 'weather': None}
+            continue
+        elif isinstance(outcome.error, PROVIDER_ERRORS) and weather_cache.peek(outcome.key) is not None:
+            results[city] = {'city': city, 'status': 'ok', 'cache': 'fallback',
+                             'weather': weather_cache.fallback(outcome.key)}
+            continue
+        results[city] = {'city': city, 'status': outcome.status, 'cache': 'miss', 'weather': outcome.value}
+
+    return [results[city] for city in cities]
+
+
+def weather_etag(request):
+    """Tag of the fresh cached observation for the requested city; stale entries must reach the view to refresh"""
+    city = request.GET.get('city')
+    if not city:
+        return None
+    try:
+        city = resolve_city(city)
+    except UnknownCity:
+        return None
+    expires_in = weather_cache.expires_in(city)
+    if expires_in is None or expires_in <= 0:
+        return None
+    return make_etag('weather', normalize_city(city), weather_cache.peek(city).fetched_at)
+
+
+def record_revalidated_search(request):
+    """A 304 is still a search: record it from the cached observation the client already holds"""
+    entry = weather_cache.peek(resolve_city(request.GET['city']))
+    if entry is not None:
+        search_recorder.record([WeatherSearch.from_weather(request.user.id, entry.data)])
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+# no-cache rather than max-age: a response reused without asking the server would not be recorded as a search
+@conditional(weather_etag, on_not_modified=record_revalidated_search, private=True, no_cache=True)
 def get_weather(request):
+    cache_warmer.ensure_started()
     city = request.GET.get('city')
     if not city:
         return Response({'error': 'City parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        weather_data = fetch_weather(city)
-
-        # Save search to database
-        WeatherSearch.objects.create(
-            user=request.user,
-            city=weather_data['city'],
-            country=weather_data['country'],
-            temperature=weather_data['temperature'],
-            description=weather_data['description'],
-            humidity=weather_data['humidity'],
-            wind_speed=weather_data['wind_speed'],
-            pressure=weather_data['pressure']
-        )
+        weather_data = lookup_weather(resolve_city(city))
+
+        # Save search to database (written behind the response)
+        search_recorder.record([WeatherSearch.from_weather(request.user.id, weather_data)])
 
         return Response(weather_data, status=status.HTTP_200_OK)
 
-    except (requests.exceptions.RequestException, ValueError) as e:
-        return Response({'error': f'Weather API error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except UnknownCity as e:
+        return Response({'error': f'Unknown city: {e.city}', 'suggestions': e.suggestions},
+                        status=status.HTTP_404_NOT_FOUND)
+    except UpstreamUnavailable as e:
+        return Response({'error': f'Weather service unavailable: {str(e)}'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={'Retry-After': str(math.ceil(e.retry_after or 1))})
+    except (UpstreamError, ValueError) as e:
+        return Response({'error': f'Weather API error: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
     except KeyError as e:
-        return Response({'error': f'Invalid weather data format: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'error': f'Invalid weather data format: {str(e)}'}, status=status.HTTP_502_BAD_GATEWAY)
     except Exception as e:
         return Response({'error': f'Unexpected error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_weather(request):
+    cache_warmer.ensure_started()
+    serializer = WeatherBatchRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    with upstream_priority(BATCH):
+        results = lookup_weather_many(serializer.validated_data['cities'])
+    search_recorder.record([
+        WeatherSearch.from_weather(request.user.id, result['weather'])
+        for result in results if result['status'] == 'ok'
+    ])
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+def history_version(user_id):
+    """
+    What the user's history looks like, read from their rollup row in one query.
+
+    The latest search and the total change with every search recorded or
+    deleted, and retention touches ``updated_at`` when it prunes the user's
+    old searches.
+    """
+    return UserSearchStats.objects.filter(user_id=user_id) \
+                                  .values_list('last_search_id', 'total_searches', 'updated_at').first()
+
+
+def history_etag(request):
+    return make_etag('history', request.user.pk, history_version(request.user.id), request.GET.urlencode())
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+# no-cache: a search recorded from another tab or device must show up on the next load
+@conditional(history_etag, private=True, no_cache=True)
 def weather_history(request):
-    searches = WeatherSearch.objects.filter(user=request.user).order_by('-id')[:10]  # Last 10 searches
+    paginator = SearchHistoryPagination(page_size=10)
+    searches = paginator.paginate_queryset(WeatherSearch.objects.filter(user_id=request.user.id), request)
     serializer = WeatherSearchSerializer(searches, many=True)
-    return Response(serializer.data)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+# Same validator as the history: re-downloading an unchanged export costs one query instead of the whole stream
+@conditional(history_etag, private=True, no_cache=True)
+def export_weather_history(request):
+    output = request.query_params.get('output', 'ndjson')
+    if output not in EXPORT_FORMATS:
+        return Response({'error': f'output must be one of: {", ".join(EXPORT_FORMATS)}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return export_response(WeatherSearch.objects.filter(user_id=request.user.id), output)
 
 
 @api_view(['POST'])
@@ -91,7 +262,7 @@ def advanced_search(request):
         return get_weather(request)
 
     elif search_type == 'history':
-        queryset = WeatherSearch.objects.filter(user=request.user)
+        queryset = WeatherSearch.objects.filter(user_id=request.user.id)
 
         if data.get('city'):
             queryset = queryset.filter(city__icontains=data['city'])
@@ -104,40 +275,44 @@ def advanced_search(request):
         if data.get('weather_condition'):
             queryset = queryset.filter(description__icontains=data['weather_condition'])
 
-        searches = queryset.order_by('-id')[:20]  # Limit to 20 results
+        paginator = SearchHistoryPagination(page_size=20)
+        searches = paginator.paginate_queryset(queryset, request)
         serializer = WeatherSearchSerializer(searches, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     elif search_type == 'favorites':
-        try:
-            search_filter = SearchFilter.objects.get(user=request.user)
-            favorite_cities = json.loads(search_filter.favorite_cities) if search_filter.favorite_cities else []
-        except SearchFilter.DoesNotExist:
-            favorite_cities = []
+        favorite_cities = list(FavoriteCity.objects.filter(search_filter__user_id=request.user.id)
+                                                   .values_list('city', flat=True)[:5])
 
         if not favorite_cities:
             return Response({'message': 'No favorite cities set'}, status=status.HTTP_200_OK)
 
         results = []
-        for city in favorite_cities[:5]:
-            try:
-                weather_data = fetch_weather(city)
-                weather_data['is_favorite'] = True
-                results.append(weather_data)
-            except (requests.exceptions.RequestException, KeyError):
-                continue  # Skip cities that fail
+        statuses = []
+        for result in lookup_weather_many(favorite_cities):
+            statuses.append((result['city'], result['status']))
+            if result['status'] == 'ok':
+                result['weather']['is_favorite'] = True
+                results.append(result['weather'])
 
-        return Response(results, status=status.HTTP_200_OK)
+        return Response(results, status=status.HTTP_200_OK, headers=status_headers(statuses))
 
     return Response({'error': 'Invalid search type'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def filters_etag(request):
+    updated_at = SearchFilter.objects.filter(user_id=request.user.id).values_list('updated_at', flat=True).first()
+    return make_etag('filters', request.user.pk, updated_at)
+
+
 @api_view(['GET', 'POST', 'PUT'])
 @permission_classes([IsAuthenticated])
+# no-cache: filters edited on another device must apply on the next load
+@conditional(filters_etag, private=True, no_cache=True)
 def search_filters(request):
     if request.method == 'GET':
         try:
-            search_filter = SearchFilter.objects.get(user=request.user)
+            search_filter = SearchFilter.objects.prefetch_related('favorites').get(user_id=request.user.id)
             serializer = SearchFilterSerializer(search_filter)
             return Response(serializer.data)
         except SearchFilter.DoesNotExist:
@@ -146,13 +321,13 @@ def search_filters(request):
     elif request.method == 'POST':
         serializer = SearchFilterSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            serializer.save(user_id=request.user.id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'PUT':
         try:
-            search_filter = SearchFilter.objects.get(user=request.user)
+            search_filter = SearchFilter.objects.prefetch_related('favorites').get(user_id=request.user.id)
             serializer = SearchFilterSerializer(search_filter, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
@@ -169,41 +344,45 @@ def search_suggestions(request):
     if len(query) < 2:
         return Response({'suggestions': []}, status=status.HTTP_200_OK)
 
-    user_searches = WeatherSearch.objects.filter(user=request.user, city__icontains=query) \
-                                        .values_list('city', flat=True).distinct()[:5]
+    user_searches = UserSearchTally.objects.filter(user_id=request.user.id, kind=UserSearchTally.CITY,
+                                                  value__icontains=query) \
+                                          .order_by('-count', 'value').values_list('value', flat=True)[:5]
 
-    popular_searches = WeatherSearch.objects.filter(city__icontains=query) \
-                                            .values('city').annotate(count=Count('city')) \
-                                            .order_by('-count')[:5]
-
-    suggestions = list(user_searches) + [item['city'] for item in popular_searches]
+    suggestions = list(user_searches) + popular_cities(query) + gazetteer_suggestions(query)
     suggestions = list(dict.fromkeys(suggestions))[:8]
 
     return Response({'suggestions': suggestions}, status=status.HTTP_200_OK)
 
 
+def analytics_etag(request):
+    # The payload is cached until the user records a search, so reading it here is usually free
+    analytics = get_search_analytics(request.user.id)
+    return make_etag('analytics', request.user.pk, analytics['total_searches'], analytics['last_search'])
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+# Aggregate counts may trail by a minute, so dashboards polling analytics need not ask the server at all
+@conditional(analytics_etag, private=True, max_age=60)
 def search_analytics(request):
-    user_searches = WeatherSearch.objects.filter(user=request.user)
-
-    popular_cities = user_searches.values('city').annotate(count=Count('city')).order_by('-count')[:5]
-
-    temp_ranges = {
-        'cold': user_searches.filter(temperature__lt=10).count(),
-        'cool': user_searches.filter(temperature__gte=10, temperature__lt=20).count(),
-        'warm': user_searches.filter(temperature__gte=20, temperature__lt=30).count(),
-        'hot': user_searches.filter(temperature__gte=30).count(),
-    }
+    return Response(get_search_analytics(request.user.id), status=status.HTTP_200_OK)
 
-    weather_conditions = user_searches.values('description').annotate(count=Count('description')).order_by('-count')[:5]
 
-    analytics = {
-        'total_searches': user_searches.count(),
-        'popular_cities': list(popular_cities),
-        'temperature_distribution': temp_ranges,
-        'weather_conditions': list(weather_conditions),
-        'last_search': WeatherSearchSerializer(user_searches.first()).data if user_searches.exists() else None
-    }
-
-    return Response(analytics, status=status.HTTP_200_OK)
+@api_view(['GET'])
+@authentication_classes(MODEL_USER_AUTHENTICATION)
+@permission_classes([IsAdminUser])
+def weather_metrics(request):
+    return Response({
+        'cache': weather_cache.stats(),
+        'failed_lookups': failed_lookups.stats(),
+        'single_flight': upstream_flight.stats(),
+        'upstream': upstream_client.stats(),
+        'recorder': search_recorder.stats(),
+        'suggestions': city_index.stats(),
+        'warmer': cache_warmer.stats(),
+        'auth': {
+            'verified_tokens': verified_tokens.stats(),
+            'blacklist': token_blacklist.stats(),
+            'active_users': active_users.stats(),
+        },
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,195 @@
+"""
+Proactive refresh of the weather cache for cities that are about to be asked for.
+
+Targets are every user's favorite cities plus the top-K cities by recent
+search demand. Each run refreshes the targets whose cache entry is missing
+or expires within ``REFRESH_AHEAD`` seconds, most urgent first, using the
+group endpoint for cities with a known OpenWeatherMap ID. Upstream calls
+are paced to ``MAX_CALLS_PER_MINUTE`` so warming stays within the quota.
+
+Run it with ``manage.py warm_weather_cache`` when WEATHER_CACHE['BACKEND']
+shares the cache between workers, or set WEATHER_WARMER['ENABLED'] to run
+it on a background thread inside each web worker.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .cache import normalize_city, weather_cache
+from .gazetteer import UnknownCity, resolve_city
+from .models import FavoriteCity, WeatherSearch
+from .quota import WARMER, upstream_priority
+from .resilience import UpstreamUnavailable
+from .upstream import PROVIDER_ERRORS, city_ids, upstream_client
+
+logger = logging.getLogger(__name__)
+
+
+def warmer_options():
+    """WEATHER_WARMER merged over the defaults"""
+    options = {
+        'ENABLED': False,
+        'INTERVAL': 60,
+        'TOP_K': 50,
+        'DAYS': 7,
+        'MAX_CALLS_PER_MINUTE': 30,
+        'REFRESH_AHEAD': 120,
+    }
+    options.update(getattr(settings, 'WEATHER_WARMER', {}))
+    return options
+
+
+def _calls_per_minute(options):
+    if options['MAX_CALLS_PER_MINUTE'] < 1:
+        raise ImproperlyConfigured("WEATHER_WARMER['MAX_CALLS_PER_MINUTE'] must be at least 1; "
+                                   "set ENABLED to False to stop warming")
+    return options['MAX_CALLS_PER_MINUTE']
+
+
+def favorite_cities():
+    """Every city in any user's favorites, most widely favorited first"""
+    return list(FavoriteCity.objects.values('normalized').annotate(users=Count('id'), name=Min('city'))
+                                    .order_by('-users', 'normalized').values_list('name', flat=True))
+
+
+def top_searched_cities(top_k, days):
+    """The ``top_k`` most searched cities over the last ``days`` days"""
+    since = timezone.now() - timedelta(days=days)
+    return list(WeatherSearch.objects.filter(searched_at__gte=since).values('city')
+                                     .annotate(count=Count('id')).order_by('-count', 'city')
+                                     .values_list('city', flat=True)[:top_k])
+
+
+def warm_targets(top_k, days):
+    """Favorites and popular cities, de-duplicated by normalized name and resolved through the gazetteer"""
+    targets = {}
+    for city in favorite_cities() + top_searched_cities(top_k, days):
+        try:
+            city = resolve_city(city)
+        except UnknownCity:
+            continue
+        targets.setdefault(normalize_city(city), city)
+    return list(targets.values())
+
+
+class CacheWarmer:
+    def __init__(self, cache=weather_cache, client=upstream_client):
+        self.cache = cache
+        self.client = client
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(['runs', 'warmed', 'calls', 'failed', 'deferred'], 0)
+        self._last_run = None
+
+    def due(self, cities, refresh_ahead):
+        """Cities whose entry is missing or expires within ``refresh_ahead`` seconds, most urgent first"""
+        expiring = []
+        for city in cities:
+            expires_in = self.cache.expires_in(city)
+            if expires_in is None or expires_in < refresh_ahead:
+                expiring.append((float('-inf') if expires_in is None else expires_in, city))
+        return [city for _, city in sorted(expiring, key=lambda item: item[0])]
+
+    def plan(self, cities):
+        """Upstream calls refreshing ``cities``: ``('group', [(city, id), ...])`` chunks, then ``('city', city)``"""
+        known = [(city, city_ids.get(city)) for city in cities if city_ids.get(city) is not None]
+        size = self.client.GROUP_SIZE
+        calls = [('group', known[i:i + size]) for i in range(0, len(known), size)]
+        calls.extend(('city', city) for city in cities if city_ids.get(city) is None)
+        return calls
+
+    def run_once(self, top_k=None, days=None, refresh_ahead=None, max_calls=None, pace=None):
+        """Refresh the due targets with at most ``max_calls`` upstream calls, ``pace`` seconds apart"""
+        options = warmer_options()
+        top_k = options['TOP_K'] if top_k is None else top_k
+        days = options['DAYS'] if days is None else days
+        refresh_ahead = options['REFRESH_AHEAD'] if refresh_ahead is None else refresh_ahead
+        if max_calls is None:
+            max_calls = max(1, int(_calls_per_minute(options) * options['INTERVAL'] / 60))
+        if pace is None:
+            pace = 60 / _calls_per_minute(options)
+
+        targets = warm_targets(top_k, days)
+        calls = self.plan(self.due(targets, refresh_ahead))
+        summary = {'targets': len(targets), 'due': 0, 'warmed': 0, 'calls': 0, 'failed': 0,
+                   'deferred': sum(len(arg) if kind == 'group' else 1 for kind, arg in calls[max_calls:])}
+        with upstream_priority(WARMER):
+            self._refresh(calls[:max_calls], pace, summary)
+
+        with self._lock:
+            self._counters['runs'] += 1
+            for name in ['warmed', 'calls', 'failed', 'deferred']:
+                self._counters[name] += summary[name]
+            self._last_run = summary
+        return summary
+
+    def _refresh(self, calls, pace, summary):
+        for kind, arg in calls:
+            if summary['calls']:
+                time.sleep(pace)
+            summary['calls'] += 1
+            try:
+                if kind == 'group':
+                    summary['due'] += len(arg)
+                    observations = self.client.group_weather([city_id for _, city_id in arg])
+                    for city, city_id in arg:
+                        if city_id in observations:
+                            self.cache.set(city, observations[city_id], warmed=True)
+                            summary['warmed'] += 1
+                        else:
+                            summary['failed'] += 1
+                else:
+                    summary['due'] += 1
+                    self.cache.set(arg, self.client.current_weather(arg), warmed=True)
+                    summary['warmed'] += 1
+            except (UpstreamUnavailable, ValueError):
+                # The provider is refusing calls (or no API key is set): leave the rest for the next run
+                summary['failed'] += len(arg) if kind == 'group' else 1
+                break
+            except (UnknownCity, *PROVIDER_ERRORS):
+                summary['failed'] += len(arg) if kind == 'group' else 1
+
+    def ensure_started(self):
+        """Start the background warming thread in this process if WEATHER_WARMER['ENABLED']"""
+        options = warmer_options()
+        if not options['ENABLED']:
+            return
+        _calls_per_minute(options)  # fail here rather than on every run in the background thread
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='weather-cache-warmer', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['last_run'] = self._last_run
+            snapshot['running'] = self._thread is not None and self._thread.is_alive()
+        return snapshot
+
+    def _run(self):
+        while warmer_options()['ENABLED']:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Weather cache warming run failed')
+            finally:
+                close_old_connections()
+            time.sleep(max(0, warmer_options()['INTERVAL'] - (time.monotonic() - started)))
+
+
+cache_warmer = CacheWarmer()
@@ -2,6 +2,10 @@
 ASGI config for weather_portal project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The async weather views (/api/weather/async/...) only keep upstream calls off
+worker threads when served from here, e.g.:
+
+    uvicorn weather_portal.asgi:application --workers 4
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -0,0 +1,80 @@
+"""
+Database profiles, selected with the DB_PROFILE environment variable.
+
+``sqlite``
+    The SQLite file next to manage.py, through the weather_portal.sqlite3
+    backend. It runs in WAL mode so history writes do not block readers,
+    with ``synchronous=NORMAL``, a busy timeout and a memory-mapped read
+    window set on every new connection. Write transactions begin IMMEDIATE
+    so concurrent writers queue on the busy timeout instead of failing.
+``sqlite-default``
+    The same file with Django's stock backend and SQLite's defaults, as
+    before the profiles existed.
+``postgres``
+    PostgreSQL from the POSTGRES_* variables (needs ``psycopg``, listed in
+    requirements.txt), with persistent connections and health checks so a
+    worker reuses its connection across requests instead of reconnecting
+    each time.
+"""
+import os
+from importlib.util import find_spec
+
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILES = ('sqlite', 'sqlite-default', 'postgres')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def database_settings(profile, base_dir):
+    """The ``default`` entry of DATABASES for ``profile``"""
+    if profile == 'sqlite':
+        busy_timeout = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        return {
+            'ENGINE': 'weather_portal.sqlite3',
+            'NAME': base_dir / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'OPTIONS': {
+                'timeout': busy_timeout / 1000,
+                'pragmas': dict(SQLITE_PRAGMAS, busy_timeout=busy_timeout),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    if profile == 'sqlite-default':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': base_dir / 'db.sqlite3',
+        }
+    if profile == 'postgres':
+        if find_spec('psycopg') is None and find_spec('psycopg2') is None:
+            raise ImproperlyConfigured('DB_PROFILE=postgres needs a PostgreSQL driver: pip install "psycopg[binary]"')
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'weather_portal'),
+            'USER': os.getenv('POSTGRES_USER', 'weather_portal'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': int(os.getenv('POSTGRES_CONNECT_TIMEOUT', '5'))},
+        }
+    raise ValueError(f'DB_PROFILE must be one of {", ".join(PROFILES)}, not {profile!r}')
+
+
+def sqlite_pragma_values(connection):
+    """Current value of each tuned PRAGMA on ``connection``, for reports"""
+    with connection.cursor() as cursor:
+        values = {}
+        for name in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            # In-memory databases report nothing for mmap_size
+            values[name] = row[0] if row else None
+    return values
@@ -3,6 +3,8 @@ from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
 
+from weather_portal.database import database_settings
+
 # --- Base Directory ---
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -28,14 +30,14 @@ INSTALLED_APPS = [
 
     # Local apps
     'authentication',
-    'weather',
+    'weather.WeatherConfig',
 ]
 
 # --- Middleware ---
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'weather_portal.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,11 +68,11 @@ TEMPLATES = [
 ]
 
 # --- Database ---
+# DB_PROFILE: sqlite (WAL and tuned PRAGMAs), sqlite-default (untuned) or postgres (POSTGRES_* variables);
+# see weather_portal/database.py
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(DB_PROFILE, BASE_DIR),
 }
 
 # --- Password Validation ---
@@ -100,10 +102,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'authentication.User'
 
 # --- Django REST Framework ---
+# JWT_STATELESS_AUTH builds request.user from the token claims instead of loading the User row on every request;
+# is_active is still checked, at most every JWT_ACTIVE_CHECK_TTL seconds per user and worker
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'False').lower() in ('true', '1', 't')
+JWT_ACTIVE_CHECK_TTL = int(os.getenv('JWT_ACTIVE_CHECK_TTL', '30'))
+# Verified access tokens kept per worker (0 disables); blacklisted token ids are re-read every
+# JWT_BLACKLIST_REFRESH_SECONDS, so a logout reaches other workers within that time
+JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_TOKEN_CACHE_SIZE', '10000'))
+JWT_BLACKLIST_REFRESH_SECONDS = int(os.getenv('JWT_BLACKLIST_REFRESH_SECONDS', '30'))
+# Throttle scopes are URL names (per user, or per IP when anonymous) and `<URL name>_ip` (per client IP);
+# endpoints without a rate are not throttled
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'authentication.authentication.StatelessJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'authentication.authentication.CachedJWTAuthentication'
+    ],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'weather_portal.throttling.SlidingWindowRateThrottle',
+        'weather_portal.throttling.IPSlidingWindowRateThrottle',
+    ],
+    # Proxies in front of the app that append to X-Forwarded-For (1 behind Render or a single load balancer).
+    # Per-IP limits use the address that many hops back; with 0 they use REMOTE_ADDR and ignore the header,
+    # which a client could otherwise fill with any address it likes
+    'NUM_PROXIES': int(os.getenv('API_NUM_PROXIES', '0')),
+    'DEFAULT_THROTTLE_RATES': {
+        'get_weather': '60/min',
+        'get_weather_ip': '300/min',
+        'async_get_weather': '60/min',
+        'async_get_weather_ip': '300/min',
+        'batch_weather': '10/min',
+        'async_batch_weather': '10/min',
+        'advanced_search': '30/min',
+        'async_advanced_search': '30/min',
+        'search_suggestions': '120/min',
+        'search_suggestions_ip': '600/min',
+        'export_weather_history': '5/min',
+        'token_obtain_pair': '10/min',
+        'token_refresh': '30/min',
+        'register': '5/min',
+    },
 }
+# CACHES alias holding the throttle counters; point it at a shared cache to limit clients across workers
+API_THROTTLE_CACHE = os.getenv('API_THROTTLE_CACHE', 'default')
 
 # --- JWT Configuration ---
 SIMPLE_JWT = {
@@ -128,9 +169,149 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8000",
 ]
 CORS_ALLOW_CREDENTIALS = True
+# Response headers browser clients may read: history paging and partial favorites results
+CORS_EXPOSE_HEADERS = ['Link', 'X-Partial-Results', 'X-City-Status']
 
 # --- OpenWeatherMap API Key ---
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', 'your-openweather-api-key-here')
+OPENWEATHER_API_URL = os.getenv('OPENWEATHER_API_URL', 'https://api.openweathermap.org/data/2.5')
+
+# --- Weather Upstream Client ---
+WEATHER_UPSTREAM = {
+    'CONNECT_TIMEOUT': float(os.getenv('WEATHER_UPSTREAM_CONNECT_TIMEOUT', '3.05')),
+    'READ_TIMEOUT': float(os.getenv('WEATHER_UPSTREAM_READ_TIMEOUT', '10')),
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': int(os.getenv('WEATHER_UPSTREAM_POOL_MAXSIZE', '32')),
+    'RETRIES': int(os.getenv('WEATHER_UPSTREAM_RETRIES', '2')),
+    'BACKOFF_FACTOR': 0.3,
+}
+
+# --- Weather Cache ---
+# BACKEND names an entry in CACHES used as a shared tier between workers (empty = in-process only)
+WEATHER_CACHE = {
+    'MAX_ENTRIES': int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '1024')),
+    'TTL': int(os.getenv('WEATHER_CACHE_TTL', '600')),
+    'STALE_TTL': int(os.getenv('WEATHER_CACHE_STALE_TTL', '1800')),
+    'BACKEND': os.getenv('WEATHER_CACHE_BACKEND', ''),
+    # Failed lookups: "city not found" and upstream 5xx answers are replayed for these many seconds
+    'NOT_FOUND_TTL': int(os.getenv('WEATHER_CACHE_NOT_FOUND_TTL', '300')),
+    'ERROR_TTL': int(os.getenv('WEATHER_CACHE_ERROR_TTL', '15')),
+}
+
+# --- Upstream Request Coalescing ---
+# BACKEND names an entry in CACHES used to coalesce lookups across workers (empty = per-worker only)
+WEATHER_SINGLE_FLIGHT = {
+    'BACKEND': os.getenv('WEATHER_SINGLE_FLIGHT_BACKEND', ''),
+    'LOCK_TIMEOUT': int(os.getenv('WEATHER_SINGLE_FLIGHT_LOCK_TIMEOUT', '15')),
+}
+
+# --- Upstream Circuit Breaker ---
+# Opens when, over WINDOW seconds with at least MIN_CALLS calls, FAILURE_RATE of calls fail or SLOW_RATE
+# take longer than SLOW_CALL_MS; lookups then fail fast (or serve stale cache entries) for OPEN_SECONDS
+WEATHER_CIRCUIT_BREAKER = {
+    'WINDOW': 30,
+    'MIN_CALLS': int(os.getenv('WEATHER_BREAKER_MIN_CALLS', '20')),
+    'FAILURE_RATE': float(os.getenv('WEATHER_BREAKER_FAILURE_RATE', '0.5')),
+    'SLOW_CALL_MS': int(os.getenv('WEATHER_BREAKER_SLOW_CALL_MS', '3000')),
+    'SLOW_RATE': float(os.getenv('WEATHER_BREAKER_SLOW_RATE', '0.8')),
+    'OPEN_SECONDS': int(os.getenv('WEATHER_BREAKER_OPEN_SECONDS', '30')),
+    'HALF_OPEN_CALLS': 3,
+}
+
+# --- Upstream Concurrency Limit ---
+# AIMD limit on concurrent upstream calls per worker: grows while calls are fast, shrinks on errors or
+# calls slower than LATENCY_MS; calls beyond the limit fail fast
+WEATHER_CONCURRENCY_LIMIT = {
+    'INITIAL': int(os.getenv('WEATHER_LIMIT_INITIAL', '20')),
+    'MIN': 2,
+    'MAX': int(os.getenv('WEATHER_LIMIT_MAX', '200')),
+    'LATENCY_MS': int(os.getenv('WEATHER_LIMIT_LATENCY_MS', '2000')),
+    'BACKOFF': 0.9,
+    # How long a lookup waits for a free slot before it is answered with 503
+    'QUEUE_MS': int(os.getenv('WEATHER_LIMIT_QUEUE_MS', '100')),
+}
+
+# --- Upstream Call Quota ---
+# Calls allowed by the OpenWeatherMap plan (0 = no limit). Batch lookups and the cache warmer leave the
+# RESERVES share of each limit to interactive lookups. Lookups over budget, interactive ones included, are
+# served from the cache or answered 503; raise PER_MINUTE to match the plan before taking real traffic.
+# BACKEND names an entry in CACHES that enforces the limits across workers (empty = per-worker buckets)
+WEATHER_QUOTA = {
+    'PER_MINUTE': int(os.getenv('WEATHER_QUOTA_PER_MINUTE', '60')),
+    'PER_DAY': int(os.getenv('WEATHER_QUOTA_PER_DAY', '0')),
+    'RESERVES': {'interactive': 0, 'batch': 0.2, 'warmer': 0.5},
+    'BACKEND': os.getenv('WEATHER_QUOTA_BACKEND', ''),
+}
+
+# --- Concurrent Fan-out (favorites search) ---
+WEATHER_FANOUT = {
+    'MAX_WORKERS': int(os.getenv('WEATHER_FANOUT_MAX_WORKERS', '16')),
+    'DEADLINE': float(os.getenv('WEATHER_FANOUT_DEADLINE', '5')),
+    # Jobs one request may have on the shared pool at once
+    'MAX_IN_FLIGHT': int(os.getenv('WEATHER_FANOUT_MAX_IN_FLIGHT', '4')),
+}
+
+# --- Batch Lookups ---
+WEATHER_BATCH = {
+    'MAX_CITIES': int(os.getenv('WEATHER_BATCH_MAX_CITIES', '20')),
+}
+
+# --- Search History Write-behind ---
+# OVERFLOW: block | drop_oldest | sync (what to do when MAX_QUEUE rows are already pending)
+WEATHER_RECORDER = {
+    'WRITE_BEHIND': os.getenv('WEATHER_WRITE_BEHIND', 'True').lower() in ('true', '1', 't'),
+    'MAX_QUEUE': int(os.getenv('WEATHER_RECORDER_MAX_QUEUE', '10000')),
+    'BATCH_SIZE': int(os.getenv('WEATHER_RECORDER_BATCH_SIZE', '200')),
+    'FLUSH_INTERVAL_MS': int(os.getenv('WEATHER_RECORDER_FLUSH_INTERVAL_MS', '500')),
+    'OVERFLOW': os.getenv('WEATHER_RECORDER_OVERFLOW', 'sync'),
+    'BLOCK_TIMEOUT_MS': 1000,
+}
+
+# --- Search Analytics ---
+# Per-user analytics payloads are cached in CACHE and dropped whenever the user records a search
+WEATHER_ANALYTICS = {
+    'CACHE': os.getenv('WEATHER_ANALYTICS_CACHE', 'default'),
+    'TTL': int(os.getenv('WEATHER_ANALYTICS_TTL', '300')),
+}
+
+# --- Search History Retention ---
+# `manage.py prune_search_history` folds searches older than DAYS into daily per-city summaries and deletes
+# them, BATCH_SIZE rows per transaction, writing them to gzipped NDJSON files in ARCHIVE_DIR first when set
+WEATHER_RETENTION = {
+    'DAYS': int(os.getenv('WEATHER_RETENTION_DAYS', '90')),
+    'BATCH_SIZE': int(os.getenv('WEATHER_RETENTION_BATCH_SIZE', '1000')),
+    'ARCHIVE_DIR': os.getenv('WEATHER_RETENTION_ARCHIVE_DIR', ''),
+}
+
+# --- Search Suggestions ---
+# BACKEND: memory (per-worker prefix index) | table (query CityPopularity directly)
+# REFRESH_SECONDS reloads each worker's index so it sees other workers' searches (0 = never)
+WEATHER_SUGGESTIONS = {
+    'BACKEND': os.getenv('WEATHER_SUGGESTIONS_BACKEND', 'memory'),
+    'REFRESH_SECONDS': int(os.getenv('WEATHER_SUGGESTIONS_REFRESH_SECONDS', '0')),
+    'LIMIT': 5,
+}
+
+# --- City Gazetteer ---
+# Built by `manage.py load_gazetteer`; suggestions and city validation are skipped while PATH does not exist
+WEATHER_GAZETTEER = {
+    'PATH': os.getenv('WEATHER_GAZETTEER_PATH', str(BASE_DIR / 'data' / 'gazetteer.tsv.gz')),
+    'MAX_DISTANCE': int(os.getenv('WEATHER_GAZETTEER_MAX_DISTANCE', '2')),
+    'VALIDATE': os.getenv('WEATHER_GAZETTEER_VALIDATE', 'True').lower() in ('true', '1', 't'),
+}
+
+# --- Weather Cache Warmer ---
+# Refreshes favorite cities and the TOP_K cities searched over the last DAYS before their cache entries
+# expire (within REFRESH_AHEAD seconds). Run `manage.py warm_weather_cache` next to a shared cache BACKEND,
+# or set ENABLED to warm on a background thread in every web worker
+WEATHER_WARMER = {
+    'ENABLED': os.getenv('WEATHER_WARMER_ENABLED', 'False').lower() in ('true', '1', 't'),
+    'INTERVAL': int(os.getenv('WEATHER_WARMER_INTERVAL', '60')),
+    'TOP_K': int(os.getenv('WEATHER_WARMER_TOP_K', '50')),
+    'DAYS': 7,
+    'MAX_CALLS_PER_MINUTE': int(os.getenv('WEATHER_WARMER_MAX_CALLS_PER_MINUTE', '30')),
+    'REFRESH_AHEAD': int(os.getenv('WEATHER_WARMER_REFRESH_AHEAD', '120')),
+}
 
 # --- Login / Logout Redirects ---
 LOGIN_URL = '/login/'
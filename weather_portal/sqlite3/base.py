@@ -0,0 +1,32 @@
+"""
+SQLite backend applying per-connection PRAGMAs and a configurable BEGIN.
+
+Besides the ``sqlite3.connect()`` arguments, OPTIONS accepts:
+
+``pragmas``
+    ``{name: value}`` run as ``PRAGMA name = value`` on every new connection.
+``transaction_mode``
+    ``'IMMEDIATE'`` takes the write lock when a transaction starts. With the
+    default deferred BEGIN, a transaction that reads before writing cannot
+    wait for another writer and fails at once with "database is locked".
+    Django 5.1 supports this option itself.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
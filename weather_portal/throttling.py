@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Per-endpoint rate limit keyed on the user (or the client IP when anonymous).
+
+    The scope is the endpoint's URL name, so rates are configured per endpoint
+    in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] (e.g. ``'get_weather': '60/min'``);
+    endpoints without a rate are not throttled.
+
+    Instead of the per-client list of timestamps SimpleRateThrottle keeps, this
+    holds one counter per fixed window and weights the previous window's
+    count by how much of it still overlaps the sliding window. A request costs
+    one ``get_many`` and one ``add``/``incr`` whatever the rate. Counters live in
+    the cache named by API_THROTTLE_CACHE, which must be shared to limit
+    clients across workers.
+    """
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        # The scope (and so the rate) depends on the request; see allow_request()
+        self._wait = None
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'API_THROTTLE_CACHE', 'default')]
+
+    def get_scope(self, url_name):
+        return url_name
+
+    def get_cache_key(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            ident = user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        match = getattr(request, 'resolver_match', None)
+        self.scope = self.get_scope(match.url_name) if match is not None and match.url_name else None
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, elapsed = divmod(self.timer(), self.duration)
+        current_key, previous_key = f'{self.key}:{int(window)}', f'{self.key}:{int(window) - 1}'
+        cache = self.cache
+        counts = cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        if previous * (1 - elapsed / self.duration) + current >= self.num_requests:
+            self._wait = self._seconds_until_allowed(current, previous, elapsed)
+            return self.throttle_failure()
+
+        if not cache.add(current_key, 1, timeout=self.duration * 2):
+            try:
+                cache.incr(current_key)
+            except ValueError:
+                # Expired between add() and incr()
+                cache.add(current_key, 1, timeout=self.duration * 2)
+        return True
+
+    def _seconds_until_allowed(self, current, previous, elapsed):
+        if current >= self.num_requests or not previous:
+            # Only the next window helps
+            return self.duration - elapsed
+        # The previous window's weight has to fall until one more request fits
+        allowed_at = self.duration * (1 - (self.num_requests - current) / previous)
+        return max(allowed_at - elapsed, 1)
+
+    def wait(self):
+        return self._wait
+
+
+class IPSlidingWindowRateThrottle(SlidingWindowRateThrottle):
+    """
+    Per-endpoint rate limit keyed on the client IP, whoever is authenticated.
+
+    Configured with the ``<url name>_ip`` scope, e.g. ``'get_weather_ip': '300/min'``,
+    so one address cannot get around the per-user limit with several accounts.
+    """
+
+    def get_scope(self, url_name):
+        return f'{url_name}_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}